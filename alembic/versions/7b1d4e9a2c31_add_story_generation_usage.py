@@ -0,0 +1,43 @@
+"""add story generation usage
+
+Revision ID: 7b1d4e9a2c31
+Revises: 3ea74b4c5644
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1d4e9a2c31'
+down_revision: Union[str, Sequence[str], None] = '3ea74b4c5644'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stories', sa.Column('model', sa.String(), nullable=True))
+    op.add_column('stories', sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+    op.add_column('stories', sa.Column('completion_tokens', sa.Integer(), nullable=True))
+    op.add_column('stories', sa.Column('cached_tokens', sa.Integer(), nullable=True))
+    op.add_column('stories', sa.Column('ttft_ms', sa.Integer(), nullable=True))
+    op.add_column('stories', sa.Column('generation_ms', sa.Integer(), nullable=True))
+    op.create_index(
+        'ix_stories_usage', 'stories', ['created_at', 'language', 'story_length'], unique=False,
+        postgresql_include=['prompt_tokens', 'completion_tokens', 'cached_tokens', 'ttft_ms', 'generation_ms']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stories_usage', table_name='stories')
+    op.drop_column('stories', 'generation_ms')
+    op.drop_column('stories', 'ttft_ms')
+    op.drop_column('stories', 'cached_tokens')
+    op.drop_column('stories', 'completion_tokens')
+    op.drop_column('stories', 'prompt_tokens')
+    op.drop_column('stories', 'model')
@@ -0,0 +1,48 @@
+"""add deferred story jobs table
+
+Revision ID: c9e5b3f0a812
+Revises: a4f2c8e61d07
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e5b3f0a812'
+down_revision: Union[str, Sequence[str], None] = 'a4f2c8e61d07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('deferred_story_jobs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('request', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('batch_id', sa.String(), nullable=True),
+    sa.Column('story_id', sa.UUID(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('submitted_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['story_id'], ['stories.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_deferred_jobs_batch_id', 'deferred_story_jobs', ['batch_id'], unique=False)
+    op.create_index('ix_deferred_jobs_status_created', 'deferred_story_jobs', ['status', 'created_at'], unique=False)
+    op.create_index('ix_deferred_jobs_user_created', 'deferred_story_jobs', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_deferred_jobs_user_created', table_name='deferred_story_jobs')
+    op.drop_index('ix_deferred_jobs_status_created', table_name='deferred_story_jobs')
+    op.drop_index('ix_deferred_jobs_batch_id', table_name='deferred_story_jobs')
+    op.drop_table('deferred_story_jobs')
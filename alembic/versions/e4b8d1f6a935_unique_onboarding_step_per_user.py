@@ -0,0 +1,38 @@
+"""unique onboarding step per user
+
+Revision ID: e4b8d1f6a935
+Revises: c9e5b3f0a812
+Create Date: 2026-10-16 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8d1f6a935'
+down_revision: Union[str, Sequence[str], None] = 'c9e5b3f0a812'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keep the earliest row of each (user, step) pair left by the old check-then-insert path
+    op.execute(sa.text(
+        "DELETE FROM user_onboarding_progress AS later "
+        "USING user_onboarding_progress AS earlier "
+        "WHERE later.user_id = earlier.user_id "
+        "AND later.step_name = earlier.step_name "
+        "AND (later.completed_at, later.id) > (earlier.completed_at, earlier.id)"
+    ))
+    op.drop_index('ix_onboarding_user_step', table_name='user_onboarding_progress')
+    op.create_index('ix_onboarding_user_step', 'user_onboarding_progress', ['user_id', 'step_name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_onboarding_user_step', table_name='user_onboarding_progress')
+    op.create_index('ix_onboarding_user_step', 'user_onboarding_progress', ['user_id', 'step_name'], unique=False)
@@ -1,11 +1,11 @@
 import logging
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from app.db.db_sessions import get_db
 from app.crud.user import user_crud
 from app.crud.story import story_crud
 from app.crud.hero import hero_crud
-from app.schemas.response import UsersListResponse, StoriesListResponse, HeroesListResponse
+from app.schemas.response import UsersListResponse, StoriesListResponse, StoryUsageResponse, HeroesListResponse
 from app.core.responses import response
 from app.services.authentication import get_user_id_from_token
 from uuid import UUID
@@ -49,6 +49,25 @@ async def get_all_stories(
     )
 
 
+@router.get("/stories/usage/", response_model=StoryUsageResponse)
+async def get_stories_usage(
+    days: int = Query(30, ge=1, le=366, description="Number of days to aggregate"),
+    user_id: UUID = Depends(get_user_id_from_token),
+    db: Session = Depends(get_db)
+):
+    """Token usage and generation time per day, language and story length (authenticated admin only)"""
+    result = story_crud.get_usage_for_admin(db, days)
+    
+    return response(
+        message=result["message"],
+        data=result.get("data"),
+        status_code=result.get("status_code", 200),
+        success=result["success"],
+        errors=result.get("errors"),
+        error_code=result.get("error_code")
+    )
+
+
 @router.get("/heroes/", response_model=HeroesListResponse)
 async def get_all_heroes(
     user_id: UUID = Depends(get_user_id_from_token),
@@ -4,7 +4,16 @@ from fastapi import APIRouter, Depends
 from app.core.responses import response
 from app.schemas.response import BaseResponse
 from app.services.openai_health import openai_health_service
-from app.services.authentication import get_user_id_from_token
+from app.services.llm_scheduler import llm_scheduler
+from app.services.llm_resilience import resilient_llm
+from app.services.story_generation import story_generation_service
+from app.services.generation_quota import generation_quota_service
+from app.services.story_result_cache import story_result_cache
+from app.services.story_pool import story_pool
+from app.services.deferred_generation import deferred_story_service
+from app.services.user_identity_cache import user_identity_cache
+from app.services.authentication import auth_service, get_user_id_from_token
+from app.services.apple_key_store import apple_key_store
 from uuid import UUID
 
 router = APIRouter(prefix="/health", tags=["health"])
@@ -65,3 +74,93 @@ async def openai_quick_check(user_id: UUID = Depends(get_user_id_from_token)):
                 "timestamp": __import__('time').time()
             }
         )
+
+
+@router.get("/openai/scheduler/", response_model=BaseResponse)
+async def openai_scheduler_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """OpenAI RPM/TPM scheduler queue depth and wait times (authenticated)"""
+    return response(
+        message="OpenAI scheduler stats",
+        data=llm_scheduler.stats()
+    )
+
+
+@router.get("/openai/resilience/", response_model=BaseResponse)
+async def openai_resilience_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """LLM retry/hedging/circuit breaker outcome counters (authenticated)"""
+    return response(
+        message="OpenAI resilience stats",
+        data=resilient_llm.stats()
+    )
+
+
+@router.get("/openai/prompt-cache/", response_model=BaseResponse)
+async def openai_prompt_cache_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """OpenAI prompt cache hit ratio and TTFT gain for story generations (authenticated)"""
+    return response(
+        message="OpenAI prompt cache stats",
+        data=story_generation_service.prompt_cache_stats()
+    )
+
+
+@router.get("/quota/", response_model=BaseResponse)
+async def quota_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """Story generations granted and rejected by the per-user quota (authenticated)"""
+    return response(
+        message="Generation quota stats",
+        data=generation_quota_service.stats()
+    )
+
+
+@router.get("/story-result-cache/", response_model=BaseResponse)
+async def story_result_cache_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """Hits, misses and evictions of the story result cache (authenticated)"""
+    return response(
+        message="Story result cache stats",
+        data=story_result_cache.stats()
+    )
+
+
+@router.get("/story-pool/", response_model=BaseResponse)
+async def story_pool_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """Pre-generated first stories available, served and generated (authenticated)"""
+    return response(
+        message="Story pool stats",
+        data=story_pool.stats()
+    )
+
+
+@router.get("/deferred-generation/", response_model=BaseResponse)
+async def deferred_generation_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """Deferred story batches submitted and collected by this instance (authenticated)"""
+    return response(
+        message="Deferred generation stats",
+        data=deferred_story_service.stats()
+    )
+
+
+@router.get("/user-cache/", response_model=BaseResponse)
+async def user_cache_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """Hit ratio of the authenticated user lookup cache (authenticated)"""
+    return response(
+        message="User cache stats",
+        data=user_identity_cache.stats()
+    )
+
+
+@router.get("/token-cache/", response_model=BaseResponse)
+async def token_cache_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """Hit ratio of the verified JWT cache (authenticated)"""
+    return response(
+        message="Token cache stats",
+        data=auth_service.token_cache_stats()
+    )
+
+
+@router.get("/apple-keys/", response_model=BaseResponse)
+async def apple_keys_stats(user_id: UUID = Depends(get_user_id_from_token)):
+    """Apple Sign In public keys held in memory and their refreshes (authenticated)"""
+    return response(
+        message="Apple keys stats",
+        data=apple_key_store.stats()
+    )
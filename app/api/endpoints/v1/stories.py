@@ -1,29 +1,45 @@
 import logging
-import json
+from contextlib import aclosing
+from typing import AsyncGenerator, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.responses import response
-from app.db.db_sessions import get_db
-from app.schemas.story import StoryGenerateWithHeroesRequest
+from app.core.configs import settings
+from app.core.error_codes import QUOTA_EXCEEDED, RESOURCE_NOT_FOUND, SERVICE_UNAVAILABLE
+from app.db.db_sessions import get_db, get_db_scope
+from app.db.async_db_sessions import get_async_db
+from app.schemas.story import StoryBatchGenerateRequest, StoryGenerateWithHeroesRequest, StoryJobOut, StoryVariantChoice
 from app.schemas.response import StoriesListResponse, BaseResponse
-from app.services.authentication import get_current_user
+from app.services.authentication import get_current_user_async, get_current_user_stream, get_user_id_from_token
 from app.crud.story import story_crud
+from app.crud.async_story import async_story_crud
+from app.crud.deferred_story_job import deferred_story_job_crud
+from app.services.story_singleflight import StreamEvent, story_single_flight
+from app.services.sse import DisconnectWatcher, sse_coalescer, sse_encoder
 from app.db.models.user import User
 
 router = APIRouter(prefix="/stories", tags=["stories"])
 
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # Disable nginx buffering
+}
+
 
 @router.get("/", response_model=StoriesListResponse)
 async def get_user_stories(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all stories for current user"""
     try:
-        stories = story_crud.get_user_stories(db, current_user.id)
+        stories = await async_story_crud.get_user_stories(db, current_user.id)
         stories_data = [story_crud.convert_to_list_item(story).model_dump(mode='json') for story in stories]
         
         return response(
@@ -44,12 +60,12 @@ async def get_user_stories(
 @router.get("/{story_id}/")
 async def get_story_by_id(
     story_id: UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get specific story by ID"""
     
-    story = story_crud.get_by_id(db, story_id, current_user.id)
+    story = await async_story_crud.get_by_id(db, story_id, current_user.id)
     if not story:
         return response(
             message="Story not found",
@@ -70,12 +86,12 @@ async def get_story_by_id(
 @router.delete("/{story_id}/", response_model=BaseResponse)
 async def delete_story(
     story_id: UUID,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete story (soft delete)"""
     try:
-        success = story_crud.delete(db, story_id, current_user.id)
+        success = await async_story_crud.delete(db, story_id, current_user.id)
         
         if not success:
             return response(
@@ -102,18 +118,19 @@ async def delete_story(
 async def generate_story_with_heroes_stream(
     story_data: StoryGenerateWithHeroesRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_stream),
+    db_scope=Depends(get_db_scope),
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID")
 ):
     """Generate a new fairy tale story with multiple heroes using streaming response"""
     logging.info(f"Starting heroes streaming endpoint for user: {current_user.id}")
-    logging.info(f"Raw request type: {type(story_data)}")
-    logging.info(f"Request data: {story_data}")
     logging.info(f"Story name: {story_data.story_name}, heroes count: {len(story_data.heroes)}")
     
     # Log each hero
-    for i, hero in enumerate(story_data.heroes):
-        logging.info(f"Hero {i+1}: {hero.name} (ID: {hero.id})")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Request data: {story_data}")
+        for i, hero in enumerate(story_data.heroes):
+            logging.debug(f"Hero {i+1}: {hero.name} (ID: {hero.id})")
     
     async def story_heroes_stream_generator():
         # Check if client disconnected
@@ -121,15 +138,26 @@ async def generate_story_with_heroes_stream(
             logging.info(f"Client disconnected before starting heroes streaming for user: {current_user.id}")
             return
         
-        logging.info(f"Starting stream generator for heroes story...")
+        logging.info("Starting stream generator for heroes story...")
+
+        def produce(generation_id):
+            if story_data.variants > 1:
+                return story_crud.generate_story_variants_stream(story_data, current_user.id)
+            return story_crud.generate_story_with_heroes_stream(
+                db_scope, story_data, current_user.id, story_id=generation_id
+            )
         
         try:
-            # Use story CRUD for streaming generation
-            async for message in story_crud.generate_story_with_heroes_stream(db, story_data, current_user.id):
-                if await request.is_disconnected():
-                    logging.info(f"Client disconnected during heroes streaming for user: {current_user.id}")
-                    return
-                yield f"data: {json.dumps(message)}\n\n"
+            # Identical in-flight requests (client retries) share one generation
+            messages = story_single_flight.subscribe(
+                story_data,
+                current_user.id,
+                produce,
+                last_event_id=last_event_id
+            )
+            async with aclosing(_stream_frames(request, messages)) as frames:
+                async for frame in frames:
+                    yield frame
                 
         except Exception as e:
             logging.error(f"Error in heroes streaming generation for user {current_user.id}: {str(e)}")
@@ -140,16 +168,211 @@ async def generate_story_with_heroes_stream(
                 "type": "error",
                 "message": f"Heroes generation failed: {str(e)}"
             }
-            yield f"data: {json.dumps(error_message)}\n\n"
+            yield sse_encoder.message(error_message)
     
     # Return streaming response
-    logging.info(f"Returning StreamingResponse for heroes story...")
+    logging.info("Returning StreamingResponse for heroes story...")
     return StreamingResponse(
         story_heroes_stream_generator(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # Disable nginx buffering
-        }
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.post("/generate-batch-stream/")
+async def generate_story_batch_stream(
+    batch: StoryBatchGenerateRequest,
+    request: Request,
+    current_user: User = Depends(get_current_user_stream),
+    db_scope=Depends(get_db_scope)
+):
+    """Generate several stories concurrently, with the progress of all of them in one streaming response"""
+    logging.info(f"Starting batch streaming endpoint for user: {current_user.id} ({len(batch.items)} stories)")
+
+    async def story_batch_stream_generator():
+        try:
+            messages = story_crud.generate_story_batch_stream(db_scope, batch, current_user.id)
+            async with aclosing(_stream_frames(request, _without_event_ids(messages))) as frames:
+                async for frame in frames:
+                    yield frame
+        except Exception as e:
+            logging.error(f"Error in batch streaming generation for user {current_user.id}: {str(e)}")
+            yield sse_encoder.message({
+                "type": "error",
+                "message": f"Batch generation failed: {str(e)}"
+            })
+
+    return StreamingResponse(
+        story_batch_stream_generator(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.post("/variants/{selection_id}/choose/", response_model=BaseResponse)
+async def choose_story_variant(
+    selection_id: UUID,
+    choice: StoryVariantChoice,
+    user_id: UUID = Depends(get_user_id_from_token),
+    db_scope=Depends(get_db_scope)
+):
+    """Save the chosen variant of a multi-variant generation; the other variants are dropped"""
+    try:
+        story_id = await run_in_threadpool(
+            story_crud.choose_story_variant, db_scope, selection_id, choice.variant, user_id
+        )
+    except Exception as e:
+        logging.error(f"Error saving story variant {choice.variant} of {selection_id} for user {user_id}: {str(e)}")
+        return response(
+            message="Failed to save story variant",
+            status_code=500,
+            success=False
+        )
+
+    if story_id is None:
+        return response(
+            message="Story variant not found",
+            status_code=404,
+            success=False,
+            error_code=RESOURCE_NOT_FOUND
+        )
+
+    return response(
+        message="Story variant saved successfully",
+        data={"story_id": str(story_id)},
+        status_code=201,
+        success=True
+    )
+
+
+@router.post("/deferred/", response_model=BaseResponse)
+async def queue_deferred_story(
+    story_data: StoryGenerateWithHeroesRequest,
+    user_id: UUID = Depends(get_user_id_from_token),
+    db: Session = Depends(get_db)
+):
+    """Queue a story for off-peak batch generation; poll the returned job for the story id"""
+    config = settings.deferred_generation
+    if not config.ENABLED:
+        return response(
+            message="Deferred story generation is disabled",
+            status_code=503,
+            success=False,
+            error_code=SERVICE_UNAVAILABLE
+        )
+
+    if 0 < config.MAX_PENDING_PER_USER <= deferred_story_job_crud.count_pending(db, user_id):
+        return response(
+            message=f"No more than {config.MAX_PENDING_PER_USER} deferred stories can wait at the same time",
+            status_code=429,
+            success=False,
+            error_code=QUOTA_EXCEEDED
+        )
+
+    job = deferred_story_job_crud.create(db, story_data, user_id)
+    logging.info(f"Queued deferred story job {job.id} for user: {user_id}")
+    return response(
+        message="Story queued for deferred generation",
+        data={"job": deferred_story_job_crud.convert_to_out(job).model_dump(mode='json')},
+        status_code=202,
+        success=True
+    )
+
+
+@router.get("/deferred/{job_id}/", response_model=BaseResponse)
+async def get_deferred_story_job(
+    job_id: UUID,
+    user_id: UUID = Depends(get_user_id_from_token),
+    db: Session = Depends(get_db)
+):
+    """Poll a deferred story generation"""
+    job = deferred_story_job_crud.get_by_id(db, job_id, user_id)
+    if not job:
+        return response(
+            message="Deferred story job not found",
+            status_code=404,
+            success=False,
+            error_code=RESOURCE_NOT_FOUND
+        )
+
+    return response(
+        message="Deferred story job retrieved successfully",
+        data={"job": deferred_story_job_crud.convert_to_out(job).model_dump(mode='json')},
+        status_code=200,
+        success=True
+    )
+
+
+@router.get("/jobs/{job_id}/", response_model=BaseResponse)
+async def get_story_job(
+    job_id: UUID,
+    user_id: UUID = Depends(get_user_id_from_token),
+    db_scope=Depends(get_db_scope)
+):
+    """Poll a detached story generation"""
+    flight = story_single_flight.get_job(job_id, user_id)
+    if flight:
+        job = StoryJobOut(**flight.snapshot())
+    else:
+        # Expired here, or run by another instance: a finished job's story is saved under its ID
+        job = await run_in_threadpool(story_crud.get_saved_job, db_scope, job_id, user_id)
+    if not job:
+        return response(
+            message="Story job not found",
+            status_code=404,
+            success=False,
+            error_code=RESOURCE_NOT_FOUND
+        )
+
+    return response(
+        message="Story job retrieved successfully",
+        data={"job": job.model_dump(mode='json')},
+        status_code=200,
+        success=True
+    )
+
+
+@router.get("/jobs/{job_id}/stream/")
+async def stream_story_job(
+    job_id: UUID,
+    request: Request,
+    user_id: UUID = Depends(get_user_id_from_token),
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID")
+):
+    """Re-stream a detached story generation: everything produced so far (or after Last-Event-ID), then live output"""
+    flight = story_single_flight.get_job(job_id, user_id)
+    if not flight:
+        return response(
+            message="Story job not found",
+            status_code=404,
+            success=False,
+            error_code=RESOURCE_NOT_FOUND
+        )
+
+    logging.info(f"Re-streaming story job {job_id} for user: {user_id} ({flight.status})")
+    after_seq = story_single_flight.resolve_job_event_id(job_id, user_id, last_event_id)
+    return StreamingResponse(
+        _stream_frames(request, flight.follow(after_seq)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
     )
+
+
+async def _without_event_ids(messages: AsyncGenerator[dict, None]) -> AsyncGenerator[StreamEvent, None]:
+    """Stream events for messages that are not kept in a resumable log"""
+    async with aclosing(messages):
+        async for message in messages:
+            yield None, message
+
+
+async def _stream_frames(request: Request, events: AsyncGenerator[StreamEvent, None]) -> AsyncGenerator[bytes, None]:
+    """SSE frames for `events`, stopping as soon as the client disconnects"""
+    # Tiny content deltas are merged into fewer, larger frames
+    frames = sse_coalescer.frames(events)
+    async with DisconnectWatcher(request) as watcher:
+        guarded = watcher.guard(frames)
+        async with aclosing(guarded), aclosing(frames):
+            async for frame in guarded:
+                yield frame
+        if watcher.disconnected.is_set():
+            logging.info(f"Client disconnected during story streaming: {request.url.path}")
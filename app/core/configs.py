@@ -5,6 +5,7 @@ load_dotenv()
 import logging
 import os
 from urllib.parse import quote_plus
+from typing import List
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
@@ -52,6 +53,10 @@ class DataBase(BaseModel):
     DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "3600"))
     DB_CONNECT_TIMEOUT: int = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
 
+    # Async (asyncpg) connection pool settings
+    DB_ASYNC_POOL_SIZE: int = int(os.getenv("DB_ASYNC_POOL_SIZE", "5"))
+    DB_ASYNC_MAX_OVERFLOW: int = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "5"))
+
     def get_db_url(self) -> str:
         # URL-encode password to handle special characters like @
         encoded_password = quote_plus(self.DB_PASS) if self.DB_PASS else ""
@@ -65,18 +70,148 @@ class DataBase(BaseModel):
         else:
             return f"postgresql+psycopg2://{encoded_user}:{encoded_password}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    def get_async_db_url(self) -> str:
+        # Same connection target as get_db_url, served by the asyncpg driver
+        encoded_password = quote_plus(self.DB_PASS) if self.DB_PASS else ""
+        encoded_user = quote_plus(self.DB_USER) if self.DB_USER else ""
+
+        if self.USE_CLOUD_SQL_PROXY:
+            return (
+                f"postgresql+asyncpg://{encoded_user}:{encoded_password}@/{self.DB_NAME}"
+                f"?host=/cloudsql/{self.INSTANCE_CONNECTION_NAME}"
+            )
+        else:
+            return (
+                f"postgresql+asyncpg://{encoded_user}:{encoded_password}"
+                f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+            )
+
 
 class JWTToken(BaseModel):
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
     ALGORITHM: str = "HS256"
+    # Already verified tokens (by digest), so repeat requests skip the signature check
+    VERIFIED_CACHE_ENABLED: bool = os.getenv("JWT_VERIFIED_CACHE_ENABLED", "true").lower() == "true"
+    VERIFIED_CACHE_MAX_ENTRIES: int = int(os.getenv("JWT_VERIFIED_CACHE_MAX_ENTRIES", "10000"))
 
 
 class OpenAI(BaseModel):
     API_KEY: str = os.getenv("OPENAI_API_KEY", "")
-    MODEL: str = "gpt-4o-mini"
+    MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     MAX_TOKENS: int = 1500
     TEMPERATURE: float = 0.7
 
+    # Rate-limit budget enforced by the LLM scheduler (per instance)
+    RPM_LIMIT: int = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+    TPM_LIMIT: int = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+    SCHEDULER_MAX_WAIT_SECONDS: float = float(os.getenv("OPENAI_SCHEDULER_MAX_WAIT_SECONDS", "60"))
+    CHARS_PER_TOKEN: float = float(os.getenv("OPENAI_CHARS_PER_TOKEN", "3.0"))  # conservative for non-English text
+
+
+class LLM(BaseModel):
+    # "openai" or "fake" (local deterministic stream for load tests, no network)
+    PROVIDER: str = os.getenv("LLM_PROVIDER", "openai").lower()
+    FAKE_TTFT_MS: int = int(os.getenv("LLM_FAKE_TTFT_MS", "400"))
+    FAKE_INTER_TOKEN_MS: int = int(os.getenv("LLM_FAKE_INTER_TOKEN_MS", "15"))
+    FAKE_FAILURE_RATE: float = float(os.getenv("LLM_FAKE_FAILURE_RATE", "0"))
+    FAKE_RATE_LIMIT_RATE: float = float(os.getenv("LLM_FAKE_RATE_LIMIT_RATE", "0"))
+    FAKE_SEED: int = int(os.getenv("LLM_FAKE_SEED", "42"))
+
+    # Retries before the first chunk (jittered exponential backoff)
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "2"))
+    RETRY_BACKOFF_BASE_MS: int = int(os.getenv("LLM_RETRY_BACKOFF_BASE_MS", "250"))
+    RETRY_BACKOFF_MAX_MS: int = int(os.getenv("LLM_RETRY_BACKOFF_MAX_MS", "4000"))
+    # Hedged second request when time-to-first-token exceeds this percentile of recent calls
+    HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_DELAY_MS: int = int(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "1500"))
+    HEDGE_INITIAL_DELAY_MS: int = int(os.getenv("LLM_HEDGE_INITIAL_DELAY_MS", "5000"))  # until enough samples exist
+    # Circuit breaker
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_OPEN_SECONDS: float = float(os.getenv("LLM_CIRCUIT_OPEN_SECONDS", "30"))
+
+
+class StoryStreaming(BaseModel):
+    # Attach identical in-flight generations of the same user to one upstream stream
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("STORY_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    # How long a generation keeps running after its last listener disconnected,
+    # so a client retry can still attach to it. The upstream call keeps streaming
+    # (and using tokens) for that long, so keep it close to the client's retry delay
+    SINGLE_FLIGHT_ORPHAN_GRACE_SECONDS: float = float(os.getenv("STORY_SINGLE_FLIGHT_ORPHAN_GRACE_SECONDS", "3"))
+    # Content deltas are coalesced into one SSE frame per this many bytes or milliseconds
+    SSE_FLUSH_BYTES: int = int(os.getenv("STORY_SSE_FLUSH_BYTES", "256"))
+    SSE_FLUSH_INTERVAL_MS: int = int(os.getenv("STORY_SSE_FLUSH_INTERVAL_MS", "40"))
+    # Per-generation event log for Last-Event-ID resume: size cap, and how long it is kept after completion
+    EVENT_LOG_MAX_EVENTS: int = int(os.getenv("STORY_EVENT_LOG_MAX_EVENTS", "5000"))
+    EVENT_LOG_RETENTION_SECONDS: float = float(os.getenv("STORY_EVENT_LOG_RETENTION_SECONDS", "30"))
+    # How long a finished detached generation can still be polled or re-streamed by job id
+    JOB_RETENTION_SECONDS: float = float(os.getenv("STORY_JOB_RETENTION_SECONDS", "600"))
+
+
+class StoryGeneration(BaseModel):
+    # Derive max_tokens from story_length and language instead of the flat OpenAI.MAX_TOKENS
+    BUDGET_ENABLED: bool = os.getenv("STORY_BUDGET_ENABLED", "true").lower() == "true"
+    BUDGET_HEADROOM: float = float(os.getenv("STORY_BUDGET_HEADROOM", "1.3"))  # margin over the upper word bound
+    BUDGET_MAX_TOKENS: int = int(os.getenv("STORY_BUDGET_MAX_TOKENS", "2048"))
+    # Stop streaming at the first sentence end once the upper word bound is reached
+    EARLY_STOP_ENABLED: bool = os.getenv("STORY_EARLY_STOP_ENABLED", "true").lower() == "true"
+    # Opt-in replay of finished stories for identical requests (any user, heroes compared by attributes)
+    RESULT_CACHE_ENABLED: bool = os.getenv("STORY_RESULT_CACHE_ENABLED", "false").lower() == "true"
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("STORY_RESULT_CACHE_MAX_ENTRIES", "256"))
+    RESULT_CACHE_TTL_SECONDS: int = int(os.getenv("STORY_RESULT_CACHE_TTL_SECONDS", "86400"))
+    RESULT_CACHE_REPLAY_CHUNK_CHARS: int = int(os.getenv("STORY_RESULT_CACHE_REPLAY_CHUNK_CHARS", "48"))
+    RESULT_CACHE_REPLAY_DELAY_MS: int = int(os.getenv("STORY_RESULT_CACHE_REPLAY_DELAY_MS", "15"))
+    # Items of one batch request generated at the same time (further capped by QUOTA_MAX_CONCURRENT)
+    BATCH_CONCURRENCY: int = int(os.getenv("STORY_BATCH_CONCURRENCY", "3"))
+    # How long the variants of a multi-variant generation wait for the user to choose one
+    VARIANTS_TTL_SECONDS: int = int(os.getenv("STORY_VARIANTS_TTL_SECONDS", "1800"))
+    VARIANTS_MAX_ENTRIES: int = int(os.getenv("STORY_VARIANTS_MAX_ENTRIES", "10000"))  # oldest dropped first when full
+
+
+class StoryPool(BaseModel):
+    # Pre-generated first stories for common onboarding requests, refilled in the background
+    ENABLED: bool = os.getenv("STORY_POOL_ENABLED", "false").lower() == "true"
+    TARGET_SIZE: int = int(os.getenv("STORY_POOL_TARGET_SIZE", "2"))  # stories per combination
+    REFILL_INTERVAL_SECONDS: int = int(os.getenv("STORY_POOL_REFILL_INTERVAL_SECONDS", "60"))
+    # Combinations kept in the pool: languages x styles x lengths x hero genders x hero age buckets
+    LANGUAGES: List[str] = os.getenv("STORY_POOL_LANGUAGES", "en,ru").split(",")
+    STYLES: List[str] = os.getenv("STORY_POOL_STYLES", "Adventure,Fantasy").split(",")
+    LENGTHS: List[int] = [int(length) for length in os.getenv("STORY_POOL_LENGTHS", "2,3").split(",")]
+    HERO_GENDERS: List[str] = os.getenv("STORY_POOL_HERO_GENDERS", "boy,girl").split(",")
+    HERO_AGE_BUCKETS: List[int] = [int(age) for age in os.getenv("STORY_POOL_HERO_AGE_BUCKETS", "5,8").split(",")]
+
+
+class Quota(BaseModel):
+    # Per-user limits checked before a story generation reaches the LLM
+    ENABLED: bool = os.getenv("QUOTA_ENABLED", "true").lower() == "true"
+    STORE: str = os.getenv("QUOTA_STORE", "memory")  # memory | postgres (shared by all instances)
+    MAX_CONCURRENT: int = int(os.getenv("QUOTA_MAX_CONCURRENT", "2"))
+    REQUESTS_PER_MINUTE: int = int(os.getenv("QUOTA_REQUESTS_PER_MINUTE", "6"))
+    DAILY_TOKENS: int = int(os.getenv("QUOTA_DAILY_TOKENS", "60000"))  # rolling 24 hours
+    # A generation that never reported back (crashed instance) stops counting as concurrent after this
+    LEASE_TIMEOUT_SECONDS: int = int(os.getenv("QUOTA_LEASE_TIMEOUT_SECONDS", "600"))
+
+
+class DeferredGeneration(BaseModel):
+    # Low-priority stories queued and generated through the provider's batch API at off-peak hours
+    ENABLED: bool = os.getenv("DEFERRED_ENABLED", "false").lower() == "true"
+    # Submission window in UTC hours, [start, end); equal values submit at any hour
+    OFFPEAK_START_HOUR: int = int(os.getenv("DEFERRED_OFFPEAK_START_HOUR", "0"))
+    OFFPEAK_END_HOUR: int = int(os.getenv("DEFERRED_OFFPEAK_END_HOUR", "6"))
+    POLL_INTERVAL_SECONDS: int = int(os.getenv("DEFERRED_POLL_INTERVAL_SECONDS", "60"))
+    BATCH_SIZE: int = int(os.getenv("DEFERRED_BATCH_SIZE", "200"))  # jobs per submitted batch
+    MAX_PENDING_PER_USER: int = int(os.getenv("DEFERRED_MAX_PENDING_PER_USER", "7"))
+    # Jobs claimed by an instance that died before submitting go back to the queue after this
+    STALE_CLAIM_SECONDS: int = int(os.getenv("DEFERRED_STALE_CLAIM_SECONDS", "600"))
+
+
+class UserCache(BaseModel):
+    # Process-wide cache of the user lookup done by the get_current_user dependencies
+    ENABLED: bool = os.getenv("USER_CACHE_ENABLED", "true").lower() == "true"
+    MAX_ENTRIES: int = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+    # Upper bound on how long another instance keeps serving a deactivated or deleted user
+    TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
 
 class AppleSignIn(BaseModel):
     # iOS App Configuration
@@ -93,6 +228,10 @@ class AppleSignIn(BaseModel):
     APPLE_KEYS_URL: str = "https://appleid.apple.com/auth/keys"
     APPLE_ISSUER: str = "https://appleid.apple.com"
     TOKEN_CACHE_TTL: int = int(os.getenv("APPLE_TOKEN_CACHE_TTL", "3600"))  # 1 hour
+    # Refresh the public keys in the background this long before TOKEN_CACHE_TTL runs out
+    KEYS_REFRESH_AHEAD_SECONDS: int = int(os.getenv("APPLE_KEYS_REFRESH_AHEAD_SECONDS", "300"))
+    # An unknown key id refetches the keys at most this often
+    KEYS_MIN_REFETCH_SECONDS: int = int(os.getenv("APPLE_KEYS_MIN_REFETCH_SECONDS", "60"))
 
 
 class Settings(BaseSettings):
@@ -102,6 +241,13 @@ class Settings(BaseSettings):
     data_base: DataBase = DataBase()
     jwt_token: JWTToken = JWTToken()
     openai: OpenAI = OpenAI()
+    llm: LLM = LLM()
+    story_streaming: StoryStreaming = StoryStreaming()
+    story_generation: StoryGeneration = StoryGeneration()
+    story_pool: StoryPool = StoryPool()
+    quota: Quota = Quota()
+    deferred_generation: DeferredGeneration = DeferredGeneration()
+    user_cache: UserCache = UserCache()
     apple_signin: AppleSignIn = AppleSignIn()
 
 
@@ -26,3 +26,5 @@ RESOURCE_CONFLICT = "RESOURCE_CONFLICT"
 # Story Errors
 STORY_NOT_FOUND = "STORY_NOT_FOUND"
 STORY_GENERATION_FAILED = "STORY_GENERATION_FAILED"
+LLM_UNAVAILABLE = "LLM_UNAVAILABLE"
+QUOTA_EXCEEDED = "QUOTA_EXCEEDED"
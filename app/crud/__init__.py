@@ -1,5 +1,15 @@
 from .user import user_crud
 from .story import story_crud
 from .hero import hero_crud
+from .async_user import async_user_crud
+from .async_story import async_story_crud
+from .async_hero import async_hero_crud
 
-__all__ = ["user_crud", "story_crud", "hero_crud"]
+__all__ = [
+    "user_crud",
+    "story_crud",
+    "hero_crud",
+    "async_user_crud",
+    "async_story_crud",
+    "async_hero_crud",
+]
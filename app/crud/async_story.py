@@ -0,0 +1,126 @@
+import logging
+from typing import List, Optional
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import desc, and_, select
+from app.db.models.story import Story
+from app.db.models.story_hero import StoryHero
+from app.schemas.story import StoryGenerateWithHeroesRequest
+from app.crud import async_user_onboarding
+from app.crud.story import story_crud
+from app.services.llm_providers import GenerationStats
+from app.core.consts import OnboardingStep
+
+
+class AsyncStoryCRUD:
+    async def get_by_id(self, db: AsyncSession, story_id: UUID, user_id: UUID) -> Optional[Story]:
+        """Get story by ID"""
+        result = await db.execute(
+            select(Story).where(
+                and_(
+                    Story.id == story_id,
+                    Story.user_id == user_id,
+                    Story.is_deleted == False
+                )
+            ).options(
+                joinedload(Story.story_heroes).joinedload(StoryHero.hero)
+            )
+        )
+        return result.unique().scalars().first()
+
+    async def get_user_stories(self, db: AsyncSession, user_id: UUID) -> List[Story]:
+        """Get all user stories with heroes eager loading"""
+        result = await db.execute(
+            select(Story).where(
+                and_(
+                    Story.user_id == user_id,
+                    Story.is_deleted == False
+                )
+            ).options(
+                joinedload(Story.story_heroes).joinedload(StoryHero.hero)
+            ).order_by(desc(Story.created_at))
+        )
+        return list(result.unique().scalars().all())
+
+    async def create_from_heroes_generation(
+        self,
+        db: AsyncSession,
+        story_data: StoryGenerateWithHeroesRequest,
+        generated_content: str,
+        user_id: UUID,
+        stats: Optional[GenerationStats] = None
+    ) -> Story:
+        """Create story from heroes parameters + AI generated content (with its token usage, if known)"""
+        db_story = Story(
+            user_id=user_id,
+            title=story_data.story_name,
+            content=generated_content,
+            story_style=story_data.story_style.value,
+            language=story_data.language.value,
+            story_idea=story_data.story_idea,
+            story_length=story_data.story_length.value,
+            **story_crud.usage_columns(stats)
+        )
+        db.add(db_story)
+        await db.flush()
+
+        # Create story-hero relationships
+        for hero in story_data.heroes:
+            db.add(StoryHero(story_id=db_story.id, hero_id=hero.id))
+
+        await db.commit()
+
+        # Check if this is user's first story and create onboarding step
+        existing_step = await async_user_onboarding.get_onboarding_step(
+            db, user_id, OnboardingStep.FIRST_STORY_CREATED
+        )
+        if not existing_step:
+            await async_user_onboarding.create_onboarding_step(
+                db=db,
+                user_id=user_id,
+                step_name=OnboardingStep.FIRST_STORY_CREATED
+            )
+
+        return db_story
+
+    async def delete(self, db: AsyncSession, story_id: UUID, user_id: UUID) -> bool:
+        """Soft delete story"""
+        db_story = await self.get_by_id(db, story_id, user_id)
+        if not db_story:
+            return False
+
+        db_story.is_deleted = True
+        await db.commit()
+        return True
+
+    async def get_stories_for_admin(self, db: AsyncSession) -> dict:
+        """Get all stories for admin"""
+        try:
+            result = await db.execute(
+                select(Story).where(Story.is_deleted == False).options(
+                    joinedload(Story.story_heroes).joinedload(StoryHero.hero)
+                ).order_by(desc(Story.created_at))
+            )
+
+            stories_data = [
+                story_crud.convert_to_list_item(story).model_dump()
+                for story in result.unique().scalars().all()
+            ]
+
+            return {
+                "success": True,
+                "message": f"Retrieved {len(stories_data)} stories",
+                "data": {"stories": stories_data}
+            }
+        except Exception as e:
+            logging.error(f"Error getting stories for admin: {str(e)}")
+            return {
+                "success": False,
+                "message": "Failed to retrieve stories",
+                "status_code": 500,
+                "errors": ["Internal server error"]
+            }
+
+
+async_story_crud = AsyncStoryCRUD()
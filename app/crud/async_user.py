@@ -0,0 +1,176 @@
+from typing import Optional, List, Tuple, Dict, Any
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import func, select, and_, desc
+from app.db.models.user import User
+from app.schemas.user import AppleSignIn, UserOut
+from app.crud import async_user_onboarding
+from app.services.user_identity_cache import user_identity_cache
+from app.core.consts import OnboardingStep
+import logging
+
+
+class AsyncUserCRUD:
+    async def get_by_id(self, db: AsyncSession, user_id: UUID, with_stories: bool = False) -> Optional[User]:
+        """Get user by ID with optional stories eager loading"""
+        query = select(User).where(
+            and_(
+                User.id == user_id,
+                User.is_active == True
+            )
+        )
+
+        if with_stories:
+            query = query.options(selectinload(User.stories))
+
+        result = await db.execute(query)
+        return result.scalars().first()
+
+    async def get_by_email(self, db: AsyncSession, email: str, with_stories: bool = False) -> Optional[User]:
+        """Get user by email with optional stories eager loading"""
+        query = select(User).where(
+            and_(
+                User.email == email.lower(),
+                User.is_active == True
+            )
+        )
+
+        if with_stories:
+            query = query.options(selectinload(User.stories))
+
+        result = await db.execute(query)
+        return result.scalars().first()
+
+    async def get_by_apple_id(self, db: AsyncSession, apple_id: str, with_stories: bool = False) -> Optional[User]:
+        """Get user by Apple ID with optional stories eager loading"""
+        query = select(User).where(
+            and_(
+                User.apple_id == apple_id,
+                User.is_active == True
+            )
+        )
+
+        if with_stories:
+            query = query.options(selectinload(User.stories))
+
+        result = await db.execute(query)
+        return result.scalars().first()
+
+    async def create_apple_user(self, db: AsyncSession, user: AppleSignIn, email: Optional[str] = None) -> User:
+        """Create new Apple user with minimal required data"""
+        db_user = User(
+            apple_id=user.apple_id,
+            email=email  # From Apple token verification (optional)
+        )
+        db.add(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+
+        # Create initial onboarding step
+        await async_user_onboarding.create_onboarding_step(
+            db=db,
+            user_id=db_user.id,
+            step_name=OnboardingStep.ACCOUNT_CREATED
+        )
+
+        return db_user
+
+    async def update_user_email(self, db: AsyncSession, user_id: UUID, email: Optional[str]) -> Optional[User]:
+        """Update user email from Apple token verification"""
+        db_user = await self.get_by_id(db, user_id)
+        if not db_user:
+            return None
+
+        db_user.email = email
+        await db.commit()
+        await db.refresh(db_user)
+        user_identity_cache.invalidate(user_id)
+        return db_user
+
+    async def deactivate(self, db: AsyncSession, user_id: UUID) -> bool:
+        """Soft delete user (deactivate account)"""
+        db_user = await self.get_by_id(db, user_id)
+        if not db_user:
+            return False
+
+        db_user.is_active = False
+        await db.commit()
+        user_identity_cache.invalidate(user_id)
+        return True
+
+    async def delete_user_permanently(self, db: AsyncSession, user_id: UUID) -> bool:
+        """Hard delete user and all related content"""
+        result = await db.execute(select(User).where(User.id == user_id))
+        db_user = result.scalars().first()
+        if not db_user:
+            return False
+
+        # ORM cascades lazy-load the related collections, which has to happen
+        # inside run_sync rather than on the event loop
+        await db.run_sync(lambda sync_db: sync_db.delete(db_user))
+        await db.commit()
+        user_identity_cache.invalidate(user_id)
+        return True
+
+    async def get_all(
+        self,
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        with_stories: bool = False
+    ) -> Tuple[List[User], int]:
+        """Get all users with optimized counting and optional eager loading"""
+        count_query = select(func.count(User.id)).where(User.is_active == True)
+        total = (await db.execute(count_query)).scalar()
+
+        query = select(User).where(User.is_active == True)
+
+        if with_stories:
+            query = query.options(selectinload(User.stories))
+
+        result = await db.execute(query.order_by(desc(User.created_at)).offset(skip).limit(limit))
+        return list(result.scalars().all()), total
+
+    async def get_stories_count(self, db: AsyncSession, user_id: UUID) -> int:
+        """Optimized stories count for user"""
+        from app.db.models.story import Story
+        count_query = select(func.count(Story.id)).where(
+            and_(
+                Story.user_id == user_id,
+                Story.is_deleted == False
+            )
+        )
+        return (await db.execute(count_query)).scalar() or 0
+
+    async def get_users_for_admin(self, db: AsyncSession) -> Dict[str, Any]:
+        """Get all users for admin with structured response"""
+        logger = logging.getLogger(__name__)
+        logger.info("Admin requesting all users list")
+
+        try:
+            result = await db.execute(
+                select(User).where(User.is_active == True).order_by(desc(User.created_at))
+            )
+            users_data = [UserOut.model_validate(user).model_dump(mode='json') for user in result.scalars().all()]
+
+            logger.info(f"Retrieved {len(users_data)} users")
+
+            return {
+                "success": True,
+                "message": f"Retrieved {len(users_data)} users",
+                "data": {"users": users_data}
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting users for admin: {str(e)}")
+            return {
+                "success": False,
+                "message": "Internal server error",
+                "status_code": 500,
+                "errors": ["Failed to retrieve users"],
+                "error_code": "INTERNAL_ERROR"
+            }
+
+
+async_user_crud = AsyncUserCRUD()
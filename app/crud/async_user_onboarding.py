@@ -0,0 +1,79 @@
+from typing import List, Optional
+from uuid import UUID
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models.user_onboarding import UserOnboardingProgress
+from datetime import datetime, timezone
+
+
+async def create_onboarding_step(
+    db: AsyncSession,
+    user_id: UUID,
+    step_name: str,
+    completed_at: Optional[datetime] = None
+) -> UserOnboardingProgress:
+    """Create new onboarding step record"""
+    if completed_at is None:
+        completed_at = datetime.now(timezone.utc)
+
+    db_step = UserOnboardingProgress(
+        user_id=user_id,
+        step_name=step_name,
+        completed_at=completed_at
+    )
+    db.add(db_step)
+    await db.commit()
+    await db.refresh(db_step)
+    return db_step
+
+
+async def get_user_onboarding_progress(db: AsyncSession, user_id: UUID) -> List[UserOnboardingProgress]:
+    """Get all onboarding progress for a user"""
+    result = await db.execute(
+        select(UserOnboardingProgress)
+        .where(UserOnboardingProgress.user_id == user_id)
+        .order_by(UserOnboardingProgress.completed_at)
+    )
+    return list(result.scalars().all())
+
+
+async def get_onboarding_step(
+    db: AsyncSession,
+    user_id: UUID,
+    step_name: str
+) -> Optional[UserOnboardingProgress]:
+    """Get specific onboarding step for user"""
+    result = await db.execute(
+        select(UserOnboardingProgress).where(
+            UserOnboardingProgress.user_id == user_id,
+            UserOnboardingProgress.step_name == step_name
+        )
+    )
+    return result.scalars().first()
+
+
+async def update_onboarding_step(
+    db: AsyncSession,
+    user_id: UUID,
+    step_name: str,
+    completed_at: datetime
+) -> Optional[UserOnboardingProgress]:
+    """Update existing onboarding step or create if doesn't exist"""
+    existing = await get_onboarding_step(db, user_id, step_name)
+
+    if existing:
+        existing.completed_at = completed_at
+        await db.commit()
+        await db.refresh(existing)
+        return existing
+    else:
+        return await create_onboarding_step(db, user_id, step_name, completed_at)
+
+
+async def delete_user_onboarding_progress(db: AsyncSession, user_id: UUID) -> bool:
+    """Delete all onboarding progress for a user"""
+    result = await db.execute(
+        delete(UserOnboardingProgress).where(UserOnboardingProgress.user_id == user_id)
+    )
+    await db.commit()
+    return result.rowcount > 0
@@ -0,0 +1,162 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app.crud.story import story_crud
+from app.db.models.deferred_story_job import DeferredStoryJob
+from app.schemas.story import DeferredStoryJobOut, StoryGenerateWithHeroesRequest
+from app.services.llm_batch import BatchResult
+
+
+PENDING_STATUSES = ("queued", "submitting", "submitted")
+
+
+class DeferredStoryJobCRUD:
+    def create(self, db: Session, story_data: StoryGenerateWithHeroesRequest, user_id: UUID) -> DeferredStoryJob:
+        """Queue a story request for deferred generation"""
+        job = DeferredStoryJob(
+            user_id=user_id,
+            request=story_data.model_dump(mode='json', exclude={"detached", "bypass_cache", "variants"}),
+            status="queued"
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def get_by_id(self, db: Session, job_id: UUID, user_id: UUID) -> Optional[DeferredStoryJob]:
+        return db.query(DeferredStoryJob).filter(
+            and_(
+                DeferredStoryJob.id == job_id,
+                DeferredStoryJob.user_id == user_id
+            )
+        ).first()
+
+    def count_pending(self, db: Session, user_id: UUID) -> int:
+        """Jobs of the user that have not finished yet"""
+        return db.query(DeferredStoryJob).filter(
+            and_(
+                DeferredStoryJob.user_id == user_id,
+                DeferredStoryJob.status.in_(PENDING_STATUSES)
+            )
+        ).count()
+
+    def claim_queued(self, db: Session, limit: int) -> List[Tuple[UUID, dict]]:
+        """
+        Mark the oldest queued jobs as being submitted; rows claimed by another instance are skipped.
+        Returns (job ID, stored request) pairs, usable after the session is closed.
+        """
+        jobs = db.query(DeferredStoryJob).filter(
+            DeferredStoryJob.status == "queued"
+        ).order_by(DeferredStoryJob.created_at).limit(limit).with_for_update(skip_locked=True).all()
+        now = _utcnow()
+        claimed = []
+        for job in jobs:
+            job.status = "submitting"
+            job.submitted_at = now
+            claimed.append((job.id, job.request))
+        db.commit()
+        return claimed
+
+    def mark_submitted(self, db: Session, job_ids: List[UUID], batch_id: str):
+        db.query(DeferredStoryJob).filter(DeferredStoryJob.id.in_(job_ids)).update(
+            {"status": "submitted", "batch_id": batch_id}, synchronize_session=False
+        )
+        db.commit()
+
+    def requeue(self, db: Session, job_ids: List[UUID]):
+        """Put claimed jobs back after a failed submission"""
+        db.query(DeferredStoryJob).filter(DeferredStoryJob.id.in_(job_ids)).update(
+            {"status": "queued", "submitted_at": None}, synchronize_session=False
+        )
+        db.commit()
+
+    def requeue_stale_claims(self, db: Session, older_than: timedelta) -> int:
+        """Jobs left in `submitting` by an instance that died mid-submission go back to the queue"""
+        count = db.query(DeferredStoryJob).filter(
+            and_(
+                DeferredStoryJob.status == "submitting",
+                DeferredStoryJob.submitted_at < _utcnow() - older_than
+            )
+        ).update({"status": "queued", "submitted_at": None}, synchronize_session=False)
+        db.commit()
+        return count
+
+    def submitted_batch_ids(self, db: Session) -> List[str]:
+        rows = db.query(DeferredStoryJob.batch_id).filter(
+            DeferredStoryJob.status == "submitted"
+        ).distinct().all()
+        return [row.batch_id for row in rows]
+
+    def complete_batch(self, db: Session, batch_id: str, results: List[BatchResult]) -> Dict[str, int]:
+        """
+        Save the stories of a finished batch and settle its jobs. Each story is saved in its own
+        SAVEPOINT: a job whose story cannot be saved (e.g. a hero deleted since it was queued)
+        fails alone instead of rolling back the batch, whose results may not be fetchable again.
+        """
+        jobs = db.query(DeferredStoryJob).filter(
+            and_(
+                DeferredStoryJob.batch_id == batch_id,
+                DeferredStoryJob.status == "submitted"
+            )
+        ).with_for_update(skip_locked=True).all()
+        results_by_id = {result.custom_id: result for result in results}
+        now = _utcnow()
+        counts = {"completed": 0, "failed": 0}
+
+        for job in jobs:
+            result = results_by_id.get(str(job.id))
+            job.completed_at = now
+            if result is None or result.error or not result.content:
+                self._fail(job, result.error if result is not None and result.error else "No result in batch")
+                counts["failed"] += 1
+                continue
+            try:
+                with db.begin_nested():
+                    story_data = StoryGenerateWithHeroesRequest.model_validate(job.request)
+                    db_story = story_crud.new_story(story_data, result.content, job.user_id, result.stats)
+                    db.add(db_story)
+                    # Stories have to exist before jobs reference them: there is no relationship
+                    # between the two for the flush to order the INSERTs and UPDATEs by
+                    db.flush()
+                    job.story_id = db_story.id
+                    job.status = "completed"
+                    story_crud.add_first_story_step(db, job.user_id)
+            except Exception as e:
+                logging.error(f"Deferred job {job.id}: could not save story: {str(e)}")
+                self._fail(job, "Could not save story")
+                counts["failed"] += 1
+                continue
+            counts["completed"] += 1
+
+        db.commit()
+        logging.info(f"Deferred batch {batch_id}: {counts['completed']} stories saved, {counts['failed']} failed")
+        return counts
+
+    @staticmethod
+    def _fail(job: DeferredStoryJob, error: str):
+        job.status = "failed"
+        job.error = error
+        job.story_id = None
+
+    def convert_to_out(self, job: DeferredStoryJob) -> DeferredStoryJobOut:
+        return DeferredStoryJobOut(
+            job_id=job.id,
+            status=job.status,
+            story_id=job.story_id,
+            error=job.error,
+            created_at=job.created_at,
+            completed_at=job.completed_at
+        )
+
+
+def _utcnow() -> datetime:
+    # Timestamps are stored as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+deferred_story_job_crud = DeferredStoryJobCRUD()
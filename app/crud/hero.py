@@ -1,7 +1,8 @@
+import uuid
 from typing import List, Optional
 from uuid import UUID
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, insert
 from app.db.models.hero import Hero
 from app.schemas.hero import HeroCreate, HeroUpdate
 from app.crud import user_onboarding
@@ -10,32 +11,27 @@ from app.core.consts import OnboardingStep
 
 class HeroCRUD:
     def create(self, db: Session, hero_data: HeroCreate, user_id: UUID) -> Hero:
-        """Create a new hero"""
-        db_hero = Hero(
-            user_id=user_id,
-            name=hero_data.name,
-            gender=hero_data.gender,
-            age=hero_data.age,
-            appearance=hero_data.appearance,
-            personality=hero_data.personality,
-            power=hero_data.power,
-            avatar_image=hero_data.avatar_image
-        )
-        db.add(db_hero)
-        db.commit()
-        db.refresh(db_hero)
-        
-        # Check if this is user's first hero and create onboarding step
-        existing_step = user_onboarding.get_onboarding_step(
-            db, user_id, OnboardingStep.FIRST_HERO_CREATED
-        )
-        if not existing_step:
-            user_onboarding.create_onboarding_step(
-                db=db,
+        """Create a new hero and, for the user's first one, its onboarding step in the same transaction"""
+        db_hero = db.scalar(
+            insert(Hero)
+            .values(
+                id=uuid.uuid4(),
                 user_id=user_id,
-                step_name=OnboardingStep.FIRST_HERO_CREATED
+                name=hero_data.name,
+                gender=hero_data.gender,
+                age=hero_data.age,
+                appearance=hero_data.appearance,
+                personality=hero_data.personality,
+                power=hero_data.power,
+                avatar_image=hero_data.avatar_image
             )
+            .returning(Hero)
+        )
+        user_onboarding.record_onboarding_step(db, user_id, OnboardingStep.FIRST_HERO_CREATED)
         
+        # Loaded from RETURNING; committing would expire it and cost another SELECT
+        db.expunge(db_hero)
+        db.commit()
         return db_hero
     
     def get_by_id(self, db: Session, hero_id: UUID, user_id: UUID) -> Optional[Hero]:
@@ -1,7 +1,8 @@
+import uuid
 from typing import List, Optional
 from uuid import UUID
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, desc, insert
 from app.db.models.series import Series
 from app.crud import user_onboarding
 from app.core.consts import OnboardingStep
@@ -9,27 +10,22 @@ from app.core.consts import OnboardingStep
 
 class SeriesCRUD:
     def create(self, db: Session, title: str, description: Optional[str], user_id: UUID) -> Series:
-        """Create a new series"""
-        db_series = Series(
-            user_id=user_id,
-            title=title,
-            description=description
-        )
-        db.add(db_series)
-        db.commit()
-        db.refresh(db_series)
-        
-        # Check if this is user's first series and create onboarding step
-        existing_step = user_onboarding.get_onboarding_step(
-            db, user_id, OnboardingStep.FIRST_SERIES_CREATED
-        )
-        if not existing_step:
-            user_onboarding.create_onboarding_step(
-                db=db,
+        """Create a new series and, for the user's first one, its onboarding step in the same transaction"""
+        db_series = db.scalar(
+            insert(Series)
+            .values(
+                id=uuid.uuid4(),
                 user_id=user_id,
-                step_name=OnboardingStep.FIRST_SERIES_CREATED
+                title=title,
+                description=description
             )
+            .returning(Series)
+        )
+        user_onboarding.record_onboarding_step(db, user_id, OnboardingStep.FIRST_SERIES_CREATED)
         
+        # Loaded from RETURNING; committing would expire it and cost another SELECT
+        db.expunge(db_series)
+        db.commit()
         return db_series
     
     def get_by_id(self, db: Session, series_id: UUID, user_id: UUID) -> Optional[Series]:
@@ -1,14 +1,36 @@
+import asyncio
 import logging
-from typing import List, Optional, AsyncGenerator
+import math
+import time
+import uuid
+from contextlib import AbstractContextManager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, AsyncGenerator, Callable, Tuple
 from uuid import UUID
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, and_
+from sqlalchemy import desc, and_, func, literal_column
 from app.db.models.story import Story
 from app.db.models.story_hero import StoryHero
-from app.schemas.story import StoryGenerateWithHeroesRequest, StoryOut, StoryListItem
+from app.schemas.story import (
+    StoryBatchGenerateRequest,
+    StoryGenerateWithHeroesRequest,
+    StoryJobOut,
+    StoryListItem,
+    StoryOut,
+    StoryUsageAggregate,
+)
 from app.services.story_generation import story_generation_service
+from app.services.llm_providers import GenerationStats
+from app.services.llm_resilience import CircuitOpenError
+from app.services.generation_quota import QuotaExceededError, generation_quota_service
+from app.services.story_result_cache import story_result_cache
+from app.services.story_pool import PooledStory, story_pool
+from app.services.story_variants import PendingVariants, story_variant_store
 from app.crud import user_onboarding
 from app.core.consts import OnboardingStep
+from app.core.configs import settings
+from app.core.error_codes import LLM_UNAVAILABLE, QUOTA_EXCEEDED
 
 
 class StoryCRUD:
@@ -24,6 +46,25 @@ class StoryCRUD:
             joinedload(Story.story_heroes).joinedload(StoryHero.hero)
         ).first()
     
+    def get_saved_job(
+        self,
+        session_scope: Callable[[], AbstractContextManager[Session]],
+        job_id: UUID,
+        user_id: UUID
+    ) -> Optional[StoryJobOut]:
+        """Finished story generation no longer held in memory: its story is saved under the job ID"""
+        with session_scope() as db:
+            story = db.query(Story.id, Story.content).filter(
+                and_(
+                    Story.id == job_id,
+                    Story.user_id == user_id,
+                    Story.is_deleted == False
+                )
+            ).first()
+        if story is None:
+            return None
+        return StoryJobOut(job_id=job_id, status="completed", story_id=story.id, content=story.content)
+
     def get_user_stories(self, db: Session, user_id: UUID) -> List[Story]:
         """Get all user stories with heroes eager loading"""
         return db.query(Story).filter(
@@ -72,66 +113,159 @@ class StoryCRUD:
         db: Session, 
         story_data: StoryGenerateWithHeroesRequest, 
         generated_content: str, 
+        user_id: UUID,
+        stats: Optional[GenerationStats] = None,
+        story_id: Optional[UUID] = None
+    ) -> Story:
+        """
+        Create story from heroes parameters + AI generated content (with its token usage, if known).
+
+        One transaction: the story, all of its hero links in a single multi-row INSERT and the
+        first-story onboarding step (INSERT ... ON CONFLICT DO NOTHING). Returns the story detached,
+        with its columns loaded, so nothing is reloaded after the commit.
+        """
+        db_story = self.new_story(story_data, generated_content, user_id, stats, story_id)
+        db.add(db_story)
+        db.flush()
+        self.add_first_story_step(db, user_id)
+
+        # Committing would expire the loaded attributes and cost another SELECT
+        db.expunge(db_story)
+        db.commit()
+        return db_story
+
+    @staticmethod
+    def usage_columns(stats: Optional[GenerationStats]) -> Dict[str, Any]:
+        """Story usage columns from the generation stats"""
+        return stats.as_dict() if stats is not None else {}
+
+    def save_generated_story(
+        self,
+        session_scope: Callable[[], AbstractContextManager[Session]],
+        story_data: StoryGenerateWithHeroesRequest,
+        generated_content: str,
+        user_id: UUID,
+        stats: Optional[GenerationStats] = None,
+        story_id: Optional[UUID] = None
+    ) -> UUID:
+        """Persist a generated story in its own short-lived session and return its ID"""
+        with session_scope() as db:
+            saved_story = self.create_from_heroes_generation(
+                db, story_data, generated_content, user_id, stats, story_id
+            )
+            return saved_story.id
+
+    def save_generated_stories(
+        self,
+        session_scope: Callable[[], AbstractContextManager[Session]],
+        generated: List[Tuple[StoryGenerateWithHeroesRequest, str, GenerationStats]],
         user_id: UUID
+    ) -> List[UUID]:
+        """Persist several generated stories in a single transaction and return their IDs"""
+        with session_scope() as db:
+            stories = [
+                self.new_story(story_data, generated_content, user_id, stats)
+                for story_data, generated_content, stats in generated
+            ]
+            db.add_all(stories)
+            self.add_first_story_step(db, user_id)
+            # IDs are assigned up front; read after the commit they would be reloaded one by one
+            story_ids = [story.id for story in stories]
+            db.commit()
+            return story_ids
+
+    def new_story(
+        self,
+        story_data: StoryGenerateWithHeroesRequest,
+        generated_content: str,
+        user_id: UUID,
+        stats: Optional[GenerationStats] = None,
+        story_id: Optional[UUID] = None
     ) -> Story:
-        """Create story from heroes parameters + AI generated content"""
-        # Create story
+        """Story with its hero links, not yet added to a session"""
         db_story = Story(
+            # Assigned up front so the ID is known without reloading after commit
+            id=story_id or uuid.uuid4(),
             user_id=user_id,
             title=story_data.story_name,
             content=generated_content,
             story_style=story_data.story_style.value,
             language=story_data.language.value,
             story_idea=story_data.story_idea,
-            story_length=story_data.story_length.value
-        )
-        db.add(db_story)
-        db.commit()
-        db.refresh(db_story)
-        
-        # Create story-hero relationships
-        for hero in story_data.heroes:
-            story_hero = StoryHero(
-                story_id=db_story.id,
-                hero_id=hero.id
-            )
-            db.add(story_hero)
-        
-        db.commit()
-        db.refresh(db_story)
-        
-        # Check if this is user's first story and create onboarding step
-        existing_step = user_onboarding.get_onboarding_step(
-            db, user_id, OnboardingStep.FIRST_STORY_CREATED
+            story_length=story_data.story_length.value,
+            **self.usage_columns(stats)
         )
-        if not existing_step:
-            user_onboarding.create_onboarding_step(
-                db=db,
-                user_id=user_id,
-                step_name=OnboardingStep.FIRST_STORY_CREATED
-            )
-        
+        db_story.story_heroes = [StoryHero(hero_id=hero.id) for hero in story_data.heroes]
         return db_story
 
+    @staticmethod
+    def add_first_story_step(db: Session, user_id: UUID):
+        """Record the first-story onboarding step in the current transaction, unless already done"""
+        user_onboarding.record_onboarding_step(db, user_id, OnboardingStep.FIRST_STORY_CREATED)
+
+    def is_first_story(self, session_scope: Callable[[], AbstractContextManager[Session]], user_id: UUID) -> bool:
+        """Whether the user has not created a story yet"""
+        with session_scope() as db:
+            return not user_onboarding.get_onboarding_step(db, user_id, OnboardingStep.FIRST_STORY_CREATED)
+
+    async def _take_pooled_first_story(
+        self,
+        session_scope: Callable[[], AbstractContextManager[Session]],
+        story_data: StoryGenerateWithHeroesRequest,
+        user_id: UUID
+    ) -> Optional[PooledStory]:
+        """Pre-generated story for a user's first story request, if the pool has a matching one"""
+        if not story_pool.matches(story_data):
+            return None
+        if not await run_in_threadpool(self.is_first_story, session_scope, user_id):
+            return None
+        pooled = story_pool.take(story_data)
+        if pooled is not None:
+            logging.info(f"Serving first story of user {user_id} from the story pool")
+        return pooled
+
     async def generate_story_with_heroes_stream(
         self, 
-        db: Session, 
+        session_scope: Callable[[], AbstractContextManager[Session]],
         story_data: StoryGenerateWithHeroesRequest, 
-        user_id: UUID
+        user_id: UUID,
+        story_id: Optional[UUID] = None
     ) -> AsyncGenerator[dict, None]:
-        """Generate story with heroes using streaming and save when complete"""
+        """
+        Generate story with heroes using streaming and save when complete, under
+        `story_id` if given (the generation's job ID, so finished jobs can be found in the DB).
+
+        A DB connection is only checked out (through session_scope) for the
+        final write, never while the OpenAI stream is running.
+        """
         logging.info(f"Starting streaming generation with heroes for user: {user_id}")
         
         full_story_content = ""
         story_saved = False
+        stats = GenerationStats()
+        lease_id = None
         
         try:
+            # A first story can be served from the pre-generated pool, identical requests
+            # from the (opt-in) result cache; neither reaches the LLM
+            pooled = await self._take_pooled_first_story(session_scope, story_data, user_id)
+            cache_key = story_result_cache.key(story_data) if pooled is None else None
+            cached_content = story_result_cache.get(cache_key)
+            if pooled is not None:
+                chunks = story_pool.replay(pooled, stats)
+            elif cached_content is not None:
+                chunks = story_result_cache.replay(cached_content, stats)
+            else:
+                # Per-user limits are checked before anything reaches the LLM
+                lease_id = await generation_quota_service.acquire(user_id)
+                chunks = story_generation_service.generate_story_with_heroes_stream(story_data, stats)
+
             yield {
                 "type": "started",
                 "message": f"Starting generation of '{story_data.story_name}' with heroes"
             }
             
-            async for chunk in story_generation_service.generate_story_with_heroes_stream(story_data):
+            async for chunk in chunks:
                 full_story_content += chunk
                 yield {
                     "type": "content",
@@ -140,29 +274,235 @@ class StoryCRUD:
             
             if full_story_content:
                 logging.info(f"Saving completed heroes story to database for user: {user_id}")
-                saved_story = self.create_from_heroes_generation(db, story_data, full_story_content, user_id)
+                story_id = await run_in_threadpool(
+                    self.save_generated_story, session_scope, story_data, full_story_content, user_id, stats, story_id
+                )
                 story_saved = True
+                if cached_content is None:
+                    story_result_cache.put(cache_key, full_story_content)
                 
                 yield {
                     "type": "completed",
-                    "story_id": str(saved_story.id),
+                    "story_id": str(story_id),
                     "message": "Story with heroes generated and saved successfully",
                     "story_length": len(full_story_content)
                 }
                 
         except Exception as e:
-            logging.error(f"Error during heroes streaming generation: {str(e)}")
-            yield {
-                "type": "error",
-                "message": f"Heroes generation failed: {str(e)}"
-            }
+            yield self._error_event(e, user_id)
         
         finally:
+            await generation_quota_service.release(user_id, lease_id, stats)
             if story_saved:
                 logging.info(f"Heroes streaming completed and saved for user: {user_id}")
             else:
                 logging.info(f"Heroes streaming completed but not saved for user: {user_id}")
 
+    async def generate_story_batch_stream(
+        self,
+        session_scope: Callable[[], AbstractContextManager[Session]],
+        batch: StoryBatchGenerateRequest,
+        user_id: UUID
+    ) -> AsyncGenerator[dict, None]:
+        """
+        Generate several stories concurrently and save them together when all are done.
+
+        Items run under a per-request concurrency bound (and the usual quota and
+        global OpenAI budget); their progress is multiplexed into one stream where
+        every item message carries the item `index`.
+        """
+        items = batch.items
+        logging.info(f"Starting batch generation of {len(items)} stories for user: {user_id}")
+
+        contents = [""] * len(items)
+        stats = [GenerationStats() for _ in items]
+        succeeded = [False] * len(items)
+        queue: asyncio.Queue = asyncio.Queue()
+        limit = asyncio.Semaphore(self._batch_concurrency())
+
+        async def run_item(index: int, story_data: StoryGenerateWithHeroesRequest):
+            async with limit:
+                lease_id = None
+                try:
+                    lease_id = await generation_quota_service.acquire(user_id)
+                    queue.put_nowait({"type": "item_started", "index": index, "story_name": story_data.story_name})
+
+                    # Deltas of one item are merged here: the SSE coalescer only merges plain content frames
+                    buffer = _DeltaBuffer()
+                    chunks = story_generation_service.generate_story_with_heroes_stream(story_data, stats[index])
+                    async for chunk in chunks:
+                        contents[index] += chunk
+                        merged = buffer.add(chunk)
+                        if merged:
+                            queue.put_nowait({"type": "item_content", "index": index, "data": merged})
+                    merged = buffer.flush()
+                    if merged:
+                        queue.put_nowait({"type": "item_content", "index": index, "data": merged})
+
+                    succeeded[index] = bool(contents[index])
+                    queue.put_nowait({"type": "item_completed", "index": index, "story_length": len(contents[index])})
+                except Exception as e:
+                    queue.put_nowait({**self._error_event(e, user_id), "type": "item_error", "index": index})
+                finally:
+                    await generation_quota_service.release(user_id, lease_id, stats[index])
+
+        tasks = [asyncio.create_task(run_item(index, story_data)) for index, story_data in enumerate(items)]
+        try:
+            yield {
+                "type": "started",
+                "message": f"Starting generation of {len(items)} stories",
+                "count": len(items)
+            }
+
+            finished = 0
+            while finished < len(items):
+                message = await queue.get()
+                if message["type"] in ("item_completed", "item_error"):
+                    finished += 1
+                yield message
+
+            indexes = [index for index in range(len(items)) if succeeded[index]]
+            story_ids: List[Optional[str]] = [None] * len(items)
+            if indexes:
+                logging.info(f"Saving {len(indexes)} batch stories to database for user: {user_id}")
+                saved_ids = await run_in_threadpool(
+                    self.save_generated_stories,
+                    session_scope,
+                    [(items[index], contents[index], stats[index]) for index in indexes],
+                    user_id
+                )
+                for index, story_id in zip(indexes, saved_ids):
+                    story_ids[index] = str(story_id)
+
+            yield {
+                "type": "completed",
+                "story_ids": story_ids,
+                "message": f"{len(indexes)} of {len(items)} stories generated and saved successfully"
+            }
+        except Exception as e:
+            logging.error(f"Error saving batch stories for user {user_id}: {str(e)}")
+            yield {
+                "type": "error",
+                "message": f"Batch generation failed: {str(e)}"
+            }
+        finally:
+            # Client gone or save failed: stop whatever is still generating
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def generate_story_variants_stream(
+        self,
+        story_data: StoryGenerateWithHeroesRequest,
+        user_id: UUID
+    ) -> AsyncGenerator[dict, None]:
+        """
+        Generate several versions of a story in one LLM call and keep them for the user to choose from.
+
+        Deltas of every variant are streamed as `variant_content` messages; nothing
+        is saved until one variant is chosen through choose_story_variant.
+        """
+        n = story_data.variants
+        logging.info(f"Starting generation of {n} story variants for user: {user_id}")
+
+        contents = [""] * n
+        buffers = [_DeltaBuffer() for _ in range(n)]
+        stats = GenerationStats()
+        lease_id = None
+
+        try:
+            # One upstream call, so one generation against the user's limits
+            lease_id = await generation_quota_service.acquire(user_id)
+
+            yield {
+                "type": "started",
+                "message": f"Starting generation of {n} variants of '{story_data.story_name}'",
+                "variants": n
+            }
+
+            # Deltas of one variant are merged here: the SSE coalescer only merges plain content frames
+            async for variant, chunk in story_generation_service.generate_story_variants_stream(story_data, stats):
+                contents[variant] += chunk
+                merged = buffers[variant].add(chunk)
+                if merged:
+                    yield {"type": "variant_content", "variant": variant, "data": merged}
+            for variant, buffer in enumerate(buffers):
+                merged = buffer.flush()
+                if merged:
+                    yield {"type": "variant_content", "variant": variant, "data": merged}
+
+            if any(contents):
+                selection_id = story_variant_store.put(PendingVariants(user_id, story_data, contents, stats))
+                yield {
+                    "type": "variants_ready",
+                    "selection_id": str(selection_id),
+                    "story_lengths": [len(content) for content in contents],
+                    "message": f"{n} variants generated, choose one to save it"
+                }
+
+        except Exception as e:
+            yield self._error_event(e, user_id)
+
+        finally:
+            await generation_quota_service.release(user_id, lease_id, stats)
+
+    def choose_story_variant(
+        self,
+        session_scope: Callable[[], AbstractContextManager[Session]],
+        selection_id: UUID,
+        variant: int,
+        user_id: UUID
+    ) -> Optional[UUID]:
+        """
+        Save the chosen variant as a story and drop the others. Returns the story ID,
+        or None if the selection is unknown, expired or has no such variant.
+        """
+        # Taken before saving, so a repeated choice cannot save the selection twice
+        pending = story_variant_store.take(selection_id, user_id, variant)
+        if pending is None:
+            return None
+        try:
+            # The story carries the usage of the whole call: the other variants were paid for it
+            return self.save_generated_story(
+                session_scope, pending.story_data, pending.contents[variant], user_id, pending.stats
+            )
+        except Exception:
+            story_variant_store.restore(selection_id, pending)
+            raise
+
+    @staticmethod
+    def _batch_concurrency() -> int:
+        concurrency = settings.story_generation.BATCH_CONCURRENCY
+        if settings.quota.ENABLED and settings.quota.MAX_CONCURRENT > 0:
+            # More would only collect concurrency quota errors
+            concurrency = min(concurrency, settings.quota.MAX_CONCURRENT)
+        return max(concurrency, 1)
+
+    @staticmethod
+    def _error_event(e: Exception, user_id: UUID) -> dict:
+        """Stream error message for a failed generation"""
+        if isinstance(e, QuotaExceededError):
+            return {
+                "type": "error",
+                "error_code": QUOTA_EXCEEDED,
+                "reason": e.reason,
+                "message": str(e),
+                "retry_after": math.ceil(e.retry_after) if e.retry_after is not None else None
+            }
+        if isinstance(e, CircuitOpenError):
+            logging.warning(f"Story generation unavailable for user {user_id}: {str(e)}")
+            return {
+                "type": "error",
+                "error_code": LLM_UNAVAILABLE,
+                "message": str(e),
+                "retry_after": round(e.retry_in)
+            }
+        logging.error(f"Error during heroes streaming generation: {str(e)}")
+        return {
+            "type": "error",
+            "message": f"Heroes generation failed: {str(e)}"
+        }
+
     def delete(self, db: Session, story_id: UUID, user_id: UUID) -> bool:
         """Soft delete story"""
         db_story = self.get_by_id(db, story_id, user_id)
@@ -196,5 +536,95 @@ class StoryCRUD:
                 "errors": ["Internal server error"]
             }
 
+    def get_usage_for_admin(self, db: Session, days: int) -> dict:
+        """Token usage and timing of generated stories per day, language and story length"""
+        try:
+            # created_at is stored as naive UTC
+            since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+            day = func.date_trunc(literal_column("'day'"), Story.created_at).label("day")
+            rows = db.query(
+                day,
+                Story.language,
+                Story.story_length,
+                func.count().label("stories"),
+                func.count(Story.prompt_tokens).label("stories_with_usage"),
+                func.sum(Story.prompt_tokens).label("prompt_tokens"),
+                func.sum(Story.completion_tokens).label("completion_tokens"),
+                func.sum(Story.cached_tokens).label("cached_tokens"),
+                func.avg(Story.completion_tokens).label("avg_completion_tokens"),
+                func.avg(Story.ttft_ms).label("avg_ttft_ms"),
+                func.avg(Story.generation_ms).label("avg_generation_ms"),
+            ).filter(
+                # Deleted stories are included: their tokens were paid for all the same
+                Story.created_at >= since
+            ).group_by(
+                day, Story.language, Story.story_length
+            ).order_by(
+                desc(day), Story.language, Story.story_length
+            ).all()
+
+            usage = [
+                StoryUsageAggregate(
+                    day=row.day.date(),
+                    language=row.language,
+                    story_length=row.story_length,
+                    stories=row.stories,
+                    stories_with_usage=row.stories_with_usage,
+                    prompt_tokens=row.prompt_tokens or 0,
+                    completion_tokens=row.completion_tokens or 0,
+                    cached_tokens=row.cached_tokens or 0,
+                    avg_completion_tokens=_round(row.avg_completion_tokens),
+                    avg_ttft_ms=_round(row.avg_ttft_ms),
+                    avg_generation_ms=_round(row.avg_generation_ms)
+                ).model_dump(mode='json')
+                for row in rows
+            ]
+
+            return {
+                "success": True,
+                "message": f"Retrieved story usage for the last {days} days",
+                "data": {"days": days, "usage": usage}
+            }
+        except Exception as e:
+            logging.error(f"Error getting story usage for admin: {str(e)}")
+            return {
+                "success": False,
+                "message": "Failed to retrieve story usage",
+                "status_code": 500,
+                "errors": ["Internal server error"]
+            }
+
+
+class _DeltaBuffer:
+    """
+    Merges the deltas of one stream into pieces of SSE_FLUSH_BYTES,
+    or whatever arrived within SSE_FLUSH_INTERVAL_MS
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._size = 0
+        self._flushed_at = time.monotonic()
+
+    def add(self, chunk: str) -> Optional[str]:
+        """Buffer a delta; returns the merged text when it is due"""
+        self._parts.append(chunk)
+        self._size += len(chunk)
+        if self._size >= settings.story_streaming.SSE_FLUSH_BYTES or \
+                time.monotonic() - self._flushed_at >= settings.story_streaming.SSE_FLUSH_INTERVAL_MS / 1000:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        if not self._parts:
+            return None
+        merged = "".join(self._parts)
+        self._parts, self._size, self._flushed_at = [], 0, time.monotonic()
+        return merged
+
+
+def _round(value) -> Optional[float]:
+    return round(float(value), 1) if value is not None else None
+
 
 story_crud = StoryCRUD()
\ No newline at end of file
@@ -1,11 +1,16 @@
+import uuid
+from datetime import datetime, timezone
 from typing import Optional, List, Tuple, Dict, Any
 from uuid import UUID
-from sqlalchemy.orm import Session, selectinload, joinedload
-from sqlalchemy import func, select, and_, desc
+from sqlalchemy.orm import Session, aliased, selectinload, joinedload
+from sqlalchemy import Boolean, DateTime, UUID as UUID_TYPE, func, literal, literal_column, select, and_, desc
+from sqlalchemy.dialects.postgresql import insert
 from app.db.models.user import User
+from app.db.models.user_onboarding import UserOnboardingProgress
 from app.schemas.user import AppleSignIn, UserOut
 from app.schemas.response import UsersListData
 from app.crud import user_onboarding
+from app.services.user_identity_cache import user_identity_cache
 from app.core.consts import OnboardingStep
 import logging
 
@@ -72,7 +77,52 @@ class UserCRUD:
         )
         
         return db_user
-    
+
+    def upsert_apple_user(self, db: Session, apple_id: str, email: Optional[str] = None) -> Optional[User]:
+        """
+        Sign-in write path in one statement and one transaction.
+
+        INSERT ... ON CONFLICT (apple_id) DO UPDATE ... RETURNING creates the user or
+        takes the existing one (refreshing the email when Apple sent one), and a
+        data-modifying CTE adds the ACCOUNT_CREATED step only when the row was inserted
+        (`xmax = 0`). Concurrent first sign-ins resolve to the same user instead of
+        failing on the unique apple_id. Returns a detached user, or None for a
+        deactivated account.
+        """
+        insert_user = insert(User).values(id=uuid.uuid4(), apple_id=apple_id, email=email, is_active=True)
+        upserted = insert_user.on_conflict_do_update(
+            index_elements=[User.apple_id],
+            set_={"email": func.coalesce(insert_user.excluded.email, User.email)},
+            where=User.is_active == True
+        ).returning(
+            *User.__table__.columns,
+            literal_column("(xmax = 0)", Boolean).label("inserted")
+        ).cte("upserted")
+
+        account_created = insert(UserOnboardingProgress).from_select(
+            ["id", "user_id", "step_name", "completed_at"],
+            select(
+                literal(uuid.uuid4(), UUID_TYPE),
+                upserted.c.id,
+                literal(OnboardingStep.ACCOUNT_CREATED.value),
+                literal(datetime.now(timezone.utc), DateTime)
+            ).where(upserted.c.inserted)
+        ).cte("account_created")
+
+        user_row = aliased(User, upserted)
+        row = db.execute(select(user_row, upserted.c.inserted).add_cte(account_created)).first()
+        if row is None:
+            db.rollback()
+            return None
+
+        user, inserted = row
+        # Keep the loaded attributes: committing would expire them and cost another SELECT
+        db.expunge(user)
+        db.commit()
+        if not inserted and email:
+            user_identity_cache.invalidate(user.id)
+        return user
+
     def update_user_email(self, db: Session, user_id: UUID, email: Optional[str]) -> Optional[User]:
         """Update user email from Apple token verification"""
         db_user = self.get_by_id(db, user_id)
@@ -82,6 +132,7 @@ class UserCRUD:
         db_user.email = email
         db.commit()
         db.refresh(db_user)
+        user_identity_cache.invalidate(user_id)
         return db_user
     
 
@@ -93,6 +144,7 @@ class UserCRUD:
         
         db_user.is_active = False
         db.commit()
+        user_identity_cache.invalidate(user_id)
         return True
     
     def delete_user_permanently(self, db: Session, user_id: UUID) -> bool:
@@ -104,6 +156,7 @@ class UserCRUD:
         # Delete user (cascade will handle related content)
         db.delete(db_user)
         db.commit()
+        user_identity_cache.invalidate(user_id)
         return True
     
     def get_all(self, db: Session, skip: int = 0, limit: int = 100, with_stories: bool = False) -> Tuple[List[User], int]:
@@ -1,6 +1,8 @@
+import uuid
 from typing import List, Optional
 from uuid import UUID
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
 from app.db.models.user_onboarding import UserOnboardingProgress
 from datetime import datetime, timezone
 
@@ -26,6 +28,25 @@ def create_onboarding_step(
     return db_step
 
 
+def record_onboarding_step(db: Session, user_id: UUID, step_name: str) -> bool:
+    """
+    Add an onboarding step to the current transaction unless the user already has it
+    (INSERT ... ON CONFLICT DO NOTHING, no commit). Returns True if it was recorded now.
+    """
+    inserted_id = db.scalar(
+        insert(UserOnboardingProgress)
+        .values(
+            id=uuid.uuid4(),
+            user_id=user_id,
+            step_name=step_name,
+            completed_at=datetime.now(timezone.utc)
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "step_name"])
+        .returning(UserOnboardingProgress.id)
+    )
+    return inserted_id is not None
+
+
 def get_user_onboarding_progress(db: Session, user_id: UUID) -> List[UserOnboardingProgress]:
     """Get all onboarding progress for a user"""
     return db.query(UserOnboardingProgress).filter(
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from functools import wraps
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from cachetools import TTLCache
+
+from app.core.configs import settings
+
+
+ASYNC_DB_ENGINES = TTLCache(maxsize=100, ttl=3600)
+
+async_engine_lock = asyncio.Lock()
+
+
+async def _create_async_db_engine(url: str, pool_size: int = None, max_overflow: int = None):
+    logging.info("Creating async database engine")
+
+    # Use settings from config if not provided
+    if pool_size is None:
+        pool_size = settings.data_base.DB_ASYNC_POOL_SIZE
+    if max_overflow is None:
+        max_overflow = settings.data_base.DB_ASYNC_MAX_OVERFLOW
+
+    try:
+        db_engine = create_async_engine(
+            url,
+            # Connection pool optimization
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=settings.data_base.DB_POOL_TIMEOUT,
+            pool_recycle=settings.data_base.DB_POOL_RECYCLE,
+            pool_pre_ping=True,  # Enables pessimistic disconnect handling
+
+            # asyncpg connection settings
+            connect_args={
+                "timeout": settings.data_base.DB_CONNECT_TIMEOUT,
+                "server_settings": {"timezone": "utc"}
+            },
+
+            # Echo SQL queries in development (can be controlled via env)
+            echo=os.getenv("DB_ECHO", "false").lower() == "true",
+
+            # Connection event handling
+            pool_reset_on_return="commit",  # Reset connections on return
+        )
+
+        # Test the connection
+        async with db_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    except Exception as e:
+        logging.error(f"Failed to create async database engine: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Async database engine creation failed: {str(e)}"
+        )
+    else:
+        logging.info(
+            f"Async database engine created successfully with pool_size={pool_size}, max_overflow={max_overflow}"
+        )
+        return db_engine
+
+
+def _get_async_db_session(user_db_engine) -> AsyncSession:
+    # Unlike the sync path the session is not bound to a connection up front:
+    # asyncpg connections are checked out lazily on the first statement
+    _session = async_sessionmaker(
+        bind=user_db_engine,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+    return _session()
+
+
+async def _get_async_db_engine():
+    logging.debug("call method _get_async_db_engine")
+    async with async_engine_lock:
+        if not ASYNC_DB_ENGINES.get("fairy_tales"):
+            db_engine = await _create_async_db_engine(
+                settings.data_base.get_async_db_url()
+            )
+            ASYNC_DB_ENGINES["fairy_tales"] = db_engine
+        return ASYNC_DB_ENGINES.get("fairy_tales")
+
+
+async def get_async_db():
+    logging.debug("call method get_async_db")
+    try:
+        db_engine = await _get_async_db_engine()
+        db = _get_async_db_session(db_engine)
+    except Exception as error:
+        logging.error(f"{error}")
+        raise error
+    else:
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+@asynccontextmanager
+async def async_db_session_scope():
+    """Short-lived async session for work outside of a request dependency"""
+    db_engine = await _get_async_db_engine()
+    db = _get_async_db_session(db_engine)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def async_db_safe(func):
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except OperationalError:
+            raise HTTPException(
+                status_code=503, detail="database is temporarily unavailable"
+            )
+
+    return wrapper
@@ -1,5 +1,6 @@
 import logging
 import os
+from contextlib import contextmanager
 from functools import wraps
 from fastapi import HTTPException
 from sqlalchemy import create_engine, text
@@ -107,6 +108,29 @@ def get_db():
             db.close()
 
 
+@contextmanager
+def db_session_scope():
+    """
+    Short-lived session for long-running (streaming) requests.
+
+    Unlike get_db the session is not bound to a connection up front: a pooled
+    connection is checked out on the first statement and returned as soon as
+    the block exits, so nothing is held while the response is being streamed.
+    """
+    db_engine = _get_db_engine()
+    _session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+    session = _session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def get_db_scope():
+    """Dependency for streaming endpoints: provides db_session_scope instead of a live session"""
+    return db_session_scope
+
+
 def db_safe(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -4,5 +4,9 @@ from app.db.models.hero import Hero
 from app.db.models.story_hero import StoryHero
 from app.db.models.series import Series
 from app.db.models.user_onboarding import UserOnboardingProgress
+from app.db.models.generation_lease import GenerationLease
+from app.db.models.deferred_story_job import DeferredStoryJob
 
-__all__ = ["User", "Story", "Hero", "StoryHero", "Series", "UserOnboardingProgress"]
+__all__ = [
+    "User", "Story", "Hero", "StoryHero", "Series", "UserOnboardingProgress", "GenerationLease", "DeferredStoryJob"
+]
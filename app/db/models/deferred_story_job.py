@@ -0,0 +1,30 @@
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, UUID, DateTime, Text, ForeignKey, Index, JSON
+from app.db.base_classes import BaseUser
+
+
+class DeferredStoryJob(BaseUser):
+    """Story request generated later, in bulk, through a batch provider"""
+    __tablename__ = "deferred_story_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    request = Column(JSON, nullable=False)  # StoryGenerateWithHeroesRequest
+    status = Column(String, nullable=False, default="queued")  # queued | submitting | submitted | completed | failed
+    batch_id = Column(String, nullable=True)
+    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="SET NULL"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    submitted_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Oldest queued jobs are claimed first
+        Index('ix_deferred_jobs_status_created', 'status', 'created_at'),
+        Index('ix_deferred_jobs_user_created', 'user_id', 'created_at'),
+        Index('ix_deferred_jobs_batch_id', 'batch_id'),
+    )
+
+    def __repr__(self):
+        return f"DeferredStoryJob(id={self.id}, user_id={self.user_id}, status={self.status}, batch_id={self.batch_id})"
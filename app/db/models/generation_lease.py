@@ -0,0 +1,26 @@
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import Column, UUID, DateTime, ForeignKey, Index, Integer
+from app.db.base_classes import BaseUser
+
+
+class GenerationLease(BaseUser):
+    """One story generation counted against its user's quota (Postgres quota store)"""
+    __tablename__ = "generation_leases"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    started_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    tokens = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # Every quota check scans one user's last 24 hours
+        Index('ix_generation_leases_user_started', 'user_id', 'started_at'),
+    )
+
+    def __repr__(self):
+        return (
+            f"GenerationLease(id={self.id}, user_id={self.user_id}, "
+            f"started_at={self.started_at}, finished_at={self.finished_at})"
+        )
@@ -18,7 +18,15 @@ class Story(BaseUser):
     story_idea = Column(Text, nullable=False)
     story_length = Column(Integer, nullable=False, default=3)
     is_deleted = Column(Boolean, default=False, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    # Generation usage (null for stories saved before usage accounting)
+    model = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)
+    ttft_ms = Column(Integer, nullable=True)
+    generation_ms = Column(Integer, nullable=True)
     
     # Relationships
     user = relationship("User", back_populates="stories")
@@ -44,6 +52,10 @@ class Story(BaseUser):
         Index('ix_stories_length', 'story_length'),
         Index('ix_stories_series_id', 'series_id'),
         
+        # Usage aggregates per day, language and length (index-only scans)
+        Index('ix_stories_usage', 'created_at', 'language', 'story_length',
+              postgresql_include=['prompt_tokens', 'completion_tokens', 'cached_tokens', 'ttft_ms', 'generation_ms']),
+        
         # Partial indexes for performance
         Index('ix_stories_active_only', 'user_id', 'created_at', 
               postgresql_where=Column('is_deleted') == False),
@@ -18,8 +18,8 @@ class UserOnboardingProgress(BaseUser):
     user = relationship("User", back_populates="onboarding_progress")
 
     __table_args__ = (
-        # Composite indexes for queries
-        Index('ix_onboarding_user_step', 'user_id', 'step_name'),
+        # Composite indexes for queries (one row per user and step)
+        Index('ix_onboarding_user_step', 'user_id', 'step_name', unique=True),
         Index('ix_onboarding_user_completed', 'user_id', 'completed_at'),
         
         # Single column indexes
@@ -1,5 +1,6 @@
 import os
 import logging
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 from fastapi import FastAPI
@@ -16,11 +17,27 @@ from app.api.endpoints.v1 import (
     router_onboarding,
     router_users,
 )
+from app.services.deferred_generation import deferred_story_service
+from app.services.story_pool import story_pool
 
 BASE_DIR = Path(__file__).resolve().parent
 contents = os.listdir(BASE_DIR)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background refill of pre-generated first stories (no-op unless STORY_POOL_ENABLED)
+    story_pool.start()
+    # Off-peak batch generation of queued stories (no-op unless DEFERRED_ENABLED)
+    deferred_story_service.start()
+    yield
+    await deferred_story_service.stop()
+    await story_pool.stop()
+
+
 main_app = FastAPI(
     openapi_version=settings.app_data.openapi_version,
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -32,6 +32,10 @@ class StoryResponse(BaseResponse):
     data: dict  # Contains story
 
 
+class StoryUsageResponse(BaseResponse):
+    data: dict  # Contains days and usage (list of StoryUsageAggregate)
+
+
 # Hero-related responses
 class HeroesListData(BaseModel):
     """Structured heroes list response data"""
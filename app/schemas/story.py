@@ -1,11 +1,18 @@
 from pydantic import BaseModel, Field, ConfigDict
 from uuid import UUID
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 from enum import Enum
 from app.schemas.hero import HeroOut
 
 
+# Upper bound of StoryBatchGenerateRequest.items (a week of bedtime stories)
+BATCH_MAX_ITEMS = 7
+
+# Upper bound of StoryGenerateWithHeroesRequest.variants
+MAX_STORY_VARIANTS = 3
+
+
 class StoryStyle(str, Enum):
     ADVENTURE = "Adventure"
     FANTASY = "Fantasy"
@@ -37,6 +44,77 @@ class StoryGenerateWithHeroesRequest(BaseModel):
     language: Language = Field(default=Language.ENGLISH, description="Language for the story")
     story_length: StoryLength = Field(default=StoryLength.MEDIUM, description="Length of the story (1-5, where 3 is medium)")
     heroes: List[HeroOut] = Field(..., description="List of heroes to include in the story", min_length=1)
+    detached: bool = Field(
+        default=False,
+        description=(
+            "Keep generating and save the story even if the client disconnects; "
+            "the stream starts with a job id to poll or re-stream"
+        )
+    )
+    bypass_cache: bool = Field(
+        default=False,
+        description="Always generate a new story, even if the result cache holds one for an identical request"
+    )
+    variants: int = Field(
+        default=1,
+        ge=1,
+        le=MAX_STORY_VARIANTS,
+        description=(
+            "Versions of the story generated in one LLM call; "
+            "only the one chosen with POST /stories/variants/{selection_id}/choose/ is saved"
+        )
+    )
+
+
+class StoryBatchGenerateRequest(BaseModel):
+    """Schema for generating several stories in one request"""
+    items: List[StoryGenerateWithHeroesRequest] = Field(
+        ...,
+        description="Stories to generate; `detached`, `bypass_cache` and `variants` of the items are ignored",
+        min_length=1,
+        max_length=BATCH_MAX_ITEMS
+    )
+
+
+class StoryVariantChoice(BaseModel):
+    """Schema for choosing the variant of a multi-variant generation to keep"""
+    variant: int = Field(
+        ..., ge=0, lt=MAX_STORY_VARIANTS, description="Index of the variant from the `variant_content` events"
+    )
+
+
+class StoryJobOut(BaseModel):
+    """State of a detached story generation"""
+    job_id: UUID
+    status: str  # running | completed | failed | cancelled
+    story_id: Optional[UUID] = None
+    content: str
+    error: Optional[str] = None
+
+
+class DeferredStoryJobOut(BaseModel):
+    """State of a story queued for deferred (batch) generation"""
+    job_id: UUID
+    status: str  # queued | submitting | submitted | completed | failed
+    story_id: Optional[UUID] = None
+    error: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+
+class StoryUsageAggregate(BaseModel):
+    """Token usage and timing of the stories generated on one day for one language and story length"""
+    day: date
+    language: str
+    story_length: int
+    stories: int
+    stories_with_usage: int  # stories saved before usage accounting have none
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    avg_completion_tokens: Optional[float] = None
+    avg_ttft_ms: Optional[float] = None
+    avg_generation_ms: Optional[float] = None
 
 
 class StoryOut(BaseModel):
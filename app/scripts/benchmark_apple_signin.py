@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Apple sign-in write path: the previous select / insert / onboarding
+sequence against the single INSERT ... ON CONFLICT ... RETURNING upsert.
+
+For each path it signs in fresh Apple IDs (first sign-in), then the same IDs
+again with a new email (returning users), from a pool of worker threads like
+the sync endpoint uses. Every statement and every COMMIT/ROLLBACK sent to the
+database is counted, so the table shows latency and DB round trips per
+sign-in. A last run fires concurrent first sign-ins for one Apple ID and
+reports how many of them failed. Users created by the benchmark are deleted.
+
+Usage: python -m app.scripts.benchmark_apple_signin --signins 500 --concurrency 1 10
+Requires a reachable database configured through the usual DB_* variables.
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import event
+
+# Add app to path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.crud.user import user_crud
+from app.db.db_sessions import _get_db_engine, db_session_scope
+from app.db.models.user import User
+from app.db.models.user_onboarding import UserOnboardingProgress
+from app.schemas.user import AppleSignIn, UserSummary
+
+APPLE_ID_PREFIX = "benchmark-signin-"
+
+
+class RoundTrips:
+    """Statements and transaction ends sent to the database"""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        for name in ("before_cursor_execute", "commit", "rollback"):
+            event.listen(engine, name, self._bump)
+
+    def _bump(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+
+def legacy_signin(apple_id: str, email: str):
+    """Sign-in as AppleSignInService did it before the upsert"""
+    with db_session_scope() as db:
+        user = user_crud.get_by_apple_id(db, apple_id)
+        if not user:
+            user = user_crud.create_apple_user(db, AppleSignIn(apple_id=apple_id, name="Benchmark"), email=email)
+        elif email and user.email != email:
+            user = user_crud.update_user_email(db, user.id, email)
+        return UserSummary.model_validate(user)
+
+
+def upsert_signin(apple_id: str, email: str):
+    with db_session_scope() as db:
+        user = user_crud.upsert_apple_user(db, apple_id, email)
+        return UserSummary.model_validate(user)
+
+
+PATHS = {"legacy": legacy_signin, "upsert": upsert_signin}
+
+
+def run(signin, apple_ids: list, email: str, concurrency: int, round_trips: RoundTrips) -> dict:
+    latencies = []
+    failures = []
+
+    def one(apple_id: str):
+        started = time.perf_counter()
+        try:
+            signin(apple_id, email)
+        except Exception as e:
+            failures.append(e)
+            return
+        latencies.append(time.perf_counter() - started)
+
+    before = round_trips.count
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, apple_ids))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(apple_ids) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000 if latencies else 0.0,
+        "round_trips": (round_trips.count - before) / len(apple_ids),
+        "failures": len(failures),
+    }
+
+
+def cleanup():
+    with db_session_scope() as db:
+        user_ids = db.query(User.id).filter(User.apple_id.like(f"{APPLE_ID_PREFIX}%")).subquery()
+        db.query(UserOnboardingProgress).filter(
+            UserOnboardingProgress.user_id.in_(user_ids)
+        ).delete(synchronize_session=False)
+        db.query(User).filter(User.apple_id.like(f"{APPLE_ID_PREFIX}%")).delete(synchronize_session=False)
+        db.commit()
+
+
+def main(args):
+    round_trips = RoundTrips(_get_db_engine())
+    cleanup()
+
+    print(
+        f"{'path':<8}{'sign-in':<11}{'concurrency':>12}{'req/s':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'trips':>8}{'failed':>8}"
+    )
+    try:
+        for concurrency in args.concurrency:
+            for name, signin in PATHS.items():
+                apple_ids = [f"{APPLE_ID_PREFIX}{uuid.uuid4()}" for _ in range(args.signins)]
+                for kind, email in (("first", "first@example.com"), ("returning", "returning@example.com")):
+                    result = run(signin, apple_ids, email, concurrency, round_trips)
+                    print(
+                        f"{name:<8}{kind:<11}{concurrency:>12}{result['rps']:>10.1f}"
+                        f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                        f"{result['round_trips']:>8.1f}{result['failures']:>8}"
+                    )
+
+        print(f"\n{args.race} concurrent first sign-ins of one Apple ID")
+        for name, signin in PATHS.items():
+            apple_id = f"{APPLE_ID_PREFIX}{uuid.uuid4()}"
+            result = run(signin, [apple_id] * args.race, "race@example.com", args.race, round_trips)
+            with db_session_scope() as db:
+                steps = db.query(UserOnboardingProgress).join(User).filter(User.apple_id == apple_id).count()
+            print(f"{name:<8}failed: {result['failures']}, onboarding rows: {steps}")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signins", type=int, default=500, help="sign-ins per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--race", type=int, default=10, help="concurrent first sign-ins of one Apple ID")
+    main(parser.parse_args())
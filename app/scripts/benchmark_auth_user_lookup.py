@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark authenticated request latency with and without the user identity cache.
+
+A throwaway FastAPI app exposes one endpoint that only depends on
+get_current_user, driven in-process through httpx's ASGI transport (one event
+loop, like a single uvicorn worker). Every request carries a real JWT for an
+existing active user, so the cache-off run performs the same DB lookup as
+production and the cache-on run shows what is left once the user is cached.
+
+Usage: python -m app.scripts.benchmark_auth_user_lookup --requests 2000 --concurrency 1 10 50
+Requires a reachable database with at least one active user (DB_* variables).
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import Depends, FastAPI
+
+# Add app to path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.db.db_sessions import db_session_scope
+from app.db.models.user import User
+from app.services.authentication import auth_service, get_current_user
+from app.services.user_identity_cache import user_identity_cache
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/me/")
+    async def me(current_user: User = Depends(get_current_user)):
+        return {"user_id": str(current_user.id)}
+
+    return app
+
+
+def pick_user_ids(count: int) -> list:
+    with db_session_scope() as db:
+        return [row.id for row in db.query(User.id).filter(User.is_active == True).limit(count).all()]
+
+
+async def run_level(client: httpx.AsyncClient, tokens: list, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index: int):
+        async with semaphore:
+            headers = {"Authorization": f"Bearer {tokens[index % len(tokens)]}"}
+            started = time.perf_counter()
+            response = await client.get("/me/", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main(args):
+    user_ids = pick_user_ids(args.users)
+    if not user_ids:
+        sys.exit("No active users in the database")
+    tokens = [auth_service.create_access_token(user_id)["access_token"] for user_id in user_ids]
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up the engine so pool creation is not measured
+        await client.get("/me/", headers={"Authorization": f"Bearer {tokens[0]}"})
+
+        print(f"{len(tokens)} users")
+        print(f"{'cache':<8}{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'hit ratio':>11}")
+        for concurrency in args.concurrency:
+            for enabled in (False, True):
+                user_identity_cache.enabled = enabled
+                for user_id in user_ids:
+                    user_identity_cache.invalidate(user_id)
+                user_identity_cache.counters.update(hits=0, misses=0)
+                result = await run_level(client, tokens, args.requests, concurrency)
+                hit_ratio = user_identity_cache.stats()["hit_ratio"]
+                print(
+                    f"{'on' if enabled else 'off':<8}{concurrency:>12}{result['rps']:>10.1f}"
+                    f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                    f"{hit_ratio if hit_ratio is not None else '-':>11}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--users", type=int, default=100, help="distinct users the requests rotate through")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark how many concurrent requests a single worker serves on the sync
+(psycopg2) and async (asyncpg) DB paths.
+
+Both variants are mounted on a throwaway FastAPI app and driven in-process
+through httpx's ASGI transport, so everything shares one event loop exactly
+like a single uvicorn worker does. Each request performs the same user lookup
+as get_current_user plus an optional server-side delay to mimic a slower DB.
+
+Usage: python -m app.scripts.benchmark_db_concurrency --requests 200 --concurrency 1 10 50
+Requires a reachable database configured through the usual DB_* variables.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# Add app to path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.crud.async_user import async_user_crud
+from app.crud.user import user_crud
+from app.db.async_db_sessions import get_async_db
+from app.db.db_sessions import get_db
+
+
+def build_app(db_latency_ms: int) -> FastAPI:
+    app = FastAPI()
+    delay = db_latency_ms / 1000
+
+    @app.get("/sync/")
+    async def sync_lookup(db: Session = Depends(get_db)):
+        if delay:
+            db.execute(text("SELECT pg_sleep(:delay)"), {"delay": delay})
+        user_crud.get_by_id(db, uuid.uuid4())
+        return {"ok": True}
+
+    @app.get("/async/")
+    async def async_lookup(db: AsyncSession = Depends(get_async_db)):
+        if delay:
+            await db.execute(text("SELECT pg_sleep(:delay)"), {"delay": delay})
+        await async_user_crud.get_by_id(db, uuid.uuid4())
+        return {"ok": True}
+
+    return app
+
+
+async def run_level(client: httpx.AsyncClient, path: str, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main(args):
+    app = build_app(args.db_latency_ms)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up both engines so pool creation is not measured
+        await client.get("/sync/")
+        await client.get("/async/")
+
+        print(f"{'path':<8}{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for concurrency in args.concurrency:
+            for path in ("/sync/", "/async/"):
+                result = await run_level(client, path, args.requests, concurrency)
+                print(
+                    f"{path.strip('/'):<8}{concurrency:>12}{result['rps']:>10.1f}"
+                    f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    parser.add_argument("--db-latency-ms", type=int, default=5, help="extra server-side delay per request")
+    asyncio.run(main(parser.parse_args()))
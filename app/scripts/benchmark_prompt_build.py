@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of story prompt assembly: the legacy f-string builder vs
+PromptTemplateEngine (precompiled templates + cached hero fragments).
+
+Reports time per prompt and peak memory allocated per prompt (tracemalloc).
+The engine uses the cache-friendly message layout (static system message), so
+its text differs from the legacy prompt.
+
+Usage: python -m app.scripts.benchmark_prompt_build --iterations 20000 --heroes 3
+"""
+
+import argparse
+import logging
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+from uuid import uuid4
+
+# Add app to path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.schemas.hero import HeroOut
+from app.schemas.story import StoryGenerateWithHeroesRequest
+from app.services.prompt_templates import PromptTemplateEngine
+
+
+class LegacyPromptBuilder:
+    """Prompt building as StoryGenerationService did it before the template engine"""
+
+    def __init__(self):
+        self.logger = logging.getLogger("legacy_prompt_builder")
+
+    def _build_messages(self, story_params: StoryGenerateWithHeroesRequest) -> List[Dict[str, str]]:
+        """Chat messages sent to OpenAI for a story request"""
+        return [
+            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "user", "content": self._build_prompt_with_heroes(story_params)}
+        ]
+
+    def _get_system_prompt(self) -> str:
+        """
+        Returns the system prompt that defines the AI's role and constraints.
+        This prompt ensures child-friendly content and fairy tale style.
+        """
+        return (
+            "You are a professional children's fairy tale writer specializing in age-appropriate stories "
+            "for children up to 12 years old."
+            """
+
+STRICT GUIDELINES:
+1. Create ONLY fairy tales and fantasy stories suitable for children
+2. Content must be 100% appropriate for ages 0-12 years
+3. NO violence, scary content, death, or inappropriate themes
+4. Focus on positive values: friendship, kindness, courage, learning, family
+5. Use simple, clear language appropriate for the target age
+6. Include magic, wonder, and imagination
+7. Always have a positive, uplifting ending
+8. Promote good morals and life lessons
+
+FORBIDDEN CONTENT:
+- Violence, fighting, or scary scenes
+- Death, illness, or sad endings
+- Adult themes or complex emotional situations
+- Frightening creatures or situations
+- Any content that might cause nightmares or distress
+
+STORY STRUCTURE:
+- Clear beginning, middle, and end
+- Engaging characters children can relate to
+- Simple conflicts that are easily resolved
+- Educational or moral elements woven naturally
+- Descriptive language that sparks imagination
+
+FORMAT REQUIREMENTS:
+- Write in PLAIN TEXT format only
+- NO markdown formatting (no #, *, **, _, etc.)
+- NO headers, bold text, or special formatting
+- Use simple paragraphs separated by line breaks
+- Present the story as continuous narrative text
+- DO NOT end stories with "The End", "Конец", "Fin", "Finale" or similar ending phrases
+- Stories should conclude naturally with the final narrative sentence
+- Use ONLY short dashes (-) for punctuation, NOT long em-dashes (—) or en-dashes (–)
+
+Remember: You are creating magical, safe, and enriching experiences for young minds."""
+        )
+
+    def _build_prompt_with_heroes(self, story_params: StoryGenerateWithHeroesRequest) -> str:
+        """Build the user prompt with story parameters and heroes list"""
+
+        self.logger.info(f"📝 Building prompt for story: {story_params.story_name}")
+        self.logger.info(f"🦸 Heroes received: {len(story_params.heroes)}")
+
+        for i, hero in enumerate(story_params.heroes):
+            self.logger.info(f"🦸‍♂️ Hero {i+1}: {hero.name} (age {hero.age}, {hero.gender})")
+
+        # Determine age from the average of heroes' ages or use youngest hero's age for age-appropriate content
+        hero_ages = [hero.age for hero in story_params.heroes]
+        target_age = min(hero_ages)  # Use youngest hero's age for appropriate content
+        self.logger.info(f"🎯 Target age for content: {target_age}")
+
+        # Age-appropriate guidelines
+        age_guidance = self._get_age_specific_guidance(target_age)
+
+        # Language-specific elements
+        language_guidance = self._get_language_guidance(story_params.language.value)
+
+        # Build heroes description
+        self.logger.info("🎭 Formatting heroes for prompt...")
+        heroes_description = self._format_heroes_for_prompt(story_params.heroes)
+        self.logger.info(f"📋 Heroes description length: {len(heroes_description)} chars")
+
+        prompt = f"""Create a {story_params.story_style.value.lower()} fairy tale with these specifications:
+
+STORY DETAILS:
+- Title: "{story_params.story_name}"
+- Story idea: {story_params.story_idea}
+- Language: {story_params.language.value.upper()}
+- Style: {story_params.story_style.value}
+- Story length: {story_params.story_length.value} (1=very short, 2=short, 3=medium, 4=long, 5=very long)
+
+MAIN CHARACTERS (HEROES):
+{heroes_description}
+
+AGE REQUIREMENTS:
+{age_guidance}
+
+LANGUAGE REQUIREMENTS:
+{language_guidance}
+
+STORY REQUIREMENTS:
+- Length: {self._get_length_guidance(story_params.story_length.value)}
+- Include traditional fairy tale elements and magical moments
+- Feature ALL the heroes listed above as main characters in the story
+- Give each hero meaningful roles and showcase their unique personalities and powers
+- Create interactions between the heroes that highlight their different strengths
+- Incorporate the story idea naturally into the plot involving all heroes
+- End with a clear moral lesson appropriate for the age group
+- Use rich, descriptive language that helps children visualize the story
+- IMPORTANT: Do NOT end with "The End" or equivalent phrases - let the story conclude naturally
+- Use simple punctuation: short dashes (-) only, avoid long dashes (—) or special symbols
+- Balance the story so all heroes contribute meaningfully to the adventure
+
+Please write the complete fairy tale now featuring all the heroes working together."""
+
+        return prompt
+
+    def _format_heroes_for_prompt(self, heroes: List[HeroOut]) -> str:
+        """Format heroes list for inclusion in the prompt"""
+        heroes_text = ""
+        for i, hero in enumerate(heroes, 1):
+            heroes_text += f"""
+{i}. {hero.name} ({hero.gender}, age {hero.age})
+   - Appearance: {hero.appearance or 'Not specified'}
+   - Personality: {hero.personality or 'Not specified'}
+   - Special Power: {hero.power or 'No special powers'}"""
+
+        return heroes_text.strip()
+
+    def _get_age_specific_guidance(self, age: int) -> str:
+        """Get age-specific content guidance"""
+        if age <= 5:
+            return """- Use very simple sentences and basic vocabulary
+- Focus on concrete concepts and familiar situations
+- Include repetitive elements and simple rhymes
+- Story should be 2-3 minutes reading time
+- Emphasize basic concepts like colors, numbers, animals
+- Very gentle conflicts with immediate, happy solutions"""
+
+        elif age <= 8:
+            return """- Use clear, engaging sentences with expanded vocabulary
+- Include some adventure but keep it safe and non-threatening
+- Add simple problem-solving elements
+- Story should be 3-4 minutes reading time
+- Can include mild suspense that quickly resolves positively
+- Focus on friendship, sharing, and basic life lessons"""
+
+        elif age <= 12:
+            return """- Use rich vocabulary and more complex sentence structures
+- Include character development and emotional growth
+- Add meaningful challenges that teach resilience
+- Story should be 4-5 minutes reading time
+- Can explore themes of courage, honesty, and perseverance
+- Include subtle moral lessons woven into the narrative"""
+
+        else:
+            return """- Use sophisticated language and narrative techniques
+- Explore deeper themes while maintaining appropriateness
+- Include complex character relationships and growth
+- Story should be 5-6 minutes reading time
+- Address more nuanced moral and ethical concepts
+- Prepare for transition to young adult themes"""
+
+    def _get_language_guidance(self, language: str) -> str:
+        """Get language-specific guidance for story generation"""
+        guidance = {
+            "en": (
+                "Write in clear, engaging English with proper grammar and rich vocabulary "
+                "appropriate for native English-speaking children."
+            ),
+            "ru": (
+                "Пишите на ясном, увлекательном русском языке с правильной грамматикой и богатой лексикой, "
+                "подходящей для русскоговорящих детей."
+            ),
+            "es": (
+                "Escribe en español claro y atractivo con gramática correcta y vocabulario rico "
+                "apropiado para niños hispanohablantes."
+            ),
+            "fr": (
+                "Écrivez en français clair et engageant avec une grammaire correcte et un vocabulaire riche "
+                "approprié pour les enfants francophones."
+            ),
+            "de": (
+                "Schreiben Sie in klarem, ansprechendem Deutsch mit korrekter Grammatik und reichem Wortschatz, "
+                "der für deutschsprachige Kinder geeignet ist."
+            )
+        }
+        return guidance.get(language, guidance["en"])
+
+    def _get_length_guidance(self, story_length: int) -> str:
+        """Get length-specific guidance for story generation"""
+        length_guidance = {
+            1: "Approximately 100-200 words (very short story)",
+            2: "Approximately 200-300 words (short story)",
+            3: "Approximately 300-400 words (medium story)",
+            4: "Approximately 400-500 words (long story)",
+            5: "Approximately 500-600 words (very long story)"
+        }
+        return length_guidance.get(story_length, length_guidance[3])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--heroes", type=int, default=3)
+    return parser.parse_args()
+
+
+def make_request(hero_count: int) -> StoryGenerateWithHeroesRequest:
+    now = datetime.now()
+    heroes = [
+        HeroOut(
+            id=uuid4(), user_id=uuid4(), name=f"Hero {number}", gender="girl", age=6 + number,
+            appearance="Curly red hair and a green cloak", personality="Brave and curious",
+            power="Talks to animals", created_at=now, updated_at=now,
+        )
+        for number in range(hero_count)
+    ]
+    return StoryGenerateWithHeroesRequest(
+        story_name="The Whispering Lantern",
+        story_idea="A lantern that whispers kind secrets to whoever is lost",
+        story_style="Fantasy",
+        language="en",
+        story_length=3,
+        heroes=heroes,
+    )
+
+
+def measure(build, story_params, iterations: int) -> dict:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        build(story_params)
+    elapsed = time.perf_counter() - started
+
+    # Memory is measured separately: tracemalloc slows everything down.
+    # Peak traced memory while building one prompt = bytes allocated by it at once.
+    sample = max(iterations // 10, 1)
+    tracemalloc.start()
+    total_peak = 0
+    for _ in range(sample):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        build(story_params)
+        _, peak = tracemalloc.get_traced_memory()
+        total_peak += peak - baseline
+    tracemalloc.stop()
+
+    return {
+        "us_per_prompt": elapsed * 1e6 / iterations,
+        "kib_per_prompt": total_peak / sample / 1024,
+    }
+
+
+def main(args):
+    # INFO logging is disabled like in a quiet production logger; the f-strings still run
+    logging.basicConfig(level=logging.WARNING)
+    story_params = make_request(args.heroes)
+    legacy = LegacyPromptBuilder()
+    engine = PromptTemplateEngine()
+
+    print(f"{'builder':>10}{'us/prompt':>12}{'KiB/prompt':>12}")
+    for name, build in (("legacy", legacy._build_messages), ("templates", engine.build_messages)):
+        result = measure(build, story_params, args.iterations)
+        print(f"{name:>10}{result['us_per_prompt']:>12.2f}{result['kib_per_prompt']:>12.1f}")
+    print(f"hero cache: {engine.stats()}")
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+CPU cost per generated story of the SSE framing, legacy vs coalesced.
+
+Runs N concurrent fake story streams (no OpenAI, no database) through
+  legacy    - one `data:` frame and one json.dumps per upstream delta
+  coalesced - SSEFrameCoalescer (flush on --flush-bytes or --flush-ms)
+and reports process CPU time per story, frames per story and bytes per story.
+Every frame pays a real request.is_disconnected() check like the endpoint;
+socket writes are not included, so the gain in production is larger.
+
+Usage: python -m app.scripts.benchmark_sse_frames --stories 200 --tokens 900 --inter-token-ms 2
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add app to path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from starlette.requests import Request
+
+from app.services.llm_providers import FakeLLMProvider
+from app.services.sse import build_sse_coalescer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stories", type=int, default=200, help="concurrent stories per mode")
+    parser.add_argument("--tokens", type=int, default=900, help="upstream deltas per story")
+    parser.add_argument("--inter-token-ms", type=int, default=2, help="fake delay between deltas")
+    parser.add_argument("--flush-bytes", type=int, default=256)
+    parser.add_argument("--flush-ms", type=int, default=40)
+    return parser.parse_args()
+
+
+async def story_events(provider: FakeLLMProvider, number: int, tokens: int):
+    messages = [{"role": "user", "content": f"story {number}"}]
+    seq = 0
+    yield f"{number}:{seq}", {"type": "started", "message": f"Starting generation of 'Story {number}' with heroes"}
+    async for chunk in provider.stream(messages, max_tokens=tokens, temperature=0.8):
+        seq += 1
+        yield f"{number}:{seq}", {"type": "content", "data": chunk}
+    yield f"{number}:{seq + 1}", {
+        "type": "completed",
+        "story_id": "00000000-0000-0000-0000-000000000000",
+        "message": "saved"
+    }
+
+
+async def legacy_frames(events):
+    async for event_id, message in events:
+        yield f"id: {event_id}\ndata: {json.dumps(message)}\n\n".encode("utf-8")
+
+
+async def consume(frames, totals: dict):
+    async def receive():
+        # A client that never disconnects
+        await asyncio.Event().wait()
+
+    # The endpoint checks is_disconnected() once per frame
+    request = Request({"type": "http"}, receive)
+    async for frame in frames:
+        if await request.is_disconnected():
+            return
+        totals["frames"] += 1
+        totals["bytes"] += len(frame)
+
+
+async def run_mode(mode: str, args) -> dict:
+    provider = FakeLLMProvider(
+        model="fake", ttft_ms=0, inter_token_ms=args.inter_token_ms, failure_rate=0, rate_limit_rate=0, seed=1
+    )
+    coalescer = build_sse_coalescer(max_bytes=args.flush_bytes, max_delay_ms=args.flush_ms)
+    totals = {"frames": 0, "bytes": 0}
+
+    def frames_for(number: int):
+        events = story_events(provider, number, args.tokens)
+        return coalescer.frames(events) if mode == "coalesced" else legacy_frames(events)
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(consume(frames_for(number), totals) for number in range(args.stories)))
+    return {
+        "cpu_ms_per_story": (time.process_time() - cpu_started) * 1000 / args.stories,
+        "wall_s": time.perf_counter() - wall_started,
+        "frames_per_story": totals["frames"] / args.stories,
+        "bytes_per_story": totals["bytes"] / args.stories,
+    }
+
+
+async def main(args):
+    print(f"{'mode':>10}{'cpu ms/story':>14}{'frames/story':>14}{'bytes/story':>13}{'wall s':>8}")
+    for mode in ("legacy", "coalesced"):
+        result = await run_mode(mode, args)
+        print(
+            f"{mode:>10}{result['cpu_ms_per_story']:>14.2f}{result['frames_per_story']:>14.1f}"
+            f"{result['bytes_per_story']:>13.0f}{result['wall_s']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
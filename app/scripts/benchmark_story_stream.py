@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of POST /stories/generate-with-heroes-stream/ without
+calling OpenAI.
+
+The app is started in-process with LLM_PROVIDER=fake and driven through
+httpx's ASGI transport at increasing concurrency. Latency and faults of the
+fake provider come from the LLM_FAKE_* variables (or the flags below).
+Stories are persisted for the given user, so point it at a scratch database.
+
+Usage: python -m app.scripts.benchmark_story_stream --user-id <uuid> --concurrency 1 10 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from uuid import UUID
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", required=True, help="existing user that owns at least one hero")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 25, 50])
+    parser.add_argument("--requests", type=int, default=50, help="requests per concurrency level")
+    parser.add_argument("--ttft-ms", type=int, help="fake time to first token")
+    parser.add_argument("--inter-token-ms", type=int, help="fake delay between tokens")
+    parser.add_argument("--failure-rate", type=float, help="fraction of fake calls that fail")
+    parser.add_argument("--rate-limit-rate", type=float, help="fraction of fake calls answered with a 429")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    # Settings are read at import time, so the environment has to be ready first
+    os.environ["LLM_PROVIDER"] = "fake"
+    overrides = {
+        "LLM_FAKE_TTFT_MS": args.ttft_ms,
+        "LLM_FAKE_INTER_TOKEN_MS": args.inter_token_ms,
+        "LLM_FAKE_FAILURE_RATE": args.failure_rate,
+        "LLM_FAKE_RATE_LIMIT_RATE": args.rate_limit_rate,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
+
+async def run_level(client, headers: dict, heroes: list, total: int, concurrency: int, offset: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    ttfts, durations, outcomes = [], [], {}
+
+    async def one(number: int):
+        payload = {
+            # Unique names so identical-request coalescing does not kick in
+            "story_name": f"Benchmark story {offset + number}",
+            "story_idea": "A lantern that whispers kind secrets",
+            "story_style": "Fantasy",
+            "language": "en",
+            "story_length": 3,
+            "heroes": heroes,
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            first_content = None
+            outcome = "no_completion"
+            async with client.stream(
+                "POST", "/api/v1/stories/generate-with-heroes-stream/", json=payload, headers=headers
+            ) as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    message = json.loads(line[6:])
+                    if message["type"] == "content" and first_content is None:
+                        first_content = time.perf_counter() - started
+                    elif message["type"] in ("completed", "error"):
+                        outcome = message["type"]
+            durations.append(time.perf_counter() - started)
+            if first_content is not None:
+                ttfts.append(first_content)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(number) for number in range(total)))
+    elapsed = time.perf_counter() - started
+
+    durations.sort()
+    return {
+        "stories_per_s": total / elapsed,
+        "ttft_p50_ms": statistics.median(ttfts) * 1000 if ttfts else float("nan"),
+        "total_p95_ms": durations[int(len(durations) * 0.95) - 1] * 1000,
+        "outcomes": outcomes,
+    }
+
+
+async def main(args):
+    import httpx
+
+    from app.crud.hero import hero_crud
+    from app.db.db_sessions import db_session_scope
+    from app.main import main_app
+    from app.schemas.hero import HeroOut
+    from app.services.authentication import auth_service
+
+    user_id = UUID(args.user_id)
+    with db_session_scope() as db:
+        heroes = [
+            HeroOut.model_validate(hero).model_dump(mode="json") for hero in hero_crud.get_user_heroes(db, user_id)
+        ]
+    if not heroes:
+        sys.exit("The benchmark user needs at least one hero")
+
+    token = auth_service.create_access_token(user_id)["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=main_app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'concurrency':>12}{'stories/s':>11}{'ttft p50':>10}{'p95 ms':>10}  outcomes")
+        offset = 0
+        for concurrency in args.concurrency:
+            result = await run_level(client, headers, heroes[:2], args.requests, concurrency, offset)
+            offset += args.requests
+            print(
+                f"{concurrency:>12}{result['stories_per_s']:>11.2f}{result['ttft_p50_ms']:>10.1f}"
+                f"{result['total_p95_ms']:>10.1f}  {result['outcomes']}"
+            )
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure_environment(arguments)
+    # Add app to path
+    sys.path.append(str(Path(__file__).parent.parent.parent))
+    asyncio.run(main(arguments))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Load test for DB pool pressure caused by long-running story streams.
+
+Simulates N concurrent story generations against the real connection pool in
+two modes and, at the same time, probes how long an ordinary short request
+waits for a pooled connection:
+
+  held   - the old behaviour: a session bound to a connection for the whole stream
+  scoped - db_session_scope: a connection only for the auth lookup and the final write
+
+The "final write" is a SELECT so the test leaves no rows behind.
+
+Usage: python -m app.scripts.load_test_stream_pool --streams 1 3 6 12 --stream-seconds 5
+Requires a reachable database configured through the usual DB_* variables.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# Add app to path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.db.db_sessions import _get_db_engine, _get_db_session, db_session_scope
+
+
+def held_stream(stream_seconds: float):
+    session = _get_db_session(_get_db_engine())
+    try:
+        session.execute(text("SELECT 1"))  # auth lookup
+        time.sleep(stream_seconds)          # OpenAI stream
+        session.execute(text("SELECT 1"))  # final write
+    finally:
+        session.close()
+
+
+def scoped_stream(stream_seconds: float):
+    with db_session_scope() as session:
+        session.execute(text("SELECT 1"))
+    time.sleep(stream_seconds)
+    with db_session_scope() as session:
+        session.execute(text("SELECT 1"))
+
+
+def probe_checkout() -> float:
+    started = time.perf_counter()
+    try:
+        with _get_db_engine().connect() as conn:
+            waited = time.perf_counter() - started
+            conn.execute(text("SELECT 1"))
+    except PoolTimeoutError:
+        waited = time.perf_counter() - started
+    return waited
+
+
+async def run_level(mode, streams: int, stream_seconds: float, probe_interval: float) -> dict:
+    stream_fn = held_stream if mode == "held" else scoped_stream
+    waits = []
+    done = asyncio.Event()
+
+    async def prober():
+        while not done.is_set():
+            waits.append(await asyncio.to_thread(probe_checkout))
+            await asyncio.sleep(probe_interval)
+
+    probe_task = asyncio.create_task(prober())
+    await asyncio.gather(*(asyncio.to_thread(stream_fn, stream_seconds) for _ in range(streams)))
+    done.set()
+    await probe_task
+
+    waits.sort()
+    return {
+        "probes": len(waits),
+        "p50_ms": statistics.median(waits) * 1000,
+        "p95_ms": waits[max(int(len(waits) * 0.95) - 1, 0)] * 1000,
+        "max_ms": waits[-1] * 1000,
+    }
+
+
+async def main(args):
+    # Create the engine (and its test connection) outside of the measurement
+    _get_db_engine()
+
+    print(f"{'mode':<8}{'streams':>8}{'probes':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for streams in args.streams:
+        for mode in ("held", "scoped"):
+            result = await run_level(mode, streams, args.stream_seconds, args.probe_interval)
+            print(
+                f"{mode:<8}{streams:>8}{result['probes']:>8}{result['p50_ms']:>10.1f}"
+                f"{result['p95_ms']:>10.1f}{result['max_ms']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 3, 6, 12])
+    parser.add_argument("--stream-seconds", type=float, default=5.0, help="simulated OpenAI stream duration")
+    parser.add_argument("--probe-interval", type=float, default=0.1, help="pause between pool probes")
+    asyncio.run(main(parser.parse_args()))
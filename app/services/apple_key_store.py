@@ -0,0 +1,208 @@
+import asyncio
+import base64
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicNumbers
+
+from app.core.configs import settings
+
+
+class JWKSSource(ABC):
+    """Where the JSON Web Key Set comes from"""
+
+    @abstractmethod
+    async def fetch(self) -> List[Dict[str, Any]]:
+        """Return the `keys` of the key set; raise if it cannot be fetched"""
+
+
+class HttpJWKSSource(JWKSSource):
+    """Key set served over HTTPS (appleid.apple.com/auth/keys)"""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url
+        self._http_client = httpx.AsyncClient(timeout=timeout)
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        response = await self._http_client.get(self.url)
+        response.raise_for_status()
+        keys_data = response.json()
+        if "keys" not in keys_data or not isinstance(keys_data["keys"], list):
+            raise ValueError("Invalid keys format from Apple")
+        return keys_data["keys"]
+
+
+class LocalJWKSSource(JWKSSource):
+    """
+    In-process stand-in for Apple's key endpoint (tests, benchmarks, local runs).
+
+    Keys are generated on demand; the private key is returned so identity
+    tokens can be signed with it. Fetches are counted and can be delayed, to
+    observe refresh and single-flight behaviour.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.fetches = 0
+        self._keys: Dict[str, Dict[str, Any]] = {}
+
+    def add_key(self, kid: str) -> rsa.RSAPrivateKey:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        numbers = private_key.public_key().public_numbers()
+        self._keys[kid] = {
+            "kty": "RSA",
+            "kid": kid,
+            "use": "sig",
+            "alg": "RS256",
+            "n": _b64url_uint(numbers.n),
+            "e": _b64url_uint(numbers.e),
+        }
+        return private_key
+
+    def remove_key(self, kid: str):
+        self._keys.pop(kid, None)
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        self.fetches += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return list(self._keys.values())
+
+
+class AppleKeyStore:
+    """
+    Apple's token signing keys as ready-to-use public key objects, by `kid`.
+
+    Keys are parsed once per fetch instead of on every sign-in. Once the key
+    set is older than `ttl - refresh_ahead`, the next lookup starts a
+    background refresh and is answered from the keys already held (stale
+    while revalidating), so no sign-in waits for Apple after the first one.
+    All fetches are single-flight: concurrent lookups share one request. A
+    `kid` that is not in the set (Apple rotated its keys) triggers an
+    immediate refetch, at most once per `min_refetch_interval`.
+    """
+
+    def __init__(self, source: JWKSSource, ttl: float, refresh_ahead: float, min_refetch_interval: float):
+        self.logger = logging.getLogger(__name__)
+        self.source = source
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl)
+        self.min_refetch_interval = min_refetch_interval
+        # kid -> (public key, algorithm it signs with)
+        self._keys: Dict[str, Tuple[rsa.RSAPublicKey, str]] = {}
+        self._fetched_at: Optional[float] = None
+        self._last_attempt: Optional[float] = None
+        self._fetch_task: Optional[asyncio.Task] = None
+        self.counters = {
+            "lookups": 0,
+            "fetches": 0,
+            "fetch_errors": 0,
+            "background_refreshes": 0,
+            "unknown_kid_refetches": 0,
+        }
+
+    async def get_key(self, kid: str) -> Optional[Tuple[rsa.RSAPublicKey, str]]:
+        """Public key and algorithm for `kid`, or None if Apple does not publish such a key"""
+        self.counters["lookups"] += 1
+        await self._ensure_fresh()
+
+        key = self._keys.get(kid)
+        if key is None and self._may_refetch():
+            self.counters["unknown_kid_refetches"] += 1
+            self.logger.info(f"Unknown Apple key id {kid}, refetching the key set")
+            await self._fetch_once()
+            key = self._keys.get(kid)
+        return key
+
+    async def has_keys(self) -> bool:
+        """Whether any key is available, loading the key set on first use"""
+        await self._ensure_fresh()
+        return bool(self._keys)
+
+    def key_ids(self) -> List[str]:
+        return sorted(self._keys)
+
+    async def _ensure_fresh(self):
+        if self._fetched_at is None:
+            # Nothing to serve yet: wait for the key set (failed loads are retried at the refetch rate)
+            if self._may_refetch():
+                await self._fetch_once()
+        elif (
+            time.monotonic() - self._fetched_at >= self.ttl - self.refresh_ahead
+            and not self._fetching()
+            and self._may_refetch()
+        ):
+            self.counters["background_refreshes"] += 1
+            self._start_fetch()
+
+    def _may_refetch(self) -> bool:
+        return (
+            self._fetching()
+            or self._last_attempt is None
+            or time.monotonic() - self._last_attempt >= self.min_refetch_interval
+        )
+
+    def _fetching(self) -> bool:
+        return self._fetch_task is not None and not self._fetch_task.done()
+
+    def _start_fetch(self) -> asyncio.Task:
+        if not self._fetching():
+            self._fetch_task = asyncio.create_task(self._fetch())
+        return self._fetch_task
+
+    async def _fetch_once(self):
+        # Shielded: a sign-in that gives up must not cancel the fetch others are waiting for
+        await asyncio.shield(self._start_fetch())
+
+    async def _fetch(self):
+        self._last_attempt = time.monotonic()
+        self.counters["fetches"] += 1
+        try:
+            jwks = await self.source.fetch()
+        except Exception as e:
+            # Keep serving the keys we have; the next lookup past the refresh point tries again
+            self.counters["fetch_errors"] += 1
+            self.logger.error(f"Error fetching Apple public keys: {str(e)}")
+            return
+
+        keys = {}
+        for jwk in jwks:
+            try:
+                keys[jwk["kid"]] = (self._public_key(jwk), jwk.get("alg", "RS256"))
+            except Exception as e:
+                self.logger.error(f"Skipping unusable Apple key {jwk.get('kid')}: {str(e)}")
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        self.logger.info(f"Fetched {len(keys)} Apple public keys")
+
+    @staticmethod
+    def _public_key(jwk: Dict[str, Any]) -> rsa.RSAPublicKey:
+        n = int.from_bytes(base64.urlsafe_b64decode(jwk["n"] + "=="), "big")
+        e = int.from_bytes(base64.urlsafe_b64decode(jwk["e"] + "=="), "big")
+        return RSAPublicNumbers(e, n).public_key()
+
+    def stats(self) -> dict:
+        return {
+            "keys": self.key_ids(),
+            "age_seconds": round(time.monotonic() - self._fetched_at) if self._fetched_at is not None else None,
+            "ttl_seconds": self.ttl,
+            **self.counters,
+        }
+
+
+def _b64url_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+# Create service instance
+apple_key_store = AppleKeyStore(
+    HttpJWKSSource(settings.apple_signin.APPLE_KEYS_URL),
+    ttl=settings.apple_signin.TOKEN_CACHE_TTL,
+    refresh_ahead=settings.apple_signin.KEYS_REFRESH_AHEAD_SECONDS,
+    min_refetch_interval=settings.apple_signin.KEYS_MIN_REFETCH_SECONDS
+)
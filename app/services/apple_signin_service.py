@@ -1,5 +1,6 @@
 import logging
 from typing import Dict, Any, Optional
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from uuid import UUID
 
@@ -51,6 +52,15 @@ class AppleSignInService:
             user = await self._get_or_create_user(
                 db, apple_data, verified_apple_id, verified_email
             )
+            if not user:
+                self.logger.warning(f"Apple Sign In for deactivated account: {verified_apple_id}")
+                return {
+                    "success": False,
+                    "message": "Account is deactivated",
+                    "status_code": 403,
+                    "errors": ["This account has been deactivated"],
+                    "error_code": error_codes.FORBIDDEN
+                }
             
             # Step 3: Generate authentication token
             token_data = auth_service.create_access_token(user.id)
@@ -180,22 +190,14 @@ class AppleSignInService:
             verified_email: Verified email from token (optional)
             
         Returns:
-            User object
+            User object, or None if the account is deactivated
         """
-        # Check if user already exists
-        user = user_crud.get_by_apple_id(db, verified_apple_id)
+        # One atomic upsert: creates the user with its ACCOUNT_CREATED step, or returns the
+        # existing one with the verified email applied (safe against concurrent first sign-ins)
+        user = await run_in_threadpool(user_crud.upsert_apple_user, db, verified_apple_id, verified_email)
         
-        if not user:
-            # Create new user with verified data
-            user = user_crud.create_apple_user(db, apple_data, email=verified_email)
-            self.logger.info(f"New Apple user created: {user.id}")
-        else:
-            # Update email if we got new verified email
-            if verified_email and user.email != verified_email:
-                user = user_crud.update_user_email(db, user.id, verified_email)
-                self.logger.info(f"Updated email for user: {user.id}")
-            
-            self.logger.info(f"Existing Apple user found: {user.id}")
+        if user:
+            self.logger.info(f"Apple user signed in: {user.id}")
         
         return user
 
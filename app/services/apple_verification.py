@@ -1,24 +1,19 @@
 import logging
 import jwt
-import httpx
-import json
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
-from cachetools import TTLCache
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from datetime import datetime
+from typing import Optional, Dict, Any
 
 from app.core.configs import settings
+from app.services.apple_key_store import AppleKeyStore, apple_key_store
 
 
 class AppleVerificationService:
     """Service for verifying Apple Sign In tokens"""
     
-    def __init__(self):
+    def __init__(self, key_store: AppleKeyStore = apple_key_store):
         self.logger = logging.getLogger(__name__)
-        # Cache for Apple public keys (TTL cache with 1 hour expiration)
-        self._keys_cache = TTLCache(maxsize=10, ttl=settings.apple_signin.TOKEN_CACHE_TTL)
-        self._http_client = httpx.AsyncClient(timeout=30.0)
+        # Apple public keys, parsed once and refreshed in the background
+        self.key_store = key_store
     
     async def verify_apple_token(
         self, 
@@ -54,9 +49,8 @@ class AppleVerificationService:
                 }
             
             # Step 2: Get Apple public keys
-            apple_keys = await self.get_apple_public_keys()
-            if not apple_keys.get("keys"):
-                self.logger.error(f"Failed to fetch Apple public keys: {apple_keys.get('error', 'Unknown error')}")
+            if not await self.key_store.has_keys():
+                self.logger.error("Failed to fetch Apple public keys")
                 return {
                     "valid": False,
                     "error": "Failed to fetch Apple public keys",
@@ -66,8 +60,7 @@ class AppleVerificationService:
                 }
             
             # Step 3: Decode and verify JWT token
-            self.logger.debug(f"Attempting to verify JWT signature with {len(apple_keys['keys'])} keys")
-            token_claims = await self._verify_jwt_signature(identity_token, apple_keys["keys"])
+            token_claims = await self._verify_jwt_signature(identity_token)
             if not token_claims:
                 self.logger.error(f"JWT signature verification failed for user: {apple_id}")
                 return {
@@ -117,53 +110,6 @@ class AppleVerificationService:
                 "verified": False
             }
     
-    async def get_apple_public_keys(self) -> Dict[str, Any]:
-        """
-        Fetch Apple's public keys for token verification with caching.
-        
-        Returns:
-            Dict containing Apple's current public keys
-        """
-        # Check cache first
-        cache_key = "apple_public_keys"
-        if cache_key in self._keys_cache:
-            self.logger.debug("Using cached Apple public keys")
-            return self._keys_cache[cache_key]
-        
-        self.logger.info("Fetching Apple public keys from server")
-        
-        try:
-            response = await self._http_client.get(settings.apple_signin.APPLE_KEYS_URL)
-            response.raise_for_status()
-            
-            keys_data = response.json()
-            
-            # Validate keys structure
-            if "keys" not in keys_data or not isinstance(keys_data["keys"], list):
-                raise ValueError("Invalid keys format from Apple")
-            
-            result = {
-                "keys": keys_data["keys"],
-                "fetched_at": datetime.utcnow().isoformat(),
-                "cache_duration": settings.apple_signin.TOKEN_CACHE_TTL
-            }
-            
-            # Cache the result
-            self._keys_cache[cache_key] = result
-            
-            self.logger.info(f"Fetched {len(keys_data['keys'])} Apple public keys")
-            return result
-            
-        except httpx.RequestError as e:
-            self.logger.error(f"Network error fetching Apple keys: {e}")
-            return {"keys": [], "error": f"Network error: {str(e)}"}
-        except httpx.HTTPStatusError as e:
-            self.logger.error(f"HTTP error fetching Apple keys: {e}")
-            return {"keys": [], "error": f"HTTP error: {e.response.status_code}"}
-        except Exception as e:
-            self.logger.error(f"Unexpected error fetching Apple keys: {e}")
-            return {"keys": [], "error": f"Unexpected error: {str(e)}"}
-    
     def _validate_token_structure(self, token: str) -> bool:
         """
         Validate basic JWT token structure.
@@ -189,13 +135,12 @@ class AppleVerificationService:
         
         return True
     
-    async def _verify_jwt_signature(self, token: str, apple_keys: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    async def _verify_jwt_signature(self, token: str) -> Optional[Dict[str, Any]]:
         """
         Verify JWT signature using Apple's public keys and extract claims.
         
         Args:
             token: JWT token string
-            apple_keys: List of Apple public keys
             
         Returns:
             Dict with token claims or None if invalid
@@ -212,32 +157,20 @@ class AppleVerificationService:
                 self.logger.error("Token header missing 'kid' claim")
                 return None
             
-            # Find the matching key
-            matching_key = None
-            available_kids = [key.get("kid") for key in apple_keys]
-            self.logger.debug(f"Available key IDs: {available_kids}")
-            
-            for key in apple_keys:
-                if key.get("kid") == kid:
-                    matching_key = key
-                    break
-            
+            # Find the matching key (an unknown kid refetches the keys, in case Apple rotated them)
+            matching_key = await self.key_store.get_key(kid)
             if not matching_key:
-                self.logger.error(f"No matching key found for kid: {kid}, available kids: {available_kids}")
-                return None
-            
-            # Convert JWK to PEM format for verification
-            public_key = self._jwk_to_pem(matching_key)
-            if not public_key:
-                self.logger.error("Failed to convert JWK to PEM")
+                self.logger.error(f"No matching key found for kid: {kid}, available kids: {self.key_store.key_ids()}")
                 return None
+            public_key, key_alg = matching_key
             
             # Verify and decode the token
             self.logger.debug(f"Verifying token with audience: {settings.apple_signin.BUNDLE_ID}, issuer: {settings.apple_signin.APPLE_ISSUER}")
             decoded_token = jwt.decode(
                 token,
                 public_key,
-                algorithms=[alg],
+                # Pinned to the algorithm Apple publishes for the key, not the one the token names
+                algorithms=[key_alg],
                 audience=settings.apple_signin.BUNDLE_ID,
                 issuer=settings.apple_signin.APPLE_ISSUER,
                 options={
@@ -271,41 +204,6 @@ class AppleVerificationService:
             self.logger.error(f"Unexpected error verifying JWT signature: {e}")
             return None
     
-    def _jwk_to_pem(self, jwk: Dict[str, Any]) -> Optional[str]:
-        """
-        Convert JSON Web Key to PEM format.
-        
-        Args:
-            jwk: JSON Web Key dictionary
-            
-        Returns:
-            PEM formatted public key string or None if conversion fails
-        """
-        try:
-            from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicNumbers
-            from cryptography.hazmat.primitives import serialization
-            import base64
-            
-            # Decode the modulus and exponent from the JWK
-            n = int.from_bytes(base64.urlsafe_b64decode(jwk['n'] + '=='), 'big')
-            e = int.from_bytes(base64.urlsafe_b64decode(jwk['e'] + '=='), 'big')
-            
-            # Create RSA public key
-            public_numbers = RSAPublicNumbers(e, n)
-            public_key = public_numbers.public_key()
-            
-            # Convert to PEM format
-            pem = public_key.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            )
-            
-            return pem.decode('utf-8')
-            
-        except Exception as e:
-            self.logger.error(f"Error converting JWK to PEM: {e}")
-            return None
-    
     def _validate_token_claims(self, claims: Dict[str, Any], expected_apple_id: str) -> Dict[str, Any]:
         """
         Validate token claims against expected values.
@@ -1,23 +1,51 @@
+import hashlib
 import logging
+import math
+import threading
+import time
 import jwt
 from datetime import datetime, timedelta
 from uuid import UUID
-from typing import Optional
-
+from typing import Optional, Tuple
 
+from cachetools import TLRUCache
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
 
 from app.core.configs import settings
 from app.crud.user import user_crud
+from app.crud.async_user import async_user_crud
+from app.db.async_db_sessions import async_db_session_scope
+from app.db.db_sessions import db_session_scope
+from app.services.user_identity_cache import user_identity_cache
 
 # Token settings
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 
 class AuthService:
+    """
+    JWT access tokens.
+
+    Verified tokens are kept in a small LRU keyed by the token's SHA-256
+    digest, holding the subject and the expiry, so a repeat request costs a
+    hash lookup instead of a signature check. An entry expires exactly at
+    the token's `exp` (permanent tokens only leave by LRU eviction); tokens
+    that failed verification are never cached.
+    """
 
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.cache_enabled = settings.jwt_token.VERIFIED_CACHE_ENABLED
+        # Values are (user_id, expires_at as a UNIX timestamp); the wall clock matches `exp`
+        self._verified = TLRUCache(
+            maxsize=settings.jwt_token.VERIFIED_CACHE_MAX_ENTRIES,
+            ttu=lambda _key, value, _now: value[1],
+            timer=time.time
+        )
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "rejected": 0}
     
     def create_access_token(self, user_id: UUID) -> dict:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -38,33 +66,67 @@ class AuthService:
         }
     
     def verify_token(self, token: str) -> Optional[UUID]:
+        if not self.cache_enabled:
+            verified = self._decode(token)
+            return verified[0] if verified else None
+        
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self._lock:
+            verified = self._verified.get(key)
+            self.counters["hits" if verified is not None else "misses"] += 1
+        if verified is not None:
+            return verified[0]
+        
+        verified = self._decode(token)
+        with self._lock:
+            if verified is None:
+                self.counters["rejected"] += 1
+                return None
+            self._verified[key] = verified
+        return verified[0]
+    
+    def _decode(self, token: str) -> Optional[Tuple[UUID, float]]:
+        """Verify the token once; returns the subject and when the token stops being valid"""
         try:
             # For permanent tokens, we need to handle missing 'exp' claim
             payload = jwt.decode(
                 token,
                 settings.jwt_token.JWT_SECRET_KEY,
                 algorithms=[settings.jwt_token.ALGORITHM],
-                options={"verify_exp": False}  # Don't verify expiration
+                options={"verify_exp": False}  # Checked below, without decoding a second time
             )
-            
-            # Check expiration only if token has 'exp' claim (non-permanent tokens)
-            if "exp" in payload and not payload.get("permanent", False):
-                # Re-verify with expiration check for regular tokens
-                jwt.decode(
-                    token,
-                    settings.jwt_token.JWT_SECRET_KEY,
-                    algorithms=[settings.jwt_token.ALGORITHM],
-                    options={"verify_exp": True}
-                )
-            
-            user_id_str = payload.get("sub")
-            if user_id_str is None:
-                return None
-            return UUID(user_id_str)
         except jwt.PyJWTError:
             return None
+        
+        expires_at = math.inf
+        # Check expiration only if token has 'exp' claim (non-permanent tokens)
+        if "exp" in payload and not payload.get("permanent", False):
+            try:
+                expires_at = float(payload["exp"])
+            except (TypeError, ValueError):
+                return None
+            # Same rule as PyJWT: expired from the `exp` second on
+            if expires_at <= time.time():
+                return None
+        
+        user_id_str = payload.get("sub")
+        if user_id_str is None:
+            return None
+        try:
+            return UUID(user_id_str), expires_at
+        except ValueError:
+            return None
     
-
+    def token_cache_stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "enabled": self.cache_enabled,
+                **self.counters,
+                "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else None,
+                "size": len(self._verified),
+                "max_entries": self._verified.maxsize,
+            }
 
 
 auth_service = AuthService()
@@ -84,23 +146,47 @@ async def get_user_id_from_token(
     return user_id
 
 
-def get_current_user_dependency():
-    """Factory function to create get_current_user dependency with proper import"""
-    from app.db.db_sessions import get_db
-    
-    async def get_current_user(
-        user_id: UUID = Depends(get_user_id_from_token),
-        db: Session = Depends(get_db)
-    ):
-        user = user_crud.get_by_id(db, user_id)
+def _user_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="User not found"
+    )
+
+
+def _lookup_user(user_id: UUID):
+    # The connection goes back to the pool when the scope exits; the
+    # returned (detached) user keeps its already loaded columns
+    with db_session_scope() as db:
+        return user_crud.get_by_id(db, user_id)
+
+
+async def get_current_user(
+    user_id: UUID = Depends(get_user_id_from_token)
+):
+    # A cache hit needs no DB session at all
+    user = user_identity_cache.get(user_id)
+    if user is None:
+        user = await run_in_threadpool(_lookup_user, user_id)
         if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-        return user
-    
-    return get_current_user
+            raise _user_not_found()
+        user_identity_cache.put(user)
+    return user
+
+
+async def get_current_user_async(
+    user_id: UUID = Depends(get_user_id_from_token)
+):
+    """get_current_user for endpoints that have moved to the async (asyncpg) DB path"""
+    user = user_identity_cache.get(user_id)
+    if user is None:
+        async with async_db_session_scope() as db:
+            user = await async_user_crud.get_by_id(db, user_id)
+        if user is None:
+            raise _user_not_found()
+        user_identity_cache.put(user)
+    return user
+
 
-# Create the dependency
-get_current_user = get_current_user_dependency()
+# Streaming endpoints must not keep a pooled connection for the lifetime of a
+# stream; get_current_user only holds one for the lookup itself
+get_current_user_stream = get_current_user
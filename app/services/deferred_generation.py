@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.configs import settings
+from app.crud.deferred_story_job import deferred_story_job_crud
+from app.db.db_sessions import db_session_scope
+from app.schemas.story import StoryGenerateWithHeroesRequest
+from app.services.generation_budget import GenerationBudgetPolicy, generation_budget_policy
+from app.services.llm_batch import BatchLLMProvider, BatchRequest, batch_llm_provider
+from app.services.prompt_templates import PromptTemplateEngine, prompt_template_engine
+
+
+class DeferredStoryService:
+    """
+    Low-priority stories generated through the provider's batch API.
+
+    Requests are queued in the deferred_story_jobs table and answered with a
+    job ID. A background task submits queued jobs in batches during the
+    off-peak window, keeping them away from the interactive rate limits and
+    at batch pricing, and saves the stories of finished batches. Submission
+    is claimed row by row, so several instances can run the task.
+    """
+
+    def __init__(
+        self,
+        provider: BatchLLMProvider = batch_llm_provider,
+        prompts: PromptTemplateEngine = prompt_template_engine,
+        budget: GenerationBudgetPolicy = generation_budget_policy
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.provider = provider
+        self.prompts = prompts
+        self.budget = budget
+        self.enabled = settings.deferred_generation.ENABLED
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"batches_submitted": 0, "jobs_submitted": 0, "completed": 0, "failed": 0, "errors": 0}
+
+    @staticmethod
+    def in_offpeak_window(now: Optional[datetime] = None) -> bool:
+        config = settings.deferred_generation
+        start, end = config.OFFPEAK_START_HOUR, config.OFFPEAK_END_HOUR
+        if start == end:
+            return True
+        hour = (now or datetime.now(timezone.utc)).hour
+        # The window may wrap around midnight, e.g. 22 -> 5
+        return start <= hour < end if start < end else hour >= start or hour < end
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+            self.logger.info(f"Deferred story generation started with {self.provider.name} batch provider")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                self.counters["errors"] += 1
+                self.logger.error(f"Deferred story generation pass failed: {str(e)}")
+            await asyncio.sleep(settings.deferred_generation.POLL_INTERVAL_SECONDS)
+
+    async def tick(self):
+        """Collect finished batches, then submit queued jobs if inside the off-peak window"""
+        await self.collect()
+        if self.in_offpeak_window():
+            await self.submit()
+
+    async def collect(self):
+        batch_ids = await run_in_threadpool(self._db_call, deferred_story_job_crud.submitted_batch_ids)
+        for batch_id in batch_ids:
+            results = await self.provider.poll(batch_id)
+            if results is None:
+                continue
+            counts = await run_in_threadpool(self._db_call, deferred_story_job_crud.complete_batch, batch_id, results)
+            self.counters["completed"] += counts["completed"]
+            self.counters["failed"] += counts["failed"]
+
+    async def submit(self):
+        config = settings.deferred_generation
+        await run_in_threadpool(
+            self._db_call, deferred_story_job_crud.requeue_stale_claims, timedelta(seconds=config.STALE_CLAIM_SECONDS)
+        )
+        while True:
+            jobs = await run_in_threadpool(self._db_call, deferred_story_job_crud.claim_queued, config.BATCH_SIZE)
+            if not jobs:
+                return
+            job_ids = [job_id for job_id, _ in jobs]
+            try:
+                requests = [self._batch_request(str(job_id), request) for job_id, request in jobs]
+                batch_id = await self.provider.submit(requests)
+            except Exception:
+                await run_in_threadpool(self._db_call, deferred_story_job_crud.requeue, job_ids)
+                raise
+            await run_in_threadpool(self._db_call, deferred_story_job_crud.mark_submitted, job_ids, batch_id)
+            self.counters["batches_submitted"] += 1
+            self.counters["jobs_submitted"] += len(jobs)
+            if len(jobs) < config.BATCH_SIZE:
+                return
+
+    def _batch_request(self, custom_id: str, request: dict) -> BatchRequest:
+        story_params = StoryGenerateWithHeroesRequest.model_validate(request)
+        return BatchRequest(
+            custom_id=custom_id,
+            messages=self.prompts.build_messages(story_params),
+            max_tokens=self.budget.max_tokens(story_params),
+            temperature=settings.openai.TEMPERATURE
+        )
+
+    @staticmethod
+    def _db_call(method, *args):
+        with db_session_scope() as db:
+            return method(db, *args)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "provider": self.provider.name,
+            "in_offpeak_window": self.in_offpeak_window(),
+            "running": self._task is not None and not self._task.done(),
+            **self.counters,
+        }
+
+
+# Create service instance
+deferred_story_service = DeferredStoryService()
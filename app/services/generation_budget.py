@@ -0,0 +1,81 @@
+import logging
+import math
+from typing import Callable, Dict, Optional, Tuple
+
+from app.core.configs import settings
+from app.schemas.story import StoryGenerateWithHeroesRequest
+
+
+# Target word range per StoryLength, matching the length guidance in the prompt
+STORY_LENGTH_WORDS: Dict[int, Tuple[int, int]] = {
+    1: (100, 200),
+    2: (200, 300),
+    3: (300, 400),
+    4: (400, 500),
+    5: (500, 600),
+}
+
+# Average completion tokens per word of children's prose (gpt-4o tokenizer)
+TOKENS_PER_WORD: Dict[str, float] = {
+    "en": 1.35,
+    "es": 1.6,
+    "fr": 1.6,
+    "de": 1.7,
+    "ru": 2.5,
+}
+
+SENTENCE_ENDINGS = (".", "!", "?", "…")
+CLOSING_QUOTES = "\"'»”)"
+
+
+class SentenceBoundaryStop:
+    """
+    Stream stop condition: true at the first sentence end once `target_words`
+    words have been generated. Fed every streamed delta in order.
+    """
+
+    def __init__(self, target_words: int):
+        self.target_words = target_words
+        self.words = 0
+        self._in_word = False
+
+    def __call__(self, chunk: str) -> bool:
+        if not chunk:
+            return False
+        words = len(chunk.split())
+        if words and self._in_word and not chunk[0].isspace():
+            # The delta continues the word the previous one ended with
+            words -= 1
+        self.words += words
+        self._in_word = not chunk[-1].isspace()
+
+        if self.words < self.target_words:
+            return False
+        return chunk.rstrip().rstrip(CLOSING_QUOTES).endswith(SENTENCE_ENDINGS)
+
+
+class GenerationBudgetPolicy:
+    """Completion token budget and early stop for a story request"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def max_tokens(self, story_params: StoryGenerateWithHeroesRequest) -> int:
+        """max_tokens from the upper word bound of the story length and the language's token density"""
+        if not settings.story_generation.BUDGET_ENABLED:
+            return settings.openai.MAX_TOKENS
+        _, max_words = STORY_LENGTH_WORDS[story_params.story_length.value]
+        tokens_per_word = TOKENS_PER_WORD.get(story_params.language.value, max(TOKENS_PER_WORD.values()))
+        budget = math.ceil(max_words * tokens_per_word * settings.story_generation.BUDGET_HEADROOM)
+        return min(budget, settings.story_generation.BUDGET_MAX_TOKENS)
+
+    def stop_condition(self, story_params: StoryGenerateWithHeroesRequest) -> Optional[Callable[[str], bool]]:
+        """Fresh stop condition for one stream, or None when early stop is disabled"""
+        if not settings.story_generation.EARLY_STOP_ENABLED:
+            return None
+        _, max_words = STORY_LENGTH_WORDS[story_params.story_length.value]
+        return SentenceBoundaryStop(max_words)
+
+
+# Create service instance
+generation_budget_policy = GenerationBudgetPolicy()
@@ -0,0 +1,297 @@
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, delete, func, select, text, update
+
+from app.core.configs import settings
+from app.db.async_db_sessions import async_db_session_scope
+from app.db.models.generation_lease import GenerationLease
+from app.services.llm_providers import GenerationStats
+
+
+RATE_WINDOW_SECONDS = 60
+TOKEN_WINDOW_SECONDS = 24 * 3600
+
+
+class QuotaExceededError(Exception):
+    """A user limit rejected the generation before it reached the LLM"""
+
+    def __init__(self, reason: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.reason = reason  # concurrency | rate | daily_tokens
+        self.retry_after = retry_after
+
+
+class QuotaLimits:
+    """Per-user limits; any of them <= 0 is disabled"""
+
+    def __init__(self, max_concurrent: int, requests_per_minute: int, daily_tokens: int, lease_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.requests_per_minute = requests_per_minute
+        self.daily_tokens = daily_tokens
+        self.lease_timeout = lease_timeout
+
+    def check(
+        self,
+        active: int,
+        requests: int,
+        oldest_request_age: Optional[float],
+        tokens: int,
+        oldest_tokens_age: Optional[float]
+    ):
+        """Raise QuotaExceededError for the first limit the current usage does not leave room in"""
+        if 0 < self.max_concurrent <= active:
+            raise QuotaExceededError(
+                "concurrency", f"Only {self.max_concurrent} story generations can run at the same time"
+            )
+        if 0 < self.requests_per_minute <= requests:
+            raise QuotaExceededError(
+                "rate",
+                f"No more than {self.requests_per_minute} story generations per minute",
+                _retry_after(RATE_WINDOW_SECONDS, oldest_request_age)
+            )
+        if 0 < self.daily_tokens <= tokens:
+            raise QuotaExceededError(
+                "daily_tokens",
+                f"Daily story allowance of {self.daily_tokens} tokens used up",
+                _retry_after(TOKEN_WINDOW_SECONDS, oldest_tokens_age)
+            )
+
+
+class QuotaStore(ABC):
+    """Where quota usage lives; begin() must check and book atomically per user"""
+
+    @abstractmethod
+    async def begin(self, user_id: UUID, limits: QuotaLimits) -> UUID:
+        """Book a generation for `user_id` and return its lease ID, or raise QuotaExceededError"""
+
+    @abstractmethod
+    async def finish(self, user_id: UUID, lease_id: UUID, tokens: int):
+        """End the lease and count `tokens` against the daily allowance"""
+
+
+class InMemoryQuotaStore(QuotaStore):
+    """
+    Usage of this process only: limits apply per instance.
+
+    Users with nothing left in any window are forgotten by a sweep over all
+    users, run at most once per rate window.
+    """
+
+    def __init__(self):
+        # user_id -> active leases (lease_id -> start), (start, 1) per request, (finish time, tokens)
+        self._active: Dict[UUID, Dict[UUID, float]] = {}
+        self._requests: Dict[UUID, Deque[Tuple[float, int]]] = {}
+        self._tokens: Dict[UUID, Deque[Tuple[float, int]]] = {}
+        self._last_sweep = time.monotonic()
+
+    async def begin(self, user_id: UUID, limits: QuotaLimits) -> UUID:
+        # No await between the check and the booking, so this is atomic on the event loop
+        now = time.monotonic()
+        if now - self._last_sweep >= RATE_WINDOW_SECONDS:
+            self._sweep(now, limits.lease_timeout)
+        self._prune(user_id, now, limits.lease_timeout)
+        active = self._active.setdefault(user_id, {})
+        requests = self._requests.setdefault(user_id, deque())
+        tokens = self._tokens.setdefault(user_id, deque())
+
+        limits.check(
+            active=len(active),
+            requests=len(requests),
+            oldest_request_age=now - requests[0][0] if requests else None,
+            tokens=sum(used for _, used in tokens),
+            oldest_tokens_age=now - tokens[0][0] if tokens else None
+        )
+
+        lease_id = uuid.uuid4()
+        active[lease_id] = now
+        requests.append((now, 1))
+        return lease_id
+
+    async def finish(self, user_id: UUID, lease_id: UUID, tokens: int):
+        now = time.monotonic()
+        self._active.get(user_id, {}).pop(lease_id, None)
+        if tokens:
+            self._tokens.setdefault(user_id, deque()).append((now, tokens))
+        self._prune(user_id, now)
+
+    def user_count(self) -> int:
+        """Users with usage still held in memory"""
+        return len(self._active.keys() | self._requests.keys() | self._tokens.keys())
+
+    def _sweep(self, now: float, lease_timeout: float):
+        self._last_sweep = now
+        for user_id in self._active.keys() | self._requests.keys() | self._tokens.keys():
+            self._prune(user_id, now, lease_timeout)
+
+    def _prune(self, user_id: UUID, now: float, lease_timeout: Optional[float] = None):
+        """Drop what left the windows (and leases past `lease_timeout`), and the user once nothing is left"""
+        active = self._active.get(user_id)
+        if active and lease_timeout is not None:
+            for lease_id, started in list(active.items()):
+                if now - started > lease_timeout:
+                    del active[lease_id]
+        requests = _trim(self._requests.get(user_id, deque()), now - RATE_WINDOW_SECONDS)
+        tokens = _trim(self._tokens.get(user_id, deque()), now - TOKEN_WINDOW_SECONDS)
+        if not active and not requests and not tokens:
+            self._active.pop(user_id, None)
+            self._requests.pop(user_id, None)
+            self._tokens.pop(user_id, None)
+
+
+class PostgresQuotaStore(QuotaStore):
+    """Usage shared by all instances through the generation_leases table"""
+
+    async def begin(self, user_id: UUID, limits: QuotaLimits) -> UUID:
+        now = _utcnow()
+        async with async_db_session_scope() as db:
+            async with db.begin():
+                # Serialise concurrent checks of the same user across instances until commit
+                await db.execute(
+                    text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))"), {"key": str(user_id)}
+                )
+                rate_since = now - timedelta(seconds=RATE_WINDOW_SECONDS)
+                row = (await db.execute(
+                    select(
+                        func.count().filter(and_(
+                            GenerationLease.finished_at.is_(None),
+                            GenerationLease.started_at >= now - timedelta(seconds=limits.lease_timeout)
+                        )).label("active"),
+                        func.count().filter(GenerationLease.started_at >= rate_since).label("requests"),
+                        func.min(GenerationLease.started_at).filter(
+                            GenerationLease.started_at >= rate_since
+                        ).label("oldest_request"),
+                        func.coalesce(func.sum(GenerationLease.tokens), 0).label("tokens"),
+                        func.min(GenerationLease.started_at).filter(
+                            GenerationLease.tokens.isnot(None)
+                        ).label("oldest_tokens"),
+                    ).where(
+                        GenerationLease.user_id == user_id,
+                        GenerationLease.started_at >= now - timedelta(seconds=TOKEN_WINDOW_SECONDS)
+                    )
+                )).one()
+
+                limits.check(
+                    active=row.active,
+                    requests=row.requests,
+                    oldest_request_age=_age(now, row.oldest_request),
+                    tokens=row.tokens,
+                    oldest_tokens_age=_age(now, row.oldest_tokens)
+                )
+
+                lease = GenerationLease(user_id=user_id, started_at=now)
+                db.add(lease)
+                await db.flush()
+                return lease.id
+
+    async def finish(self, user_id: UUID, lease_id: UUID, tokens: int):
+        now = _utcnow()
+        async with async_db_session_scope() as db:
+            async with db.begin():
+                await db.execute(
+                    update(GenerationLease)
+                    .where(GenerationLease.id == lease_id)
+                    .values(finished_at=now, tokens=tokens)
+                )
+                # Rows older than the token window no longer count for anything
+                await db.execute(
+                    delete(GenerationLease).where(
+                        GenerationLease.user_id == user_id,
+                        GenerationLease.started_at < now - timedelta(seconds=TOKEN_WINDOW_SECONDS)
+                    )
+                )
+
+
+class GenerationQuotaService:
+    """Per-user concurrency, rate and daily token limits for story generation"""
+
+    def __init__(self, store: QuotaStore, limits: QuotaLimits, enabled: bool = True):
+        self.logger = logging.getLogger(__name__)
+        self.store = store
+        self.limits = limits
+        self.enabled = enabled
+        self.counters = {"granted": 0, "concurrency": 0, "rate": 0, "daily_tokens": 0, "store_errors": 0}
+
+    async def acquire(self, user_id: UUID) -> Optional[UUID]:
+        """Book a generation for the user; raises QuotaExceededError. Returns the lease ID to release"""
+        if not self.enabled:
+            return None
+        try:
+            lease_id = await self.store.begin(user_id, self.limits)
+        except QuotaExceededError as e:
+            self.counters[e.reason] += 1
+            self.logger.info(f"Quota rejected story generation for user {user_id}: {e.reason}")
+            raise
+        except Exception as e:
+            # A broken quota store must not take story generation down with it
+            self.counters["store_errors"] += 1
+            self.logger.error(f"Quota store unavailable, allowing generation for user {user_id}: {str(e)}")
+            return None
+        self.counters["granted"] += 1
+        return lease_id
+
+    async def release(self, user_id: UUID, lease_id: Optional[UUID], stats: Optional[GenerationStats] = None):
+        """End the lease and count the tokens the generation used"""
+        if lease_id is None:
+            return
+        tokens = 0
+        if stats is not None:
+            tokens = (stats.prompt_tokens or 0) + (stats.completion_tokens or 0)
+        try:
+            await self.store.finish(user_id, lease_id, tokens)
+        except Exception as e:
+            self.counters["store_errors"] += 1
+            self.logger.error(f"Failed to release quota lease {lease_id} for user {user_id}: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "store": type(self.store).__name__,
+            **self.counters,
+        }
+
+
+def _trim(window: Deque[Tuple[float, int]], since: float) -> Deque[Tuple[float, int]]:
+    while window and window[0][0] < since:
+        window.popleft()
+    return window
+
+
+def _retry_after(window_seconds: float, oldest_age: Optional[float]) -> Optional[float]:
+    return max(window_seconds - oldest_age, 0) if oldest_age is not None else None
+
+
+def _age(now: datetime, moment: Optional[datetime]) -> Optional[float]:
+    return (now - moment).total_seconds() if moment is not None else None
+
+
+def _utcnow() -> datetime:
+    # Timestamps are stored as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def build_quota_store() -> QuotaStore:
+    if settings.quota.STORE == "postgres":
+        return PostgresQuotaStore()
+    if settings.quota.STORE != "memory":
+        raise ValueError(f"Unknown QUOTA_STORE: {settings.quota.STORE}")
+    return InMemoryQuotaStore()
+
+
+# Create service instance
+generation_quota_service = GenerationQuotaService(
+    build_quota_store(),
+    QuotaLimits(
+        max_concurrent=settings.quota.MAX_CONCURRENT,
+        requests_per_minute=settings.quota.REQUESTS_PER_MINUTE,
+        daily_tokens=settings.quota.DAILY_TOKENS,
+        lease_timeout=settings.quota.LEASE_TIMEOUT_SECONDS
+    ),
+    enabled=settings.quota.ENABLED
+)
@@ -0,0 +1,165 @@
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from app.core.configs import settings
+from app.services.llm_providers import GenerationStats, LLMProvider, OpenAIProvider, llm_provider, openai_provider
+
+
+class BatchRequest:
+    """One chat completion of a batch; `custom_id` ties the result back to its job"""
+
+    def __init__(self, custom_id: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float):
+        self.custom_id = custom_id
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+
+class BatchResult:
+    def __init__(
+        self,
+        custom_id: str,
+        content: Optional[str] = None,
+        stats: Optional[GenerationStats] = None,
+        error: Optional[str] = None
+    ):
+        self.custom_id = custom_id
+        self.content = content
+        self.stats = stats or GenerationStats()
+        self.error = error
+
+
+class BatchLLMProvider(ABC):
+    """Chat completions submitted in bulk and collected later, at batch pricing"""
+
+    name = "base"
+
+    @abstractmethod
+    async def submit(self, requests: List[BatchRequest]) -> str:
+        """Submit the requests and return the batch ID"""
+
+    @abstractmethod
+    async def poll(self, batch_id: str) -> Optional[List[BatchResult]]:
+        """Results of a finished batch (one per request), or None while it is still running"""
+
+
+class OpenAIBatchProvider(BatchLLMProvider):
+    """OpenAI Batch API: a JSONL file of chat completions, completed within 24 hours"""
+
+    name = "openai"
+
+    RUNNING_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+
+    def __init__(self, provider: OpenAIProvider):
+        self.logger = logging.getLogger(__name__)
+        self.provider = provider
+
+    async def submit(self, requests: List[BatchRequest]) -> str:
+        lines = [
+            json.dumps({
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.provider.model,
+                    "messages": request.messages,
+                    "max_tokens": request.max_tokens,
+                    "temperature": request.temperature,
+                },
+            }, ensure_ascii=False)
+            for request in requests
+        ]
+        batch_file = await self.provider.client.files.create(
+            file=("stories.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = await self.provider.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        self.logger.info(f"Submitted OpenAI batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    async def poll(self, batch_id: str) -> Optional[List[BatchResult]]:
+        batch = await self.provider.client.batches.retrieve(batch_id)
+        if batch.status in self.RUNNING_STATUSES:
+            return None
+
+        results: List[BatchResult] = []
+        # Expired batches still have output for the requests that made it
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await self.provider.client.files.content(file_id)
+                results.extend(self._parse_line(line) for line in content.text.splitlines() if line.strip())
+        if batch.status != "completed":
+            self.logger.warning(f"OpenAI batch {batch_id} ended as {batch.status} with {len(results)} results")
+        return results
+
+    def _parse_line(self, line: str) -> BatchResult:
+        record = json.loads(line)
+        custom_id = record["custom_id"]
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body", {}).get("error") or {}
+            return BatchResult(custom_id, error=error.get("message") or "Batch request failed")
+
+        body = response["body"]
+        stats = GenerationStats()
+        stats.model = body.get("model")
+        usage = body.get("usage")
+        if usage:
+            details = usage.get("prompt_tokens_details") or {}
+            stats.set_usage(usage["prompt_tokens"], usage["completion_tokens"], details.get("cached_tokens") or 0)
+        return BatchResult(custom_id, content=body["choices"][0]["message"]["content"], stats=stats)
+
+
+class LocalBatchProvider(BatchLLMProvider):
+    """
+    In-process stand-in for a batch API (fake provider, tests, local runs).
+
+    Submitted requests are kept in memory and run through a regular provider
+    on the first poll, so the deferred pipeline works end to end offline.
+    """
+
+    name = "local"
+
+    def __init__(self, provider: LLMProvider):
+        self.logger = logging.getLogger(__name__)
+        self.provider = provider
+        self._batches: Dict[str, List[BatchRequest]] = {}
+
+    async def submit(self, requests: List[BatchRequest]) -> str:
+        batch_id = f"local-{uuid.uuid4()}"
+        self._batches[batch_id] = requests
+        return batch_id
+
+    async def poll(self, batch_id: str) -> Optional[List[BatchResult]]:
+        requests = self._batches.pop(batch_id, None)
+        if requests is None:
+            # Lost with a restart: report every request of the batch as unknown
+            return []
+        results = []
+        for request in requests:
+            stats = GenerationStats()
+            stats.model = self.provider.model
+            try:
+                content = await self.provider.complete(request.messages, request.max_tokens, request.temperature, stats)
+                results.append(BatchResult(request.custom_id, content=content, stats=stats))
+            except Exception as e:
+                results.append(BatchResult(request.custom_id, error=str(e)))
+        return results
+
+
+def build_batch_provider() -> BatchLLMProvider:
+    """Batch provider matching LLM_PROVIDER"""
+    if settings.llm.PROVIDER == "openai":
+        return OpenAIBatchProvider(openai_provider)
+    return LocalBatchProvider(llm_provider)
+
+
+# Create service instance
+batch_llm_provider = build_batch_provider()
@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+from abc import ABC, abstractmethod
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+
+from app.core.configs import settings
+
+
+class LLMError(Exception):
+    """Base error raised by LLM providers"""
+
+
+class LLMRateLimitError(LLMError):
+    """Provider rejected the call because of rate limits (HTTP 429)"""
+
+    def __init__(self, message: str, retry_after: float = 5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GenerationStats:
+    """Token usage and timing of one generation, filled in while it runs"""
+
+    def __init__(self):
+        self.model: Optional[str] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cached_tokens: Optional[int] = None
+        self.ttft_ms: Optional[int] = None
+        self.generation_ms: Optional[int] = None
+
+    def set_usage(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class LLMProvider(ABC):
+    """Chat-completion backend used by StoryGenerationService"""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.logger = logging.getLogger(__name__)
+        self.model = model
+
+    @abstractmethod
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        stats: Optional[GenerationStats] = None
+    ) -> str:
+        """Return the full completion text; token usage is recorded on `stats`"""
+
+    @abstractmethod
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Yield completion text deltas; closing the generator must release the upstream stream.
+        Token usage is recorded on `stats` once the stream is complete.
+        """
+
+    @abstractmethod
+    async def stream_variants(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        n: int,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        Yield (variant index, text delta) pairs of `n` completions of the same prompt, sent as one call.
+        The prompt is paid once; `stats` gets the usage of all variants together.
+        """
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__(model)
+        self._api_key = api_key
+        self._client = None
+
+    @property
+    def client(self):
+        # Created lazily so the fake provider works without OpenAI credentials
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=self._api_key)
+        return self._client
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        stats: Optional[GenerationStats] = None
+    ) -> str:
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+        except RateLimitError as e:
+            raise LLMRateLimitError(str(e), self._retry_after(e)) from e
+        except (APIConnectionError, InternalServerError) as e:
+            # Timeouts, dropped connections and 5xx: the provider is failing, not the request
+            raise LLMError(str(e)) from e
+        if stats is not None and response.usage:
+            self._record_usage(stats, response.usage)
+        return response.choices[0].message.content
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[str, None]:
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                # The last chunk carries token usage (with no choices)
+                stream_options={"include_usage": True}
+            )
+        except RateLimitError as e:
+            raise LLMRateLimitError(str(e), self._retry_after(e)) from e
+        except (APIConnectionError, InternalServerError) as e:
+            raise LLMError(str(e)) from e
+
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.usage and stats is not None:
+                    self._record_usage(stats, chunk.usage)
+        except (APIConnectionError, InternalServerError) as e:
+            raise LLMError(str(e)) from e
+        finally:
+            await stream.close()
+
+    async def stream_variants(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        n: int,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                n=n,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        except RateLimitError as e:
+            raise LLMRateLimitError(str(e), self._retry_after(e)) from e
+        except (APIConnectionError, InternalServerError) as e:
+            raise LLMError(str(e)) from e
+
+        try:
+            async for chunk in stream:
+                # Deltas of the n choices arrive interleaved, each tagged with its choice index
+                for choice in chunk.choices:
+                    if choice.delta.content:
+                        yield choice.index, choice.delta.content
+                if chunk.usage and stats is not None:
+                    self._record_usage(stats, chunk.usage)
+        except (APIConnectionError, InternalServerError) as e:
+            raise LLMError(str(e)) from e
+        finally:
+            await stream.close()
+
+    @staticmethod
+    def _record_usage(stats: GenerationStats, usage):
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+        stats.set_usage(usage.prompt_tokens, usage.completion_tokens, cached_tokens)
+
+    @staticmethod
+    def _retry_after(error: Exception, default: float = 5.0) -> float:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        value: Optional[str] = headers.get("retry-after")
+        try:
+            return float(value) if value is not None else default
+        except ValueError:
+            return default
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Local stand-in that streams deterministic text with no network access.
+
+    Output depends only on the prompt, so repeated runs are comparable.
+    Latency (time to first token, inter-token delay) and faults (random
+    failures, injected 429s) are configurable for load tests.
+    """
+
+    name = "fake"
+
+    WORDS = (
+        "once", "upon", "a", "time", "in", "the", "enchanted", "forest", "brave", "little",
+        "friends", "found", "shimmering", "lantern", "that", "whispered", "kind", "secrets",
+        "and", "together", "they", "learned", "to", "share", "their", "magic", "with", "everyone",
+    )
+
+    def __init__(
+        self,
+        model: str,
+        ttft_ms: int,
+        inter_token_ms: int,
+        failure_rate: float,
+        rate_limit_rate: float,
+        seed: int
+    ):
+        super().__init__(model)
+        self.ttft_ms = ttft_ms
+        self.inter_token_ms = inter_token_ms
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._faults = random.Random(seed)
+        self._seen_prefixes = set()
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        stats: Optional[GenerationStats] = None
+    ) -> str:
+        return "".join([chunk async for chunk in self.stream(messages, max_tokens, temperature, stats)])
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[str, None]:
+        self._inject_faults()
+        cached_tokens = self._cached_prefix_tokens(messages)
+        # A cached prefix makes the first token arrive sooner, like on the real API
+        await asyncio.sleep(self.ttft_ms / 1000 * (0.5 if cached_tokens else 1))
+
+        words = self._words_for(messages)
+        for index in range(max_tokens):
+            if index:
+                await asyncio.sleep(self.inter_token_ms / 1000)
+            yield self._next_word(words, index)
+
+        if stats is not None:
+            stats.set_usage(self._count_tokens(messages), max_tokens, cached_tokens)
+
+    async def stream_variants(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        n: int,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        self._inject_faults()
+        cached_tokens = self._cached_prefix_tokens(messages)
+        await asyncio.sleep(self.ttft_ms / 1000 * (0.5 if cached_tokens else 1))
+
+        # Variant 0 is the text stream() produces; the choices advance in lockstep, like on the real API
+        variants = [self._words_for(messages, variant) for variant in range(n)]
+        for index in range(max_tokens):
+            if index:
+                await asyncio.sleep(self.inter_token_ms / 1000)
+            for variant, words in enumerate(variants):
+                yield variant, self._next_word(words, index)
+
+        if stats is not None:
+            stats.set_usage(self._count_tokens(messages), max_tokens * n, cached_tokens)
+
+    def _next_word(self, words: random.Random, index: int) -> str:
+        # Sentences of 12 words: capitalized first word, full stop after the last
+        word = words.choice(self.WORDS)
+        if index % 12 == 0:
+            word = word.capitalize()
+        if index % 12 == 11:
+            word += "."
+        return word if index == 0 else " " + word
+
+    def _cached_prefix_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Mimic OpenAI prompt caching: a repeated system message of 1024+ tokens is cached in 128-token blocks"""
+        prefix_tokens = self._count_tokens(messages[:1])
+        digest = hashlib.sha256(messages[0]["content"].encode("utf-8")).digest()
+        seen = digest in self._seen_prefixes
+        self._seen_prefixes.add(digest)
+        if not seen or prefix_tokens < 1024:
+            return 0
+        return prefix_tokens // 128 * 128
+
+    @staticmethod
+    def _count_tokens(messages: List[Dict[str, str]]) -> int:
+        return sum(math.ceil(len(message["content"]) / 4) for message in messages)
+
+    def _inject_faults(self):
+        roll = self._faults.random()
+        if roll < self.rate_limit_rate:
+            raise LLMRateLimitError("Fake provider: injected rate limit", retry_after=1.0)
+        if roll < self.rate_limit_rate + self.failure_rate:
+            raise LLMError("Fake provider: injected failure")
+
+    @staticmethod
+    def _words_for(messages: List[Dict[str, str]], variant: int = 0) -> random.Random:
+        seed = "".join(message["content"] for message in messages) + (f"#{variant}" if variant else "")
+        digest = hashlib.sha256(seed.encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def build_llm_provider() -> LLMProvider:
+    """Instantiate the provider selected by LLM_PROVIDER"""
+    provider_name = settings.llm.PROVIDER
+    if provider_name == "openai":
+        return openai_provider
+    if provider_name == "fake":
+        logging.warning("Using the fake LLM provider: stories are placeholder text")
+        return FakeLLMProvider(
+            model="fake",
+            ttft_ms=settings.llm.FAKE_TTFT_MS,
+            inter_token_ms=settings.llm.FAKE_INTER_TOKEN_MS,
+            failure_rate=settings.llm.FAKE_FAILURE_RATE,
+            rate_limit_rate=settings.llm.FAKE_RATE_LIMIT_RATE,
+            seed=settings.llm.FAKE_SEED,
+        )
+    raise ValueError(f"Unknown LLM provider: {provider_name}")
+
+
+# Shared OpenAI client (also used by the OpenAI health checks)
+openai_provider = OpenAIProvider(api_key=settings.openai.API_KEY, model=settings.openai.MODEL)
+
+# Provider used for story generation
+llm_provider = build_llm_provider()
@@ -0,0 +1,434 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.configs import settings
+from app.services.llm_providers import GenerationStats, LLMError, LLMProvider, LLMRateLimitError, llm_provider
+from app.services.llm_scheduler import BudgetReservation, TokenBudgetScheduler, llm_scheduler
+
+
+class CircuitOpenError(LLMError):
+    """The provider is considered unhealthy and calls are rejected without trying"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"Story generation is temporarily unavailable, retry in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError unless a call may go through right now.
+        Returns True if the call is the half-open probe (and must `release()` it).
+        """
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.open_seconds:
+                raise CircuitOpenError(self.open_seconds - elapsed)
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(1.0)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """Free the half-open probe slot of a probe call that ended without an outcome (e.g. cancelled)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.warning(f"LLM circuit opened after {self._failures} consecutive failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class ResilientLLM:
+    """
+    Retry, hedging and circuit breaking around an LLMProvider.
+
+    - Calls that fail before the first chunk was emitted are retried with
+      jittered exponential backoff; once text reached the client a failure is final.
+    - If the first chunk takes longer than the configured percentile of recent
+      time-to-first-token, a second (hedged) request is started and whichever
+      produces a chunk first wins; the other is cancelled.
+    - While the circuit is open calls fail fast with CircuitOpenError.
+
+    Every upstream attempt (including hedges) is admitted through the RPM/TPM scheduler.
+    """
+
+    def __init__(self, provider: LLMProvider, scheduler: TokenBudgetScheduler):
+        self.logger = logging.getLogger(__name__)
+        self.provider = provider
+        self.scheduler = scheduler
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.llm.CIRCUIT_FAILURE_THRESHOLD,
+            open_seconds=settings.llm.CIRCUIT_OPEN_SECONDS,
+        )
+        self._ttft_samples: Deque[float] = deque(maxlen=500)
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "succeeded_first_try": 0,
+            "succeeded_after_retry": 0,
+            "retries": 0,
+            "hedges_launched": 0,
+            "hedges_won": 0,
+            "circuit_rejected": 0,
+            "failed_before_first_chunk": 0,
+            "failed_mid_stream": 0,
+            "stopped_early": 0,
+            "cancelled_streams": 0,
+            "tokens_saved_estimate": 0,
+        }
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        estimated_tokens: int,
+        stats: Optional[GenerationStats] = None
+    ) -> str:
+        """Non-streaming call with retries and circuit breaking (no hedging)"""
+        probe = self._before_call()
+        try:
+            attempt = 0
+            while True:
+                reservation = await self.scheduler.acquire(estimated_tokens)
+                try:
+                    content = await self.provider.complete(messages, max_tokens, temperature, stats)
+                except Exception as e:
+                    if not await self._handle_failure(e, attempt):
+                        raise
+                    attempt += 1
+                    continue
+                self._record_success(attempt)
+                if stats is not None:
+                    stats.model = self.provider.model
+                self._settle(reservation, stats)
+                return content
+        finally:
+            if probe:
+                self.breaker.release()
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        estimated_tokens: int,
+        stats: Optional[GenerationStats] = None,
+        stop_when: Optional[Callable[[str], bool]] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streaming call; retries and hedging only apply before the first chunk.
+        If `stop_when` returns True for a yielded chunk, the upstream stream is closed right after it.
+        """
+        probe = self._before_call()
+        started = time.monotonic()
+        chunks = 0
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    first_chunk, upstream, reservation = await self._first_chunk_with_hedge(
+                        messages, max_tokens, temperature, estimated_tokens, stats
+                    )
+                    break
+                except Exception as e:
+                    if not await self._handle_failure(e, attempt):
+                        raise
+                    attempt += 1
+
+            ttft = time.monotonic() - started
+            self._ttft_samples.append(ttft)
+            if stats is not None:
+                stats.model = self.provider.model
+                stats.ttft_ms = round(ttft * 1000)
+            stopped = False
+            try:
+                if first_chunk:
+                    chunks += 1
+                    yield first_chunk
+                    stopped = stop_when is not None and stop_when(first_chunk)
+                if not stopped:
+                    async for chunk in upstream:
+                        chunks += 1
+                        yield chunk
+                        if stop_when is not None and stop_when(chunk):
+                            stopped = True
+                            break
+            except Exception as e:
+                self.counters["failed_mid_stream"] += 1
+                self._record_failure(e)
+                self._estimate_usage(max_tokens, estimated_tokens, chunks, stats)
+                raise
+            finally:
+                await upstream.aclose()
+            self._record_success(attempt)
+            if stopped:
+                self._record_stopped_early(max_tokens, estimated_tokens, chunks, stats)
+            self._settle(reservation, stats)
+        except (asyncio.CancelledError, GeneratorExit):
+            # Nobody is listening any more; the upstream stream is closed above
+            self._record_cancelled(max_tokens, estimated_tokens, chunks, stats)
+            raise
+        finally:
+            if probe:
+                self.breaker.release()
+
+    async def stream_variants(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        n: int,
+        estimated_tokens: int,
+        stats: Optional[GenerationStats] = None,
+        stop_when: Optional[List[Callable[[str], bool]]] = None
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        `n` completions of one prompt in a single upstream call, as (variant index, delta) pairs.
+
+        Retries apply before the first delta; there is no hedging, as a hedge would
+        pay for all n completions again. A variant whose stop condition (`stop_when[i]`)
+        returned True gets no further deltas, and the upstream stream is closed once
+        every variant has stopped.
+        """
+        probe = self._before_call()
+        started = time.monotonic()
+        chunks = 0
+
+        try:
+            attempt = 0
+            while True:
+                reservation = await self.scheduler.acquire(estimated_tokens)
+                upstream = self.provider.stream_variants(messages, max_tokens, temperature, n, stats)
+                try:
+                    item = await anext(upstream, None)
+                    break
+                except Exception as e:
+                    await upstream.aclose()
+                    if not await self._handle_failure(e, attempt):
+                        raise
+                    attempt += 1
+
+            ttft = time.monotonic() - started
+            self._ttft_samples.append(ttft)
+            if stats is not None:
+                stats.model = self.provider.model
+                stats.ttft_ms = round(ttft * 1000)
+            stopped_variants = set()
+            try:
+                while item is not None:
+                    variant, chunk = item
+                    if variant not in stopped_variants:
+                        chunks += 1
+                        yield variant, chunk
+                        if stop_when is not None and stop_when[variant](chunk):
+                            stopped_variants.add(variant)
+                            if len(stopped_variants) == n:
+                                break
+                    item = await anext(upstream, None)
+            except Exception as e:
+                self.counters["failed_mid_stream"] += 1
+                self._record_failure(e)
+                self._estimate_usage(max_tokens * n, estimated_tokens, chunks, stats)
+                raise
+            finally:
+                await upstream.aclose()
+            self._record_success(attempt)
+            if len(stopped_variants) == n:
+                self._record_stopped_early(max_tokens * n, estimated_tokens, chunks, stats)
+            self._settle(reservation, stats)
+        except (asyncio.CancelledError, GeneratorExit):
+            self._record_cancelled(max_tokens * n, estimated_tokens, chunks, stats)
+            raise
+        finally:
+            if probe:
+                self.breaker.release()
+
+    async def _first_chunk_with_hedge(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        estimated_tokens: int,
+        stats: Optional[GenerationStats]
+    ) -> Tuple[str, AsyncGenerator[str, None], BudgetReservation]:
+        """Start the upstream call, hedge it if the first chunk is late, return the winner"""
+        reservations = {}
+        reservation = await self.scheduler.acquire(estimated_tokens)
+        # Every attempt shares `stats`: usage arrives at the end of a stream and only the winner gets there
+        primary = self.provider.stream(messages, max_tokens, temperature, stats)
+        reservations[primary] = reservation
+        attempts: Dict[asyncio.Task, AsyncGenerator[str, None]] = {}
+        winner: Optional[AsyncGenerator[str, None]] = None
+        # Everything from here on (including the hedge wait and the hedge's admission) may be
+        # cancelled or fail: the finally below must always see the attempts started so far
+        try:
+            attempts[asyncio.create_task(primary.__anext__())] = primary
+
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(attempts.keys(), timeout=hedge_delay)
+                if not done and self.breaker.state == CircuitBreaker.CLOSED:
+                    self.counters["hedges_launched"] += 1
+                    self.logger.info(f"No first chunk after {hedge_delay:.2f}s, sending hedged request")
+                    reservation = await self.scheduler.acquire(estimated_tokens)
+                    hedge = self.provider.stream(messages, max_tokens, temperature, stats)
+                    reservations[hedge] = reservation
+                    attempts[asyncio.create_task(hedge.__anext__())] = hedge
+
+            error: Optional[BaseException] = None
+            pending = set(attempts.keys())
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exception = task.exception()
+                    if exception is None or isinstance(exception, StopAsyncIteration):
+                        winner = attempts[task]
+                        if winner is not primary:
+                            self.counters["hedges_won"] += 1
+                        # An upstream that ended without any text counts as an empty success
+                        return ("" if exception else task.result()), winner, reservations[winner]
+                    error = exception
+            raise error
+        finally:
+            # Cancel and close every upstream call that did not win
+            for task, upstream in attempts.items():
+                if upstream is winner:
+                    continue
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await upstream.aclose()
+            if not attempts:
+                await primary.aclose()
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Time to wait for the first chunk before hedging, from recent TTFT"""
+        if not settings.llm.HEDGE_ENABLED:
+            return None
+        minimum = settings.llm.HEDGE_MIN_DELAY_MS / 1000
+        if len(self._ttft_samples) < 20:
+            return max(settings.llm.HEDGE_INITIAL_DELAY_MS / 1000, minimum)
+        return max(self._percentile(settings.llm.HEDGE_PERCENTILE), minimum)
+
+    def _percentile(self, percentile: float) -> float:
+        samples = sorted(self._ttft_samples)
+        index = min(int(len(samples) * percentile / 100), len(samples) - 1)
+        return samples[index]
+
+    def _before_call(self) -> bool:
+        self.counters["calls"] += 1
+        try:
+            return self.breaker.before_call()
+        except CircuitOpenError:
+            self.counters["circuit_rejected"] += 1
+            raise
+
+    def _record_failure(self, error: BaseException):
+        # Only provider errors say anything about the provider's health: a local queue
+        # timeout (LLMQueueTimeoutError) or a bug in our code must not open the circuit
+        if isinstance(error, LLMError):
+            self.breaker.record_failure()
+
+    async def _handle_failure(self, error: Exception, attempt: int) -> bool:
+        """Record a failed attempt; sleep and return True if it should be retried"""
+        self._record_failure(error)
+        if isinstance(error, LLMRateLimitError):
+            self.scheduler.pause(error.retry_after)
+
+        retryable = isinstance(error, (LLMError, asyncio.TimeoutError, ConnectionError))
+        if not retryable or attempt >= settings.llm.RETRY_MAX_ATTEMPTS or self.breaker.state == CircuitBreaker.OPEN:
+            self.counters["failed_before_first_chunk"] += 1
+            return False
+
+        # Full jitter exponential backoff
+        cap = min(settings.llm.RETRY_BACKOFF_BASE_MS * 2 ** attempt, settings.llm.RETRY_BACKOFF_MAX_MS)
+        delay = random.uniform(0, cap) / 1000
+        self.counters["retries"] += 1
+        self.logger.warning(f"LLM call failed before first chunk ({error}), retry {attempt + 1} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+        return True
+
+    def _record_success(self, attempt: int):
+        self.breaker.record_success()
+        if attempt == 0:
+            self.counters["succeeded_first_try"] += 1
+        else:
+            self.counters["succeeded_after_retry"] += 1
+
+    def _settle(self, reservation: BudgetReservation, stats: Optional[GenerationStats]):
+        """Book the real token count against the TPM window once the provider reported usage"""
+        if stats is not None and stats.prompt_tokens is not None:
+            self.scheduler.settle(reservation, stats.prompt_tokens + stats.completion_tokens)
+
+    @staticmethod
+    def _estimate_usage(max_tokens: int, estimated_tokens: int, chunks: int, stats: Optional[GenerationStats]):
+        # The final usage chunk never arrives for a closed stream: use the prompt estimate and count the deltas
+        if stats is not None and stats.prompt_tokens is None and chunks:
+            stats.prompt_tokens = max(estimated_tokens - max_tokens, 0)
+            stats.completion_tokens = chunks
+
+    def _record_stopped_early(
+        self,
+        max_tokens: int,
+        estimated_tokens: int,
+        chunks: int,
+        stats: Optional[GenerationStats]
+    ):
+        self._estimate_usage(max_tokens, estimated_tokens, chunks, stats)
+        self.counters["stopped_early"] += 1
+        self.logger.info(f"LLM stream stopped at target length after {chunks} chunks (budget {max_tokens})")
+
+    def _record_cancelled(self, max_tokens: int, estimated_tokens: int, chunks: int, stats: Optional[GenerationStats]):
+        # What was streamed is still billed (and counted against the user's quota)
+        self._estimate_usage(max_tokens, estimated_tokens, chunks, stats)
+        # Each streamed delta is roughly one token, the call could have run up to max_tokens
+        tokens_saved = max(max_tokens - chunks, 0)
+        self.counters["cancelled_streams"] += 1
+        self.counters["tokens_saved_estimate"] += tokens_saved
+        self.logger.info(f"LLM stream cancelled after {chunks} chunks, ~{tokens_saved} completion tokens saved")
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.counters)
+        stats["circuit_state"] = self.breaker.state
+        stats["hedge_delay_seconds"] = self._hedge_delay()
+        if self._ttft_samples:
+            for percentile in (50, 95, 99):
+                stats[f"ttft_p{percentile}_seconds"] = round(self._percentile(percentile), 3)
+        return stats
+
+
+# Create service instance
+resilient_llm = ResilientLLM(llm_provider, llm_scheduler)
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+from app.core.configs import settings
+
+
+class LLMQueueTimeoutError(Exception):
+    """Raised when a request waited longer than allowed for RPM/TPM budget"""
+
+
+class BudgetReservation:
+    """Tokens booked against the rolling one-minute window for one LLM call"""
+
+    def __init__(self, tokens: int, admitted_at: float, waited: float):
+        self.tokens = tokens
+        self.admitted_at = admitted_at
+        self.waited = waited
+
+
+class TokenBudgetScheduler:
+    """
+    Admission control in front of the LLM client.
+
+    Tracks requests-per-minute and tokens-per-minute over a rolling window and
+    queues callers (FIFO) until their estimated cost fits, instead of letting
+    bursts run into provider 429s.
+    """
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(
+        self,
+        rpm_limit: int,
+        tpm_limit: int,
+        max_wait_seconds: float,
+        chars_per_token: float
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.max_wait_seconds = max_wait_seconds
+        self.chars_per_token = chars_per_token
+
+        self._window: Deque[BudgetReservation] = deque()
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+
+        # Stats
+        self._queued = 0
+        self._admitted = 0
+        self._timed_out = 0
+        self._waited_requests = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._rate_limited = 0
+
+    def estimate_tokens(self, messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Worst-case cost of a chat call: prompt size estimated from characters plus the completion cap"""
+        prompt_chars = sum(len(message["content"]) for message in messages)
+        # ~4 tokens of framing per message on top of the content
+        prompt_tokens = math.ceil(prompt_chars / self.chars_per_token) + 4 * len(messages)
+        return prompt_tokens + max_tokens
+
+    async def acquire(self, estimated_tokens: int) -> BudgetReservation:
+        """Wait until the call fits the RPM/TPM budget and book it"""
+        queued_at = time.monotonic()
+        deadline = queued_at + self.max_wait_seconds
+        self._queued += 1
+        try:
+            # asyncio.Lock hands out ownership in FIFO order, so the head of
+            # the queue is the only one sleeping on the budget
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay_until_fits(now, estimated_tokens)
+                    if delay <= 0:
+                        break
+                    if now + delay > deadline:
+                        self._timed_out += 1
+                        raise LLMQueueTimeoutError(
+                            f"LLM request queued for more than {self.max_wait_seconds:.0f}s"
+                        )
+                    await asyncio.sleep(delay)
+
+                waited = now - queued_at
+                reservation = BudgetReservation(estimated_tokens, now, waited)
+                self._window.append(reservation)
+        finally:
+            self._queued -= 1
+
+        self._admitted += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        if waited > 0.001:
+            self._waited_requests += 1
+            self.logger.info(f"LLM request admitted after {waited:.2f}s in queue ({estimated_tokens} tokens)")
+        return reservation
+
+    def settle(self, reservation: BudgetReservation, actual_tokens: int):
+        """Replace the estimate with the real token count once usage is known"""
+        reservation.tokens = actual_tokens
+
+    def pause(self, seconds: float):
+        """Stop admitting requests for a while, e.g. after the provider returned a 429 anyway"""
+        self._rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.logger.warning(f"LLM provider rate limit hit, pausing admissions for {seconds:.1f}s")
+
+    def _delay_until_fits(self, now: float, tokens: int) -> float:
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        window_start = now - self.WINDOW_SECONDS
+        while self._window and self._window[0].admitted_at <= window_start:
+            self._window.popleft()
+
+        used_tokens = sum(reservation.tokens for reservation in self._window)
+        fits_requests = len(self._window) < self.rpm_limit
+        # A single call larger than the whole TPM budget is let through on an empty window
+        fits_tokens = used_tokens + tokens <= self.tpm_limit or not self._window
+        if fits_requests and fits_tokens:
+            return 0.0
+
+        # Sleep until enough old reservations leave the window
+        needed_requests = len(self._window) - self.rpm_limit + 1 if not fits_requests else 0
+        needed_tokens = used_tokens + tokens - self.tpm_limit if not fits_tokens else 0
+        freed_tokens = 0
+        for index, reservation in enumerate(self._window):
+            freed_tokens += reservation.tokens
+            if index + 1 >= needed_requests and freed_tokens >= needed_tokens:
+                return reservation.admitted_at + self.WINDOW_SECONDS - now
+        # More than the whole TPM budget: it goes through once the window is empty
+        return self._window[-1].admitted_at + self.WINDOW_SECONDS - now
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        window_start = now - self.WINDOW_SECONDS
+        in_window = [r for r in self._window if r.admitted_at > window_start]
+        return {
+            "rpm_limit": self.rpm_limit,
+            "tpm_limit": self.tpm_limit,
+            "queue_depth": self._queued,
+            "requests_last_minute": len(in_window),
+            "tokens_last_minute": sum(r.tokens for r in in_window),
+            "admitted_total": self._admitted,
+            "waited_total": self._waited_requests,
+            "timed_out_total": self._timed_out,
+            "rate_limited_total": self._rate_limited,
+            "avg_wait_seconds": round(self._total_wait / self._admitted, 3) if self._admitted else 0.0,
+            "max_wait_seconds": round(self._max_wait, 3),
+            "paused_for_seconds": round(max(self._paused_until - now, 0.0), 3),
+        }
+
+
+# Create scheduler instance (limits are per process: divide the account limits across instances)
+llm_scheduler = TokenBudgetScheduler(
+    rpm_limit=settings.openai.RPM_LIMIT,
+    tpm_limit=settings.openai.TPM_LIMIT,
+    max_wait_seconds=settings.openai.SCHEDULER_MAX_WAIT_SECONDS,
+    chars_per_token=settings.openai.CHARS_PER_TOKEN,
+)
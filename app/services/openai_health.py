@@ -1,10 +1,10 @@
 import logging
 import time
 from typing import Dict, Any
-from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion
 
 from app.core.configs import settings
+from app.services.llm_providers import openai_provider
 
 
 class OpenAIHealthService:
@@ -12,7 +12,11 @@ class OpenAIHealthService:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.client = AsyncOpenAI(api_key=settings.openai.API_KEY)
+    
+    @property
+    def client(self):
+        """OpenAI client shared with the story generation provider"""
+        return openai_provider.client
     
     async def check_health(self) -> Dict[str, Any]:
         """
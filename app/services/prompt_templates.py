@@ -0,0 +1,285 @@
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from app.schemas.hero import HeroOut
+from app.schemas.story import Language, StoryGenerateWithHeroesRequest, StoryLength, StoryStyle
+
+
+# Defines the AI's role and constraints: child-friendly content and fairy tale style
+SYSTEM_PROMPT = (
+    "You are a professional children's fairy tale writer specializing in age-appropriate stories "
+    "for children up to 12 years old."
+    """
+
+STRICT GUIDELINES:
+1. Create ONLY fairy tales and fantasy stories suitable for children
+2. Content must be 100% appropriate for ages 0-12 years
+3. NO violence, scary content, death, or inappropriate themes
+4. Focus on positive values: friendship, kindness, courage, learning, family
+5. Use simple, clear language appropriate for the target age
+6. Include magic, wonder, and imagination
+7. Always have a positive, uplifting ending
+8. Promote good morals and life lessons
+
+FORBIDDEN CONTENT:
+- Violence, fighting, or scary scenes
+- Death, illness, or sad endings
+- Adult themes or complex emotional situations
+- Frightening creatures or situations
+- Any content that might cause nightmares or distress
+
+STORY STRUCTURE:
+- Clear beginning, middle, and end
+- Engaging characters children can relate to
+- Simple conflicts that are easily resolved
+- Educational or moral elements woven naturally
+- Descriptive language that sparks imagination
+
+FORMAT REQUIREMENTS:
+- Write in PLAIN TEXT format only
+- NO markdown formatting (no #, *, **, _, etc.)
+- NO headers, bold text, or special formatting
+- Use simple paragraphs separated by line breaks
+- Present the story as continuous narrative text
+- DO NOT end stories with "The End", "Конец", "Fin", "Finale" or similar ending phrases
+- Stories should conclude naturally with the final narrative sentence
+- Use ONLY short dashes (-) for punctuation, NOT long em-dashes (—) or en-dashes (–)
+
+Remember: You are creating magical, safe, and enriching experiences for young minds."""
+)
+
+# Content guidance per age bucket, keyed by the bucket's upper age bound (None: older than 12)
+AGE_GUIDANCE: Dict[Optional[int], str] = {
+    5: """- Use very simple sentences and basic vocabulary
+- Focus on concrete concepts and familiar situations
+- Include repetitive elements and simple rhymes
+- Story should be 2-3 minutes reading time
+- Emphasize basic concepts like colors, numbers, animals
+- Very gentle conflicts with immediate, happy solutions""",
+    8: """- Use clear, engaging sentences with expanded vocabulary
+- Include some adventure but keep it safe and non-threatening
+- Add simple problem-solving elements
+- Story should be 3-4 minutes reading time
+- Can include mild suspense that quickly resolves positively
+- Focus on friendship, sharing, and basic life lessons""",
+    12: """- Use rich vocabulary and more complex sentence structures
+- Include character development and emotional growth
+- Add meaningful challenges that teach resilience
+- Story should be 4-5 minutes reading time
+- Can explore themes of courage, honesty, and perseverance
+- Include subtle moral lessons woven into the narrative""",
+    None: """- Use sophisticated language and narrative techniques
+- Explore deeper themes while maintaining appropriateness
+- Include complex character relationships and growth
+- Story should be 5-6 minutes reading time
+- Address more nuanced moral and ethical concepts
+- Prepare for transition to young adult themes""",
+}
+
+LANGUAGE_GUIDANCE: Dict[str, str] = {
+    "en": (
+        "Write in clear, engaging English with proper grammar and rich vocabulary "
+        "appropriate for native English-speaking children."
+    ),
+    "ru": (
+        "Пишите на ясном, увлекательном русском языке с правильной грамматикой и богатой лексикой, "
+        "подходящей для русскоговорящих детей."
+    ),
+    "es": (
+        "Escribe en español claro y atractivo con gramática correcta y vocabulario rico "
+        "apropiado para niños hispanohablantes."
+    ),
+    "fr": (
+        "Écrivez en français clair et engageant avec une grammaire correcte et un vocabulaire riche "
+        "approprié pour les enfants francophones."
+    ),
+    "de": (
+        "Schreiben Sie in klarem, ansprechendem Deutsch mit korrekter Grammatik und reichem Wortschatz, "
+        "der für deutschsprachige Kinder geeignet ist."
+    ),
+}
+
+LENGTH_GUIDANCE: Dict[int, str] = {
+    1: "Approximately 100-200 words (very short story)",
+    2: "Approximately 200-300 words (short story)",
+    3: "Approximately 300-400 words (medium story)",
+    4: "Approximately 400-500 words (long story)",
+    5: "Approximately 500-600 words (very long story)",
+}
+
+
+AGE_GROUP_LABELS: Dict[Optional[int], str] = {
+    5: "Ages 0-5",
+    8: "Ages 6-8",
+    12: "Ages 9-12",
+    None: "Ages 13+",
+}
+
+
+def _build_static_guidance() -> str:
+    """All request-independent guidance, for every age group, language and length"""
+    age_guidance = "\n\n".join(f"{AGE_GROUP_LABELS[bucket]}:\n{text}" for bucket, text in AGE_GUIDANCE.items())
+    language_guidance = "\n".join(f"- {language.upper()}: {text}" for language, text in LANGUAGE_GUIDANCE.items())
+    length_guidance = "\n".join(f"- {length}: {text}" for length, text in LENGTH_GUIDANCE.items())
+    return f"""AGE REQUIREMENTS (follow the age group given in the request):
+{age_guidance}
+
+LANGUAGE REQUIREMENTS (follow the language given in the request):
+{language_guidance}
+
+LENGTH REQUIREMENTS (follow the story length given in the request):
+{length_guidance}
+
+STORY REQUIREMENTS:
+- Include traditional fairy tale elements and magical moments
+- Feature ALL the heroes listed in the request as main characters in the story
+- Give each hero meaningful roles and showcase their unique personalities and powers
+- Create interactions between the heroes that highlight their different strengths
+- Incorporate the story idea naturally into the plot involving all heroes
+- End with a clear moral lesson appropriate for the age group
+- Use rich, descriptive language that helps children visualize the story
+- IMPORTANT: Do NOT end with "The End" or equivalent phrases - let the story conclude naturally
+- Use simple punctuation: short dashes (-) only, avoid long dashes (—) or special symbols
+- Balance the story so all heroes contribute meaningfully to the adventure"""
+
+
+# The system message is byte-identical for every request. OpenAI caches prompt
+# prefixes of 1024+ tokens, so keeping all static guidance here (and all
+# per-request data in the user message after it) lets every story reuse the
+# cached prefix.
+SYSTEM_MESSAGE = f"{SYSTEM_PROMPT}\n\n{_build_static_guidance()}"
+
+# Template: (text before the title, between title and idea, between idea and heroes, after heroes)
+CompiledTemplate = Tuple[str, str, str, str]
+
+
+class PromptTemplateEngine:
+    """
+    Assembles story prompts from templates compiled once at startup.
+
+    The system message holds all static guidance and never changes, so the
+    provider can serve it from its prompt cache. The user message only names
+    the age group, language, style and length and carries the per-request data.
+    Everything in it that only depends on (age bucket, language, style, length)
+    is rendered ahead of time, so building a prompt is a single join of the
+    precompiled segments with the title, idea and hero descriptions. Hero
+    descriptions are cached per hero id and content, so an edited hero gets
+    a fresh fragment.
+    """
+
+    AGE_BUCKETS = (5, 8, 12)
+    HERO_CACHE_SIZE = 4096
+
+    # Slot markers used only while compiling templates
+    _TITLE = "\x00title\x00"
+    _IDEA = "\x00idea\x00"
+    _HEROES = "\x00heroes\x00"
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._templates: Dict[Tuple[Optional[int], str, str, int], CompiledTemplate] = {}
+        # lru_cache is implemented in C, a hit costs far less than rendering the fragment
+        self._hero_fragment = lru_cache(maxsize=self.HERO_CACHE_SIZE)(self._render_hero_fragment)
+        self._compile_all()
+
+    @classmethod
+    def age_bucket(cls, age: int) -> Optional[int]:
+        """Upper bound of the age bucket (None: older than every bucket)"""
+        for bucket in cls.AGE_BUCKETS:
+            if age <= bucket:
+                return bucket
+        return None
+
+    def build_messages(self, story_params: StoryGenerateWithHeroesRequest) -> List[Dict[str, str]]:
+        """Chat messages sent to the LLM for a story request"""
+        return [
+            {"role": "system", "content": SYSTEM_MESSAGE},
+            {"role": "user", "content": self.render_user_prompt(story_params)}
+        ]
+
+    def render_user_prompt(self, story_params: StoryGenerateWithHeroesRequest) -> str:
+        """User prompt with story parameters and heroes list"""
+        # Use youngest hero's age for appropriate content
+        target_age = min([hero.age for hero in story_params.heroes])
+        key = (
+            self.age_bucket(target_age),
+            story_params.language.value,
+            story_params.story_style.value,
+            story_params.story_length.value,
+        )
+        head, after_title, after_idea, tail = self._templates[key]
+        return "".join((
+            head, story_params.story_name,
+            after_title, story_params.story_idea,
+            after_idea, self.render_heroes(story_params.heroes),
+            tail,
+        ))
+
+    def render_heroes(self, heroes: List[HeroOut]) -> str:
+        """Numbered heroes list for inclusion in the prompt"""
+        return "\n".join(f"{i}. {self.hero_fragment(hero)}" for i, hero in enumerate(heroes, 1)).strip()
+
+    def hero_fragment(self, hero: HeroOut) -> str:
+        """Description of one hero, cached by id and content"""
+        return self._hero_fragment(
+            hero.id, hero.name, hero.gender, hero.age, hero.appearance, hero.personality, hero.power
+        )
+
+    @staticmethod
+    def _render_hero_fragment(
+        hero_id: UUID,
+        name: str,
+        gender: str,
+        age: int,
+        appearance: Optional[str],
+        personality: Optional[str],
+        power: Optional[str]
+    ) -> str:
+        return f"""{name} ({gender}, age {age})
+   - Appearance: {appearance or 'Not specified'}
+   - Personality: {personality or 'Not specified'}
+   - Special Power: {power or 'No special powers'}"""
+
+    def _compile_all(self):
+        for bucket in (*self.AGE_BUCKETS, None):
+            for language in Language:
+                for style in StoryStyle:
+                    for length in StoryLength:
+                        key = (bucket, language.value, style.value, length.value)
+                        self._templates[key] = self._compile(*key)
+        self.logger.info(f"Precompiled {len(self._templates)} story prompt templates")
+
+    def _compile(self, age_bucket: Optional[int], language: str, style: str, story_length: int) -> CompiledTemplate:
+        prompt = f"""Create a {style.lower()} fairy tale with these specifications:
+
+STORY DETAILS:
+- Title: "{self._TITLE}"
+- Story idea: {self._IDEA}
+- Language: {language.upper()}
+- Style: {style}
+- Story length: {story_length} - {LENGTH_GUIDANCE.get(story_length, LENGTH_GUIDANCE[3])}
+- Age group: {AGE_GROUP_LABELS[age_bucket]}
+
+MAIN CHARACTERS (HEROES):
+{self._HEROES}
+
+Please write the complete fairy tale now featuring all the heroes working together."""
+        head, rest = prompt.split(self._TITLE)
+        after_title, rest = rest.split(self._IDEA)
+        after_idea, tail = rest.split(self._HEROES)
+        return head, after_title, after_idea, tail
+
+    def stats(self) -> Dict[str, int]:
+        cache_info = self._hero_fragment.cache_info()
+        return {
+            "templates": len(self._templates),
+            "hero_fragments_cached": cache_info.currsize,
+            "hero_cache_hits": cache_info.hits,
+            "hero_cache_misses": cache_info.misses,
+        }
+
+
+# Create service instance (templates are compiled on import, i.e. at startup)
+prompt_template_engine = PromptTemplateEngine()
@@ -0,0 +1,43 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from app.schemas.story import StoryGenerateWithHeroesRequest
+
+
+def _normalize(value: Optional[str]) -> str:
+    # None and "" are the same for the story, and heroes must stay sortable
+    return " ".join(value.split()).casefold() if value else ""
+
+
+def canonical_story_request(story_data: StoryGenerateWithHeroesRequest, hero_ids: bool = True) -> Dict[str, Any]:
+    """
+    Everything in the request that shapes the generated story: whitespace/case-insensitive
+    text, heroes in a stable order. Without `hero_ids`, heroes are compared by attributes only.
+    """
+    heroes = sorted(
+        (
+            *((str(hero.id),) if hero_ids else ()),
+            _normalize(hero.name),
+            _normalize(hero.gender),
+            hero.age,
+            _normalize(hero.appearance),
+            _normalize(hero.personality),
+            _normalize(hero.power),
+        )
+        for hero in story_data.heroes
+    )
+    return {
+        "story_name": _normalize(story_data.story_name),
+        "story_idea": _normalize(story_data.story_idea),
+        "story_style": story_data.story_style.value,
+        "language": story_data.language.value,
+        "story_length": story_data.story_length.value,
+        "variants": story_data.variants,
+        "heroes": heroes,
+    }
+
+
+def hash_payload(payload: Dict[str, Any]) -> str:
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
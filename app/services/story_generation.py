@@ -1,62 +1,98 @@
 import logging
-from typing import Dict, Any, AsyncGenerator, List
-from openai import AsyncOpenAI
+import time
+from typing import Dict, Any, AsyncGenerator, List, Optional, Tuple
 
 from app.core.configs import settings
 from app.schemas.story import StoryGenerateWithHeroesRequest
-from app.schemas.hero import HeroOut
+from app.services.generation_budget import GenerationBudgetPolicy, generation_budget_policy
+from app.services.llm_providers import GenerationStats
+from app.services.llm_resilience import CircuitOpenError, ResilientLLM, resilient_llm
+from app.services.llm_scheduler import llm_scheduler
+from app.services.prompt_templates import PromptTemplateEngine, prompt_template_engine
 
 
 class StoryGenerationService:
-    """Service for generating fairy tales using OpenAI GPT-4o-mini"""
+    """Service for generating fairy tales through the configured LLM provider"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        llm: ResilientLLM = resilient_llm,
+        prompts: PromptTemplateEngine = prompt_template_engine,
+        budget: GenerationBudgetPolicy = generation_budget_policy
+    ):
         self.logger = logging.getLogger(__name__)
-        self.client = AsyncOpenAI(api_key=settings.openai.API_KEY)
+        self.llm = llm
+        self.provider = llm.provider
+        self.prompts = prompts
+        self.budget = budget
+        # Provider-side prompt caching, over generations that reported usage
+        self._prompt_cache = {
+            "generations": 0,
+            "cache_hits": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "ttft_ms_hit_total": 0,
+            "ttft_ms_miss_total": 0,
+        }
     
 
-    async def generate_story_with_heroes(self, story_params: StoryGenerateWithHeroesRequest) -> str:
+    async def generate_story_with_heroes(
+        self,
+        story_params: StoryGenerateWithHeroesRequest,
+        stats: Optional[GenerationStats] = None
+    ) -> str:
         """
         Generate a fairy tale story with multiple heroes.
         
         Args:
             story_params: StoryGenerateWithHeroesRequest object with heroes list
+            stats: Optional GenerationStats to fill with token usage and timing
             
         Returns:
             str: Generated story content
         """
         self.logger.info(f"Generating story with heroes: {story_params.story_name}")
         
+        stats = stats if stats is not None else GenerationStats()
+        started = time.monotonic()
+        
         try:
             # Build the prompt for OpenAI with heroes
-            prompt = self._build_prompt_with_heroes(story_params)
+            messages = self._build_messages(story_params)
+            # Completion budget sized to the requested story length and language
+            max_tokens = self.budget.max_tokens(story_params)
             
-            # Call OpenAI API
-            response = await self.client.chat.completions.create(
-                model=settings.openai.MODEL,
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=settings.openai.MAX_TOKENS,
-                temperature=settings.openai.TEMPERATURE
+            # Call the LLM provider (RPM/TPM admission, retries and circuit breaker included)
+            story_content = await self.llm.complete(
+                messages,
+                max_tokens=max_tokens,
+                temperature=settings.openai.TEMPERATURE,
+                estimated_tokens=llm_scheduler.estimate_tokens(messages, max_tokens),
+                stats=stats
             )
-            
-            story_content = response.choices[0].message.content
+            stats.generation_ms = round((time.monotonic() - started) * 1000)
+            self._record_prompt_cache(stats)
             self.logger.info(f"Generated story with heroes of {len(story_content)} characters")
             
             return story_content
             
+        except CircuitOpenError:
+            raise
         except Exception as e:
             self.logger.error(f"Error generating story with heroes: {str(e)}")
             raise Exception(f"Failed to generate story with heroes: {str(e)}")
 
-    async def generate_story_with_heroes_stream(self, story_params: StoryGenerateWithHeroesRequest) -> AsyncGenerator[str, None]:
+    async def generate_story_with_heroes_stream(
+        self,
+        story_params: StoryGenerateWithHeroesRequest,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[str, None]:
         """
         Generate a fairy tale story with multiple heroes using streaming response.
         
         Args:
             story_params: StoryGenerateWithHeroesRequest object with heroes list
+            stats: Optional GenerationStats to fill with token usage and timing
             
         Yields:
             str: Chunks of generated story content
@@ -65,227 +101,158 @@ class StoryGenerationService:
         self.logger.info(f"📊 Heroes count: {len(story_params.heroes)}")
         self.logger.info(f"🎯 Story style: {story_params.story_style}, Language: {story_params.language}")
         
+        stats = stats if stats is not None else GenerationStats()
+        started = time.monotonic()
+        
         try:
             # Build the prompt for OpenAI with heroes
             self.logger.info("🔨 Building prompt with heroes...")
-            prompt = self._build_prompt_with_heroes(story_params)
-            self.logger.info(f"📝 Prompt length: {len(prompt)} characters")
-            self.logger.debug(f"📄 Full prompt: {prompt[:500]}...")
+            messages = self._build_messages(story_params)
+            self.logger.info(f"📝 Prompt length: {len(messages[-1]['content'])} characters")
+            self.logger.debug(f"📄 Full prompt: {messages[-1]['content'][:500]}...")
             
-            # Call OpenAI API with streaming
-            self.logger.info("🌐 Calling OpenAI API for streaming...")
-            self.logger.info(f"🔧 Model: {settings.openai.MODEL}, Max tokens: {settings.openai.MAX_TOKENS}, Temp: {settings.openai.TEMPERATURE}")
+            # Completion budget sized to the requested story length and language
+            max_tokens = self.budget.max_tokens(story_params)
+            estimated_tokens = llm_scheduler.estimate_tokens(messages, max_tokens)
             
-            stream = await self.client.chat.completions.create(
-                model=settings.openai.MODEL,
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=settings.openai.MAX_TOKENS,
-                temperature=settings.openai.TEMPERATURE,
-                stream=True
+            # Call the LLM provider with streaming (RPM/TPM admission, retries, hedging and circuit breaker included)
+            self.logger.info(
+                f"🌐 Calling {self.provider.name} provider for streaming (~{estimated_tokens} tokens)..."
+            )
+            self.logger.info(
+                f"🔧 Model: {self.provider.model}, Max tokens: {max_tokens}, Temp: {settings.openai.TEMPERATURE}"
             )
-            
-            self.logger.info("✅ OpenAI stream created successfully, starting to process chunks...")
             
             chunk_count = 0
             total_content = ""
             
             # Stream the response
-            async for chunk in stream:
+            async for content in self.llm.stream(
+                messages,
+                max_tokens=max_tokens,
+                temperature=settings.openai.TEMPERATURE,
+                estimated_tokens=estimated_tokens,
+                stats=stats,
+                # Close the stream at the first sentence end past the target length
+                stop_when=self.budget.stop_condition(story_params)
+            ):
                 chunk_count += 1
-                self.logger.debug(f"📦 Processing chunk #{chunk_count}")
-                
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    total_content += content
-                    self.logger.debug(f"📤 Yielding chunk: {len(content)} characters")
-                    yield content
-                else:
-                    self.logger.debug(f"⚪ Empty chunk #{chunk_count}")
+                total_content += content
+                self.logger.debug(f"📤 Yielding chunk #{chunk_count}: {len(content)} characters")
+                yield content
             
             self.logger.info(f"🎉 Streaming generation with heroes completed successfully!")
             self.logger.info(f"📈 Total chunks processed: {chunk_count}")
             self.logger.info(f"📊 Total content length: {len(total_content)} characters")
             
+            stats.generation_ms = round((time.monotonic() - started) * 1000)
+            self._record_prompt_cache(stats)
+            self.logger.info(
+                f"🧾 Usage: {stats.prompt_tokens} prompt ({stats.cached_tokens} cached), "
+                f"{stats.completion_tokens} completion tokens, TTFT {stats.ttft_ms} ms"
+            )
+            
+        except CircuitOpenError as e:
+            self.logger.warning(f"⛔ LLM circuit open, rejecting streaming generation: {str(e)}")
+            raise
         except Exception as e:
             self.logger.error(f"❌ Error in streaming generation with heroes: {str(e)}")
             self.logger.error(f"🔍 Error type: {type(e).__name__}")
             import traceback
             self.logger.error(f"📍 Traceback: {traceback.format_exc()}")
             raise Exception(f"Failed to generate story stream with heroes: {str(e)}")
-    
-    def _get_system_prompt(self) -> str:
-        """
-        Returns the system prompt that defines the AI's role and constraints.
-        This prompt ensures child-friendly content and fairy tale style.
-        """
-        return """You are a professional children's fairy tale writer specializing in age-appropriate stories for children up to 12 years old.
-
-STRICT GUIDELINES:
-1. Create ONLY fairy tales and fantasy stories suitable for children
-2. Content must be 100% appropriate for ages 0-12 years
-3. NO violence, scary content, death, or inappropriate themes
-4. Focus on positive values: friendship, kindness, courage, learning, family
-5. Use simple, clear language appropriate for the target age
-6. Include magic, wonder, and imagination
-7. Always have a positive, uplifting ending
-8. Promote good morals and life lessons
-
-FORBIDDEN CONTENT:
-- Violence, fighting, or scary scenes
-- Death, illness, or sad endings
-- Adult themes or complex emotional situations
-- Frightening creatures or situations
-- Any content that might cause nightmares or distress
-
-STORY STRUCTURE:
-- Clear beginning, middle, and end
-- Engaging characters children can relate to
-- Simple conflicts that are easily resolved
-- Educational or moral elements woven naturally
-- Descriptive language that sparks imagination
-
-FORMAT REQUIREMENTS:
-- Write in PLAIN TEXT format only
-- NO markdown formatting (no #, *, **, _, etc.)
-- NO headers, bold text, or special formatting
-- Use simple paragraphs separated by line breaks
-- Present the story as continuous narrative text
-- DO NOT end stories with "The End", "Конец", "Fin", "Finale" or similar ending phrases
-- Stories should conclude naturally with the final narrative sentence
-- Use ONLY short dashes (-) for punctuation, NOT long em-dashes (—) or en-dashes (–)
 
-Remember: You are creating magical, safe, and enriching experiences for young minds."""
+    async def generate_story_variants_stream(
+        self,
+        story_params: StoryGenerateWithHeroesRequest,
+        stats: Optional[GenerationStats] = None
+    ) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        Generate `story_params.variants` versions of a story in one streaming LLM call.
 
-    def _build_prompt_with_heroes(self, story_params: StoryGenerateWithHeroesRequest) -> str:
-        """Build the user prompt with story parameters and heroes list"""
-        
-        self.logger.info(f"📝 Building prompt for story: {story_params.story_name}")
-        self.logger.info(f"🦸 Heroes received: {len(story_params.heroes)}")
-        
-        for i, hero in enumerate(story_params.heroes):
-            self.logger.info(f"🦸‍♂️ Hero {i+1}: {hero.name} (age {hero.age}, {hero.gender})")
-        
-        # Determine age from the average of heroes' ages or use youngest hero's age for age-appropriate content
-        hero_ages = [hero.age for hero in story_params.heroes]
-        target_age = min(hero_ages)  # Use youngest hero's age for appropriate content
-        self.logger.info(f"🎯 Target age for content: {target_age}")
-        
-        # Age-appropriate guidelines
-        age_guidance = self._get_age_specific_guidance(target_age)
-        
-        # Language-specific elements
-        language_guidance = self._get_language_guidance(story_params.language.value)
-        
-        # Build heroes description
-        self.logger.info("🎭 Formatting heroes for prompt...")
-        heroes_description = self._format_heroes_for_prompt(story_params.heroes)
-        self.logger.info(f"📋 Heroes description length: {len(heroes_description)} chars")
-        
-        prompt = f"""Create a {story_params.story_style.value.lower()} fairy tale with these specifications:
+        Args:
+            story_params: StoryGenerateWithHeroesRequest object with heroes list
+            stats: Optional GenerationStats to fill with the token usage of all variants and timing
 
-STORY DETAILS:
-- Title: "{story_params.story_name}"
-- Story idea: {story_params.story_idea}
-- Language: {story_params.language.value.upper()}
-- Style: {story_params.story_style.value}
-- Story length: {story_params.story_length.value} (1=very short, 2=short, 3=medium, 4=long, 5=very long)
+        Yields:
+            Tuple[int, str]: Variant index and a chunk of its content
+        """
+        n = story_params.variants
+        self.logger.info(f"🚀 Starting streaming generation of {n} variants for story: {story_params.story_name}")
 
-MAIN CHARACTERS (HEROES):
-{heroes_description}
+        stats = stats if stats is not None else GenerationStats()
+        started = time.monotonic()
 
-AGE REQUIREMENTS:
-{age_guidance}
+        try:
+            messages = self._build_messages(story_params)
+            max_tokens = self.budget.max_tokens(story_params)
+            # The prompt is sent once, the completion budget is needed for every variant
+            estimated_tokens = llm_scheduler.estimate_tokens(messages, max_tokens * n)
+            stop_conditions = [self.budget.stop_condition(story_params) for _ in range(n)]
 
-LANGUAGE REQUIREMENTS:
-{language_guidance}
+            async for variant, content in self.llm.stream_variants(
+                messages,
+                max_tokens=max_tokens,
+                temperature=settings.openai.TEMPERATURE,
+                n=n,
+                estimated_tokens=estimated_tokens,
+                stats=stats,
+                stop_when=stop_conditions if all(stop_conditions) else None
+            ):
+                yield variant, content
 
-STORY REQUIREMENTS:
-- Length: {self._get_length_guidance(story_params.story_length.value)}
-- Include traditional fairy tale elements and magical moments
-- Feature ALL the heroes listed above as main characters in the story
-- Give each hero meaningful roles and showcase their unique personalities and powers
-- Create interactions between the heroes that highlight their different strengths
-- Incorporate the story idea naturally into the plot involving all heroes
-- End with a clear moral lesson appropriate for the age group
-- Use rich, descriptive language that helps children visualize the story
-- IMPORTANT: Do NOT end with "The End" or equivalent phrases - let the story conclude naturally
-- Use simple punctuation: short dashes (-) only, avoid long dashes (—) or special symbols
-- Balance the story so all heroes contribute meaningfully to the adventure
+            stats.generation_ms = round((time.monotonic() - started) * 1000)
+            self._record_prompt_cache(stats)
+            self.logger.info(
+                f"🧾 Usage of {n} variants: {stats.prompt_tokens} prompt ({stats.cached_tokens} cached), "
+                f"{stats.completion_tokens} completion tokens, TTFT {stats.ttft_ms} ms"
+            )
 
-Please write the complete fairy tale now featuring all the heroes working together."""
-        
-        return prompt
+        except CircuitOpenError as e:
+            self.logger.warning(f"⛔ LLM circuit open, rejecting variant generation: {str(e)}")
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ Error in streaming generation of story variants: {str(e)}")
+            raise Exception(f"Failed to generate story variants: {str(e)}")
 
-    def _format_heroes_for_prompt(self, heroes: List[HeroOut]) -> str:
-        """Format heroes list for inclusion in the prompt"""
-        heroes_text = ""
-        for i, hero in enumerate(heroes, 1):
-            heroes_text += f"""
-{i}. {hero.name} ({hero.gender}, age {hero.age})
-   - Appearance: {hero.appearance or 'Not specified'}
-   - Personality: {hero.personality or 'Not specified'}
-   - Special Power: {hero.power or 'No special powers'}"""
-        
-        return heroes_text.strip()
-    
-    def _get_age_specific_guidance(self, age: int) -> str:
-        """Get age-specific content guidance"""
-        if age <= 5:
-            return """- Use very simple sentences and basic vocabulary
-- Focus on concrete concepts and familiar situations
-- Include repetitive elements and simple rhymes
-- Story should be 2-3 minutes reading time
-- Emphasize basic concepts like colors, numbers, animals
-- Very gentle conflicts with immediate, happy solutions"""
-        
-        elif age <= 8:
-            return """- Use clear, engaging sentences with expanded vocabulary
-- Include some adventure but keep it safe and non-threatening
-- Add simple problem-solving elements
-- Story should be 3-4 minutes reading time
-- Can include mild suspense that quickly resolves positively
-- Focus on friendship, sharing, and basic life lessons"""
-        
-        elif age <= 12:
-            return """- Use rich vocabulary and more complex sentence structures
-- Include character development and emotional growth
-- Add meaningful challenges that teach resilience
-- Story should be 4-5 minutes reading time
-- Can explore themes of courage, honesty, and perseverance
-- Include subtle moral lessons woven into the narrative"""
-        
+    def _record_prompt_cache(self, stats: GenerationStats):
+        if stats.prompt_tokens is None or stats.cached_tokens is None:
+            return
+        counters = self._prompt_cache
+        counters["generations"] += 1
+        counters["prompt_tokens"] += stats.prompt_tokens
+        counters["cached_tokens"] += stats.cached_tokens
+        if stats.cached_tokens:
+            counters["cache_hits"] += 1
+            counters["ttft_ms_hit_total"] += stats.ttft_ms or 0
         else:
-            return """- Use sophisticated language and narrative techniques
-- Explore deeper themes while maintaining appropriateness
-- Include complex character relationships and growth
-- Story should be 5-6 minutes reading time
-- Address more nuanced moral and ethical concepts
-- Prepare for transition to young adult themes"""
-    
-    def _get_language_guidance(self, language: str) -> str:
-        """Get language-specific guidance for story generation"""
-        guidance = {
-            "en": "Write in clear, engaging English with proper grammar and rich vocabulary appropriate for native English-speaking children.",
-            "ru": "Пишите на ясном, увлекательном русском языке с правильной грамматикой и богатой лексикой, подходящей для русскоговорящих детей.",
-            "es": "Escribe en español claro y atractivo con gramática correcta y vocabulario rico apropiado para niños hispanohablantes.",
-            "fr": "Écrivez en français clair et engageant avec une grammaire correcte et un vocabulaire riche approprié pour les enfants francophones.",
-            "de": "Schreiben Sie in klarem, ansprechendem Deutsch mit korrekter Grammatik und reichem Wortschatz, der für deutschsprachige Kinder geeignet ist."
-        }
-        return guidance.get(language, guidance["en"])
-    
-    def _get_length_guidance(self, story_length: int) -> str:
-        """Get length-specific guidance for story generation"""
-        length_guidance = {
-            1: "Approximately 100-200 words (very short story)",
-            2: "Approximately 200-300 words (short story)",
-            3: "Approximately 300-400 words (medium story)",
-            4: "Approximately 400-500 words (long story)",
-            5: "Approximately 500-600 words (very long story)"
+            counters["ttft_ms_miss_total"] += stats.ttft_ms or 0
+
+    def prompt_cache_stats(self) -> Dict[str, Any]:
+        """Provider-side prompt cache hit ratio and time-to-first-token with and without a hit"""
+        counters = self._prompt_cache
+        misses = counters["generations"] - counters["cache_hits"]
+        avg_ttft_hit = counters["ttft_ms_hit_total"] / counters["cache_hits"] if counters["cache_hits"] else None
+        avg_ttft_miss = counters["ttft_ms_miss_total"] / misses if misses else None
+        return {
+            "generations": counters["generations"],
+            "cache_hits": counters["cache_hits"],
+            "hit_ratio": round(counters["cache_hits"] / counters["generations"], 3) if counters["generations"] else 0.0,
+            "prompt_tokens": counters["prompt_tokens"],
+            "cached_tokens": counters["cached_tokens"],
+            "cached_token_ratio": (
+                round(counters["cached_tokens"] / counters["prompt_tokens"], 3) if counters["prompt_tokens"] else 0.0
+            ),
+            "avg_ttft_ms_hit": round(avg_ttft_hit) if avg_ttft_hit is not None else None,
+            "avg_ttft_ms_miss": round(avg_ttft_miss) if avg_ttft_miss is not None else None,
         }
-        return length_guidance.get(story_length, length_guidance[3])
+
+    def _build_messages(self, story_params: StoryGenerateWithHeroesRequest) -> List[Dict[str, str]]:
+        """Chat messages sent to OpenAI for a story request"""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for i, hero in enumerate(story_params.heroes):
+                self.logger.debug(f"🦸‍♂️ Hero {i+1}: {hero.name} (age {hero.age}, {hero.gender})")
+        return self.prompts.build_messages(story_params)
 
 
 # Create service instance
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from app.core.configs import settings
+from app.schemas.hero import HeroOut
+from app.schemas.story import Language, StoryGenerateWithHeroesRequest, StoryLength, StoryStyle
+from app.services.llm_providers import GenerationStats
+from app.services.prompt_templates import PromptTemplateEngine
+from app.services.story_generation import StoryGenerationService, story_generation_service
+from app.services.story_result_cache import story_result_cache
+
+
+# (language, style, length, hero gender, hero age bucket)
+PoolKey = Tuple[str, str, int, str, Optional[int]]
+
+# Hero name in pre-generated stories, replaced with the real name when served
+HERO_PLACEHOLDER = "{HERO}"
+
+PLACEHOLDER_UUID = UUID(int=0)
+
+
+class PooledStory:
+    def __init__(self, content: str, stats: GenerationStats):
+        self.content = content
+        self.stats = stats
+
+
+class StoryPool:
+    """
+    Pre-generated stories for the most common first-story requests.
+
+    A single-hero request whose language, style, length, hero gender and hero
+    age bucket match a configured combination is served from the pool, with
+    the placeholder hero name replaced by the real one. The story idea and the
+    hero's other attributes are not taken into account, which is why only
+    the user's first story is served this way. A background task keeps
+    STORY_POOL_TARGET_SIZE stories per combination, off the request path.
+    """
+
+    MAX_FAILURES_IN_A_ROW = 3
+
+    def __init__(self, generation: StoryGenerationService = story_generation_service):
+        self.logger = logging.getLogger(__name__)
+        self.generation = generation
+        self.enabled = settings.story_pool.ENABLED
+        self.target_size = settings.story_pool.TARGET_SIZE
+        self._entries: Dict[PoolKey, Deque[PooledStory]] = {key: deque() for key in self.combinations()}
+        self._refill_needed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"served": 0, "empty": 0, "generated": 0, "discarded": 0, "failures": 0}
+
+    @staticmethod
+    def combinations() -> List[PoolKey]:
+        config = settings.story_pool
+        return [
+            (language, style, length, gender, age_bucket)
+            for language in config.LANGUAGES
+            for style in config.STYLES
+            for length in config.LENGTHS
+            for gender in config.HERO_GENDERS
+            for age_bucket in config.HERO_AGE_BUCKETS
+        ]
+
+    @staticmethod
+    def key(story_data: StoryGenerateWithHeroesRequest) -> Optional[PoolKey]:
+        """Pool combination of a request, or None when it has more than one hero"""
+        if len(story_data.heroes) != 1:
+            return None
+        hero = story_data.heroes[0]
+        return (
+            story_data.language.value,
+            story_data.story_style.value,
+            story_data.story_length.value,
+            hero.gender.strip().casefold(),
+            PromptTemplateEngine.age_bucket(hero.age),
+        )
+
+    def matches(self, story_data: StoryGenerateWithHeroesRequest) -> bool:
+        """Whether the pool covers this kind of request (whether a story is available or not)"""
+        return self.enabled and self.key(story_data) in self._entries
+
+    def take(self, story_data: StoryGenerateWithHeroesRequest) -> Optional[PooledStory]:
+        """Pop a pre-generated story for the request, personalized with the hero name"""
+        entries = self._entries.get(self.key(story_data)) if self.enabled else None
+        if entries is None:
+            return None
+        # Whether served or not, the combination is wanted: top it up
+        self._refill_needed.set()
+        if not entries:
+            self.counters["empty"] += 1
+            return None
+        pooled = entries.popleft()
+        self.counters["served"] += 1
+        content = pooled.content.replace(HERO_PLACEHOLDER, story_data.heroes[0].name)
+        return PooledStory(content, pooled.stats)
+
+    async def replay(self, pooled: PooledStory, stats: Optional[GenerationStats] = None) -> AsyncGenerator[str, None]:
+        """Stream a pooled story like a live generation, recording the usage of its pre-generation"""
+        if stats is not None:
+            for name, value in pooled.stats.as_dict().items():
+                setattr(stats, name, value)
+            stats.ttft_ms = 0
+        async for chunk in story_result_cache.chunks(pooled.content):
+            yield chunk
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._fill_forever())
+            self.logger.info(f"Story pool filler started: {len(self._entries)} combinations x {self.target_size}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _fill_forever(self):
+        while True:
+            self._refill_needed.clear()
+            await self._fill()
+            try:
+                await asyncio.wait_for(self._refill_needed.wait(), timeout=settings.story_pool.REFILL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fill(self):
+        """Generate one story per short combination per pass, so every combination gets one early"""
+        failures = 0
+        while failures < self.MAX_FAILURES_IN_A_ROW:
+            short = [key for key, entries in self._entries.items() if len(entries) < self.target_size]
+            if not short:
+                return
+            for key in short:
+                try:
+                    # A discarded story counts as a failure too, so a model that never keeps the placeholder cannot spin
+                    failures = 0 if await self._generate(key) else failures + 1
+                except Exception as e:
+                    failures += 1
+                    self.counters["failures"] += 1
+                    self.logger.warning(f"Story pool generation for {key} failed: {str(e)}")
+                if failures >= self.MAX_FAILURES_IN_A_ROW:
+                    # Provider trouble: retry on the next refill
+                    return
+
+    async def _generate(self, key: PoolKey) -> bool:
+        stats = GenerationStats()
+        content = await self.generation.generate_story_with_heroes(self._placeholder_request(key), stats)
+        leftover = content.replace(HERO_PLACEHOLDER, "")
+        if HERO_PLACEHOLDER not in content or "{HERO" in leftover or "HERO}" in leftover:
+            # The model did not keep the placeholder verbatim: it could not be personalized
+            self.counters["discarded"] += 1
+            self.logger.info(f"Discarded pre-generated story for {key}: hero placeholder not kept verbatim")
+            return False
+        self._entries[key].append(PooledStory(content, stats))
+        self.counters["generated"] += 1
+        return True
+
+    @staticmethod
+    def _placeholder_request(key: PoolKey) -> StoryGenerateWithHeroesRequest:
+        language, style, length, gender, age_bucket = key
+        hero = HeroOut(
+            id=PLACEHOLDER_UUID,
+            user_id=PLACEHOLDER_UUID,
+            name=HERO_PLACEHOLDER,
+            gender=gender,
+            age=age_bucket or 14,
+            created_at=datetime.now(timezone.utc)
+        )
+        return StoryGenerateWithHeroesRequest(
+            story_name=f"{HERO_PLACEHOLDER}'s first adventure",
+            story_idea=(
+                f"A warm story about the hero making a new friend. The hero's name is a placeholder: "
+                f"always write it exactly as {HERO_PLACEHOLDER}, never translate, inflect or decline it."
+            ),
+            story_style=StoryStyle(style),
+            language=Language(language),
+            story_length=StoryLength(length),
+            heroes=[hero]
+        )
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "combinations": len(self._entries),
+            "target_size": self.target_size,
+            "available": sum(len(entries) for entries in self._entries.values()),
+            "filler_running": self._task is not None and not self._task.done(),
+            **self.counters,
+        }
+
+
+# Create service instance
+story_pool = StoryPool()
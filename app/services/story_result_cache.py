@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import AsyncGenerator, Optional
+
+from cachetools import TTLCache
+
+from app.core.configs import settings
+from app.schemas.story import StoryGenerateWithHeroesRequest
+from app.services.llm_providers import GenerationStats
+from app.services.story_fingerprint import canonical_story_request, hash_payload
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that counts LRU evictions and TTL expirations"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.expirations += len(expired)
+        return expired
+
+
+class StoryResultCache:
+    """
+    Finished story texts keyed by what was asked for, not by who asked.
+
+    Onboarding and the demo account send the same story requests over and
+    over; a hit is replayed as a stream of content chunks, so clients see the
+    same protocol as for a fresh generation. Heroes are compared by their
+    attributes, so the same hero created by different users matches.
+    """
+
+    MODEL = "result-cache"  # model recorded for stories served from the cache
+
+    def __init__(
+        self,
+        enabled: bool,
+        max_entries: int,
+        ttl_seconds: float,
+        replay_chunk_chars: int,
+        replay_delay: float
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.enabled = enabled
+        self.replay_chunk_chars = replay_chunk_chars
+        self.replay_delay = replay_delay
+        self._cache = _CountingTTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self.counters = {"hits": 0, "misses": 0, "bypassed": 0, "stored": 0}
+
+    def key(self, story_data: StoryGenerateWithHeroesRequest) -> Optional[str]:
+        """Cache key of the request, or None when the cache must not be used for it"""
+        if not self.enabled:
+            return None
+        if story_data.bypass_cache:
+            self.counters["bypassed"] += 1
+            return None
+        return hash_payload(canonical_story_request(story_data, hero_ids=False))
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        content = self._cache.get(key)
+        self.counters["hits" if content is not None else "misses"] += 1
+        return content
+
+    def put(self, key: Optional[str], content: str):
+        if key is None or not content:
+            return
+        self._cache[key] = content
+        self.counters["stored"] += 1
+
+    async def replay(self, content: str, stats: Optional[GenerationStats] = None) -> AsyncGenerator[str, None]:
+        """Stream a cached story like a live generation"""
+        if stats is not None:
+            stats.model = self.MODEL
+            stats.set_usage(0, 0, 0)
+            stats.ttft_ms = 0
+        self.logger.info(f"Replaying cached story of {len(content)} characters")
+        async for chunk in self.chunks(content):
+            yield chunk
+
+    async def chunks(self, content: str) -> AsyncGenerator[str, None]:
+        """Split a finished story into small, paced content chunks"""
+        for start in range(0, len(content), self.replay_chunk_chars):
+            if start and self.replay_delay:
+                await asyncio.sleep(self.replay_delay)
+            yield content[start:start + self.replay_chunk_chars]
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "enabled": self.enabled,
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else None,
+            "evictions": self._cache.evictions,
+            "expirations": self._cache.expirations,
+            "size": len(self._cache),
+            "max_entries": self._cache.maxsize,
+        }
+
+
+# Create service instance
+story_result_cache = StoryResultCache(
+    enabled=settings.story_generation.RESULT_CACHE_ENABLED,
+    max_entries=settings.story_generation.RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.story_generation.RESULT_CACHE_TTL_SECONDS,
+    replay_chunk_chars=settings.story_generation.RESULT_CACHE_REPLAY_CHUNK_CHARS,
+    replay_delay=settings.story_generation.RESULT_CACHE_REPLAY_DELAY_MS / 1000
+)
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from app.core.configs import settings
+from app.schemas.story import StoryGenerateWithHeroesRequest
+from app.services.story_fingerprint import canonical_story_request, hash_payload
+
+
+# (SSE event id, message); the id is None for messages that are not part of the log
+StreamEvent = Tuple[Optional[str], dict]
+
+
+class StoryGenerationFlight:
+    """
+    One upstream story generation that any number of listeners can follow.
+
+    Messages are kept in a bounded in-memory log; message number `seq` has the
+    event id `{flight id}:{seq}`, so a client can resume after the last id it saw.
+    """
+
+    def __init__(self, key: str, user_id: UUID, detached: bool = False):
+        # Also the ID the story is saved under
+        self.id = uuid4()
+        self.key = key
+        self.user_id = user_id
+        # Detached generations keep running (and get persisted) with no listeners
+        self.detached = detached
+        self.messages: List[dict] = []
+        # Sequence number of messages[0]; grows when the log is trimmed
+        self.first_seq = 0
+        self.done = False
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self._updated = asyncio.Event()
+        self._orphan_timer: Optional[asyncio.TimerHandle] = None
+
+    def publish(self, message: dict):
+        self.messages.append(message)
+        max_events = settings.story_streaming.EVENT_LOG_MAX_EVENTS
+        if len(self.messages) > max_events:
+            # Trim in batches so publishing stays O(1) amortized
+            trimmed = len(self.messages) - max_events // 2
+            del self.messages[:trimmed]
+            self.first_seq += trimmed
+            logging.warning(f"Event log of story generation {self.id} trimmed to {len(self.messages)} events")
+        self._wake()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def follow(self, after_seq: int = -1) -> AsyncGenerator[StreamEvent, None]:
+        """Replay the messages after `after_seq`, then follow live output"""
+        self._attach()
+        seq = after_seq + 1
+        try:
+            while True:
+                if seq < self.first_seq:
+                    logging.warning(
+                        f"Listener of story generation {self.id} skipped {self.first_seq - seq} trimmed events"
+                    )
+                    seq = self.first_seq
+                while seq - self.first_seq < len(self.messages):
+                    yield self.event_id(seq), self.messages[seq - self.first_seq]
+                    seq += 1
+                if self.done:
+                    return
+                await self._updated.wait()
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self.subscribers += 1
+        if self._orphan_timer:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+
+    def _detach(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done and not self.detached:
+            grace = settings.story_streaming.SINGLE_FLIGHT_ORPHAN_GRACE_SECONDS
+            self._orphan_timer = asyncio.get_running_loop().call_later(grace, self._cancel_if_orphaned)
+
+    def _cancel_if_orphaned(self):
+        self._orphan_timer = None
+        if self.subscribers == 0 and not self.detached and self.task and not self.task.done():
+            logging.info(f"Cancelling story generation {self.id}: no listeners left")
+            self.task.cancel()
+
+    def make_detached(self):
+        """Keep the generation running without listeners from now on"""
+        self.detached = True
+        if self._orphan_timer:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+
+    @property
+    def status(self) -> str:
+        if not self.done:
+            return "running"
+        if self.cancelled:
+            return "cancelled"
+        last_type = self.messages[-1]["type"] if self.messages else None
+        return "completed" if last_type == "completed" else "failed"
+
+    def snapshot(self) -> dict:
+        """Current state of the generation for polling clients"""
+        last = self.messages[-1] if self.messages else {}
+        return {
+            "job_id": str(self.id),
+            "status": self.status,
+            "story_id": last.get("story_id"),
+            "content": "".join(message["data"] for message in self.messages if message["type"] == "content"),
+            "error": last.get("message") if last.get("type") == "error" else None,
+        }
+
+
+class StorySingleFlight:
+    """
+    Coalesces identical in-flight story generations of the same user.
+
+    The first request starts the upstream generation in a background task; a
+    repeated request with the same fingerprint (typically a client retry)
+    attaches to it instead of starting a second OpenAI call, so only one
+    Story row is persisted.
+
+    Every generation is also registered by its id and kept for a while after
+    it finishes: STORY_EVENT_LOG_RETENTION_SECONDS so a reconnecting client can
+    resume with Last-Event-ID, STORY_JOB_RETENTION_SECONDS for detached
+    generations that clients poll or re-stream by job id.
+
+    All of this is per process: a generation can only be followed, resumed or
+    re-streamed on the instance running it. Its story is saved under the
+    generation id, which is how a finished job is still found afterwards.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._flights: Dict[str, StoryGenerationFlight] = {}
+        self._by_id: Dict[UUID, StoryGenerationFlight] = {}
+
+    @staticmethod
+    def fingerprint(story_data: StoryGenerateWithHeroesRequest, user_id: UUID) -> str:
+        """Stable hash of the request: whitespace/case-insensitive text, heroes in ID order"""
+        payload = canonical_story_request(story_data)
+        payload["user_id"] = str(user_id)
+        return hash_payload(payload)
+
+    async def subscribe(
+        self,
+        story_data: StoryGenerateWithHeroesRequest,
+        user_id: UUID,
+        producer_factory: Callable[[UUID], AsyncGenerator[dict, None]],
+        last_event_id: Optional[str] = None
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """
+        Stream the events of the matching generation, resuming or starting one if needed.
+        A new generation's producer is created with the generation (job) ID to save the story under.
+        """
+        key = self.fingerprint(story_data, user_id)
+
+        if last_event_id:
+            resumed = self._resolve_event_id(last_event_id, user_id)
+            if resumed and resumed[0].key == key:
+                flight, seq = resumed
+                self.logger.info(f"Resuming story generation {flight.id} for user {user_id} after event {seq}")
+                async with aclosing(flight.follow(after_seq=seq)) as events:
+                    async for event in events:
+                        yield event
+                return
+            self.logger.info(f"Cannot resume from event {last_event_id} for user {user_id}, starting over")
+
+        coalesce = settings.story_streaming.SINGLE_FLIGHT_ENABLED
+        flight = self._flights.get(key) if coalesce else None
+
+        if flight is None:
+            flight = StoryGenerationFlight(key, user_id, detached=story_data.detached)
+            if coalesce:
+                self._flights[key] = flight
+            self._by_id[flight.id] = flight
+            flight.task = asyncio.create_task(self._run(flight, producer_factory(flight.id)))
+            self.logger.info(f"Started story generation {flight.id} for user: {user_id}")
+        else:
+            self.logger.info(
+                f"Attaching user {user_id} to in-flight story generation {flight.id} "
+                f"({len(flight.messages)} messages to replay)"
+            )
+
+        if story_data.detached:
+            flight.make_detached()
+            # Sent first so a client that drops right away still knows what to poll
+            yield None, {"type": "job", "job_id": str(flight.id)}
+
+        async with aclosing(flight.follow()) as events:
+            async for event in events:
+                yield event
+
+    def _resolve_event_id(self, event_id: str, user_id: UUID) -> Optional[Tuple[StoryGenerationFlight, int]]:
+        """Flight and sequence number behind a Last-Event-ID of this user, if still retained"""
+        try:
+            flight_id, seq = event_id.rsplit(":", 1)
+            flight = self._by_id.get(UUID(flight_id))
+            seq = int(seq)
+        except ValueError:
+            return None
+        if flight is None or flight.user_id != user_id:
+            return None
+        return flight, seq
+
+    def get_job(self, job_id: UUID, user_id: UUID) -> Optional[StoryGenerationFlight]:
+        """Detached generation of this user, running or recently finished"""
+        flight = self._by_id.get(job_id)
+        if flight is None or not flight.detached or flight.user_id != user_id:
+            return None
+        return flight
+
+    def resolve_job_event_id(self, job_id: UUID, user_id: UUID, last_event_id: Optional[str]) -> int:
+        """Sequence number to resume a job re-stream after (-1 replays everything)"""
+        resumed = self._resolve_event_id(last_event_id, user_id) if last_event_id else None
+        if resumed and resumed[0].id == job_id:
+            return resumed[1]
+        return -1
+
+    async def _run(self, flight: StoryGenerationFlight, producer: AsyncGenerator[dict, None]):
+        try:
+            async for message in producer:
+                flight.publish(message)
+        except asyncio.CancelledError:
+            self.logger.info(f"Story generation {flight.id} cancelled")
+            flight.cancelled = True
+            raise
+        except Exception as e:
+            self.logger.error(f"Story generation {flight.id} failed: {str(e)}")
+            flight.publish({
+                "type": "error",
+                "message": f"Heroes generation failed: {str(e)}"
+            })
+        finally:
+            await producer.aclose()
+            flight.finish()
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            # Keep the finished log around for resuming clients (and job polling), then evict it
+            retention = (
+                settings.story_streaming.JOB_RETENTION_SECONDS
+                if flight.detached
+                else settings.story_streaming.EVENT_LOG_RETENTION_SECONDS
+            )
+            asyncio.get_running_loop().call_later(retention, self._by_id.pop, flight.id, None)
+
+    def active_count(self) -> int:
+        return len(self._flights)
+
+    def retained_count(self) -> int:
+        return len(self._by_id)
+
+
+# Create service instance
+story_single_flight = StorySingleFlight()
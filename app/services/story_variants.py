@@ -0,0 +1,85 @@
+import logging
+import threading
+import uuid
+from typing import List, Optional
+from uuid import UUID
+
+from cachetools import TTLCache
+
+from app.core.configs import settings
+from app.schemas.story import StoryGenerateWithHeroesRequest
+from app.services.llm_providers import GenerationStats
+
+
+class PendingVariants:
+    """Finished variants of one generation, waiting for the user to pick one"""
+
+    def __init__(
+        self,
+        user_id: UUID,
+        story_data: StoryGenerateWithHeroesRequest,
+        contents: List[str],
+        stats: GenerationStats
+    ):
+        self.user_id = user_id
+        self.story_data = story_data
+        self.contents = contents
+        self.stats = stats
+
+
+class StoryVariantStore:
+    """
+    Variants of multi-variant generations until the user chooses one.
+
+    Only the chosen variant is saved as a story; the others are dropped with
+    the choice or when the entry expires. Entries live in process memory, like
+    the single-flight event logs they are announced through, so a selection
+    can only be chosen on the instance that generated it.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.logger = logging.getLogger(__name__)
+        self._pending = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        # Choices are saved from worker threads
+        self._lock = threading.Lock()
+        self.counters = {"stored": 0, "chosen": 0, "restored": 0}
+
+    def put(self, pending: PendingVariants) -> UUID:
+        selection_id = uuid.uuid4()
+        with self._lock:
+            self._pending[selection_id] = pending
+        self.counters["stored"] += 1
+        return selection_id
+
+    def take(self, selection_id: UUID, user_id: UUID, variant: int) -> Optional[PendingVariants]:
+        """
+        Remove and return the variants if `variant` of them can be chosen by the user.
+        Only one of concurrent choices of a selection gets it; put it back with `restore`
+        if saving the choice fails.
+        """
+        with self._lock:
+            pending = self._pending.get(selection_id)
+            if (
+                pending is None
+                or pending.user_id != user_id
+                or variant >= len(pending.contents)
+                or not pending.contents[variant]
+            ):
+                return None
+            del self._pending[selection_id]
+        self.counters["chosen"] += 1
+        return pending
+
+    def restore(self, selection_id: UUID, pending: PendingVariants):
+        """Make taken variants choosable again after the choice could not be saved"""
+        with self._lock:
+            self._pending[selection_id] = pending
+        self.counters["chosen"] -= 1
+        self.counters["restored"] += 1
+
+
+# Create service instance
+story_variant_store = StoryVariantStore(
+    max_entries=settings.story_generation.VARIANTS_MAX_ENTRIES,
+    ttl_seconds=settings.story_generation.VARIANTS_TTL_SECONDS
+)
@@ -0,0 +1,70 @@
+import logging
+import threading
+from typing import Optional
+from uuid import UUID
+
+from cachetools import TTLCache
+
+from app.core.configs import settings
+from app.db.models.user import User
+
+
+class UserIdentityCache:
+    """
+    Active users recently resolved by the get_current_user dependencies, by ID.
+
+    A hit skips the DB round trip (and the pooled connection checkout) that
+    every authenticated request otherwise makes just to confirm the user
+    exists and is active. Entries are detached User instances with their
+    columns loaded, shared read-only between requests. The user CRUD drops an
+    entry whenever it deactivates, deletes or changes the user; other
+    instances see such a change within USER_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self, enabled: bool, max_entries: int, ttl_seconds: float):
+        self.logger = logging.getLogger(__name__)
+        self.enabled = enabled
+        self._users = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        # Invalidation can come from sync CRUD calls running in the threadpool
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, user_id: UUID) -> Optional[User]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            user = self._users.get(user_id)
+            self.counters["hits" if user is not None else "misses"] += 1
+        return user
+
+    def put(self, user: Optional[User]):
+        """Cache a user loaded by a session that is closed (or about to be), so the instance is detached"""
+        if not self.enabled or user is None or not user.is_active:
+            return
+        with self._lock:
+            self._users[user.id] = user
+
+    def invalidate(self, user_id: UUID):
+        with self._lock:
+            if self._users.pop(user_id, None) is not None:
+                self.counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "enabled": self.enabled,
+                **self.counters,
+                "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else None,
+                "size": len(self._users),
+                "max_entries": self._users.maxsize,
+                "ttl_seconds": self._users.ttl,
+            }
+
+
+# Create service instance
+user_identity_cache = UserIdentityCache(
+    enabled=settings.user_cache.ENABLED,
+    max_entries=settings.user_cache.MAX_ENTRIES,
+    ttl_seconds=settings.user_cache.TTL_SECONDS
+)
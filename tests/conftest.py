@@ -0,0 +1,167 @@
+import asyncio
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import MetaData, create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Settings are read at import time: use the local stand-ins before any app module is imported
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LLM_FAKE_TTFT_MS", "10")
+os.environ.setdefault("LLM_FAKE_INTER_TOKEN_MS", "0")
+
+from app.core.configs import settings  # noqa: E402
+from app.db import models  # noqa: E402,F401  (registers every table)
+from app.db.base_classes import BaseUser  # noqa: E402
+from app.db.models.hero import Hero  # noqa: E402
+from app.db.models.user import User  # noqa: E402
+from app.schemas.hero import HeroOut  # noqa: E402
+from app.schemas.story import StoryGenerateWithHeroesRequest  # noqa: E402
+from app.services.llm_providers import FakeLLMProvider  # noqa: E402
+from app.services.llm_scheduler import TokenBudgetScheduler  # noqa: E402
+
+
+class TrackingProvider(FakeLLMProvider):
+    """Fake provider that counts the upstream streams still open"""
+
+    def __init__(self, ttft_ms: int = 10, inter_token_ms: int = 0, failure_rate: float = 0.0):
+        super().__init__(
+            model="fake",
+            ttft_ms=ttft_ms,
+            inter_token_ms=inter_token_ms,
+            failure_rate=failure_rate,
+            rate_limit_rate=0.0,
+            seed=1
+        )
+        self.started = 0
+        self.open = 0
+
+    async def stream(self, messages, max_tokens, temperature, stats=None):
+        self.started += 1
+        self.open += 1
+        try:
+            async for chunk in super().stream(messages, max_tokens, temperature, stats):
+                yield chunk
+        finally:
+            self.open -= 1
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_hero(**fields) -> HeroOut:
+    hero = {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "name": "Fox", "gender": "female", "age": 7}
+    return HeroOut(created_at=datetime(2026, 1, 1), **{**hero, **fields})
+
+
+def make_story_request(*heroes: HeroOut, **fields) -> StoryGenerateWithHeroesRequest:
+    story = {"story_name": "The Lantern", "story_idea": "A fox finds a lantern", "story_style": "Adventure"}
+    return StoryGenerateWithHeroesRequest(heroes=list(heroes) or [make_hero()], **{**story, **fields})
+
+
+@pytest.fixture
+def llm_settings(monkeypatch):
+    """settings.llm, restored after the test"""
+    for name in type(settings.llm).model_fields:
+        monkeypatch.setattr(settings.llm, name, getattr(settings.llm, name))
+    return settings.llm
+
+
+@pytest.fixture
+def scheduler():
+    return TokenBudgetScheduler(rpm_limit=10000, tpm_limit=10_000_000, max_wait_seconds=5, chars_per_token=4)
+
+
+@pytest.fixture
+def messages():
+    return [{"role": "system", "content": "Tell stories."}, {"role": "user", "content": "A story about a fox."}]
+
+
+def _user_tables() -> MetaData:
+    """Copy of the user tables that create_all can build"""
+    metadata = MetaData()
+    for table in BaseUser.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        # Index names are unique per schema and some columns are indexed twice under one name
+        seen = set()
+        for index in sorted(copy.indexes, key=lambda index: index.name):
+            if index.name in seen:
+                copy.indexes.discard(index)
+            seen.add(index.name)
+    return metadata
+
+
+@pytest.fixture
+def session_scope():
+    """
+    db_session_scope over an in-memory SQLite copy of the user tables.
+    Enough for the CRUD paths; Postgres-only behaviour (row locks) is not exercised.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    event.listen(engine, "connect", lambda connection, _: connection.execute("PRAGMA foreign_keys=ON"))
+    _user_tables().create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    @contextmanager
+    def scope():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    yield scope
+    engine.dispose()
+
+
+@pytest.fixture
+def pg_session_scope():
+    """
+    db_session_scope over a throwaway schema of the Postgres database in TEST_DATABASE_URL,
+    for statements SQLite cannot run (data-modifying CTEs, xmax). Skipped without one.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    schema = f"test_{uuid.uuid4().hex}"
+    admin_engine = create_engine(url)
+    with admin_engine.begin() as connection:
+        connection.execute(text(f'CREATE SCHEMA "{schema}"'))
+    # On the search path, so raw SQL (migrations) sees the test tables too
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    _user_tables().create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    @contextmanager
+    def scope():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    try:
+        yield scope
+    finally:
+        engine.dispose()
+        with admin_engine.begin() as connection:
+            connection.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin_engine.dispose()
+
+
+@pytest.fixture
+def user_and_hero(session_scope):
+    """ID of a stored user and one of their heroes"""
+    with session_scope() as db:
+        user = User(apple_id=f"apple-{uuid.uuid4()}")
+        db.add(user)
+        db.flush()
+        hero = Hero(user_id=user.id, name="Fox", gender="female", age=7)
+        db.add(hero)
+        db.commit()
+        return user.id, HeroOut.model_validate(hero)
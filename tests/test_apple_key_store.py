@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import jwt
+
+from app.core.configs import settings
+from app.services.apple_key_store import AppleKeyStore, LocalJWKSSource
+from app.services.apple_verification import AppleVerificationService
+from tests.conftest import run
+
+
+def _store(source, ttl=3600, refresh_ahead=300, min_refetch_interval=60):
+    return AppleKeyStore(source, ttl=ttl, refresh_ahead=refresh_ahead, min_refetch_interval=min_refetch_interval)
+
+
+def test_keys_are_fetched_once_for_concurrent_lookups():
+    source = LocalJWKSSource(delay=0.05)
+    source.add_key("k1")
+    store = _store(source)
+
+    async def scenario():
+        return await asyncio.gather(*(store.get_key("k1") for _ in range(20)))
+
+    keys = run(scenario())
+
+    assert source.fetches == 1
+    assert all(key is not None and key[1] == "RS256" for key in keys)
+
+
+def test_rotated_key_is_refetched():
+    source = LocalJWKSSource()
+    source.add_key("k1")
+    store = _store(source, min_refetch_interval=0)
+
+    async def scenario():
+        await store.get_key("k1")
+        source.remove_key("k1")
+        source.add_key("k2")
+        return await store.get_key("k2")
+
+    assert run(scenario()) is not None
+    assert source.fetches == 2
+    assert store.key_ids() == ["k2"]
+    assert store.counters["unknown_kid_refetches"] == 1
+
+
+def test_unknown_key_refetches_are_rate_limited():
+    source = LocalJWKSSource()
+    source.add_key("k1")
+    store = _store(source, min_refetch_interval=60)
+
+    async def scenario():
+        await store.get_key("k1")
+        store._last_attempt = time.monotonic() - 61
+        # Tokens signed with a key Apple does not publish
+        return [await store.get_key("forged") for _ in range(5)]
+
+    assert run(scenario()) == [None] * 5
+    assert source.fetches == 2
+
+
+def test_stale_keys_are_served_while_refreshing():
+    source = LocalJWKSSource(delay=0.05)
+    source.add_key("k1")
+    store = _store(source, ttl=10, refresh_ahead=5, min_refetch_interval=0)
+
+    async def scenario():
+        await store.get_key("k1")
+        store._fetched_at -= 6
+        started = time.monotonic()
+        key = await store.get_key("k1")
+        waited = time.monotonic() - started
+        await store._fetch_task
+        return key, waited
+
+    key, waited = run(scenario())
+
+    assert key is not None
+    assert waited < 0.05
+    assert source.fetches == 2
+    assert store.counters["background_refreshes"] == 1
+
+
+def test_failed_refresh_keeps_the_keys():
+    source = LocalJWKSSource()
+    source.add_key("k1")
+    store = _store(source, ttl=10, refresh_ahead=5, min_refetch_interval=0)
+
+    async def unavailable():
+        raise ConnectionError("appleid.apple.com unavailable")
+
+    async def scenario():
+        await store.get_key("k1")
+        source.fetch = unavailable
+        store._fetched_at -= 6
+        await store.get_key("k1")
+        await store._fetch_task
+        return await store.get_key("k1")
+
+    assert run(scenario()) is not None
+    assert store.counters["fetch_errors"] >= 1
+
+
+def test_token_signed_with_a_published_key_verifies():
+    source = LocalJWKSSource()
+    private_key = source.add_key("k1")
+    service = AppleVerificationService(key_store=_store(source))
+    now = int(time.time())
+    claims = {
+        "sub": "apple-user",
+        "aud": settings.apple_signin.BUNDLE_ID,
+        "iss": settings.apple_signin.APPLE_ISSUER,
+        "iat": now,
+        "exp": now + 600,
+    }
+    token = jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": "k1"})
+    # Same key id, but signed with a key Apple never published
+    forged = jwt.encode(claims, LocalJWKSSource().add_key("k1"), algorithm="RS256", headers={"kid": "k1"})
+
+    assert run(service.verify_apple_token(token, "apple-user"))["valid"] is True
+    assert run(service.verify_apple_token(forged, "apple-user"))["valid"] is False
@@ -0,0 +1,100 @@
+import time
+import uuid
+
+import jwt
+import pytest
+
+from app.core.configs import settings
+from app.services import authentication
+from app.services.authentication import AuthService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # Both the token check and the cache's TTL timer read the wall clock
+    monkeypatch.setattr(authentication.time, "time", clock)
+    return clock
+
+
+def _auth(monkeypatch, max_entries=100) -> AuthService:
+    monkeypatch.setattr(settings.jwt_token, "VERIFIED_CACHE_MAX_ENTRIES", max_entries)
+    return AuthService()
+
+
+def _token(user_id, secret=None, **claims) -> str:
+    return jwt.encode(
+        {"sub": str(user_id), **claims},
+        secret or settings.jwt_token.JWT_SECRET_KEY,
+        algorithm=settings.jwt_token.ALGORITHM
+    )
+
+
+def test_cached_token_stops_being_accepted_at_its_exp(monkeypatch, clock):
+    auth = _auth(monkeypatch)
+    user_id = uuid.uuid4()
+    token = _token(user_id, exp=int(clock.now) + 60)
+
+    assert auth.verify_token(token) == user_id
+    clock.now = int(clock.now) + 59
+    assert auth.verify_token(token) == user_id
+    assert auth.counters == {"hits": 1, "misses": 1, "rejected": 0}
+
+    clock.now += 1
+    assert auth.verify_token(token) is None
+    assert auth.counters == {"hits": 1, "misses": 2, "rejected": 1}
+    assert auth.token_cache_stats()["size"] == 0
+
+
+def test_rejected_tokens_are_never_cached(monkeypatch, clock):
+    auth = _auth(monkeypatch)
+    user_id = uuid.uuid4()
+    rejected = [
+        _token(user_id, secret="another-secret", exp=int(clock.now) + 60),
+        _token(user_id, exp=int(clock.now) - 1),
+        _token("not-a-uuid", exp=int(clock.now) + 60),
+        "not.a.jwt",
+    ]
+
+    for _ in range(2):
+        assert [auth.verify_token(token) for token in rejected] == [None] * 4
+
+    assert auth.counters == {"hits": 0, "misses": 8, "rejected": 8}
+    assert auth.token_cache_stats()["size"] == 0
+
+
+def test_permanent_tokens_stay_valid_and_the_cache_is_bounded(monkeypatch, clock):
+    auth = _auth(monkeypatch, max_entries=2)
+    user_ids = [uuid.uuid4() for _ in range(3)]
+    tokens = [_token(user_ids[0]), _token(user_ids[1], exp=int(clock.now) - 1, permanent=True), _token(user_ids[2])]
+
+    assert [auth.verify_token(token) for token in tokens] == user_ids
+    clock.now += 10 * 365 * 24 * 3600
+    assert auth.verify_token(tokens[2]) == user_ids[2]
+
+    stats = auth.token_cache_stats()
+    assert stats["size"] == 2 and stats["max_entries"] == 2
+    assert stats["hits"] == 1
+    # The least recently used permanent token was evicted and is verified again
+    assert auth.verify_token(tokens[0]) == user_ids[0]
+    assert auth.token_cache_stats()["misses"] == 4
+
+
+def test_disabled_cache_verifies_every_time(monkeypatch, clock):
+    monkeypatch.setattr(settings.jwt_token, "VERIFIED_CACHE_ENABLED", False)
+    auth = _auth(monkeypatch)
+    user_id = uuid.uuid4()
+    token = _token(user_id, exp=int(clock.now) + 60)
+
+    assert auth.verify_token(token) == user_id
+    clock.now += 60
+    assert auth.verify_token(token) is None
+    assert auth.token_cache_stats()["size"] == 0
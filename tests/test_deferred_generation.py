@@ -0,0 +1,172 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+from app.crud.deferred_story_job import deferred_story_job_crud
+from app.db.models.deferred_story_job import DeferredStoryJob
+from app.db.models.hero import Hero
+from app.db.models.story import Story
+from app.db.models.user import User
+from app.db.models.user_onboarding import UserOnboardingProgress
+from app.schemas.hero import HeroOut
+from app.services import deferred_generation
+from app.services.deferred_generation import DeferredStoryService
+from app.services.llm_batch import BatchResult, LocalBatchProvider
+from tests.conftest import TrackingProvider, make_story_request, run
+
+
+@pytest.fixture
+def service(session_scope, monkeypatch):
+    monkeypatch.setattr(deferred_generation, "db_session_scope", session_scope)
+    return DeferredStoryService(provider=LocalBatchProvider(TrackingProvider()))
+
+
+def _queue(session_scope, user_and_hero, count):
+    user_id, hero = user_and_hero
+    story_data = make_story_request(hero)
+    with session_scope() as db:
+        return [deferred_story_job_crud.create(db, story_data, user_id).id for _ in range(count)]
+
+
+def _jobs(session_scope):
+    with session_scope() as db:
+        return {job.id: (job.status, job.batch_id, job.story_id, job.error) for job in db.query(DeferredStoryJob)}
+
+
+def test_claim_queued_takes_oldest_jobs_once(session_scope, user_and_hero):
+    job_ids = _queue(session_scope, user_and_hero, 3)
+
+    with session_scope() as db:
+        first = deferred_story_job_crud.claim_queued(db, 2)
+    with session_scope() as db:
+        second = deferred_story_job_crud.claim_queued(db, 2)
+
+    assert [job_id for job_id, _ in first] == job_ids[:2]
+    assert [job_id for job_id, _ in second] == job_ids[2:]
+    assert {status for status, *_ in _jobs(session_scope).values()} == {"submitting"}
+
+
+def test_claims_skip_rows_locked_by_another_instance(session_scope, user_and_hero):
+    _queue(session_scope, user_and_hero, 1)
+    statements = []
+
+    with session_scope() as db:
+        event.listen(db, "do_orm_execute", lambda state: statements.append(state.statement))
+        deferred_story_job_crud.claim_queued(db, 10)
+        deferred_story_job_crud.complete_batch(db, "batch", [])
+
+    locking = [str(statement.compile(dialect=postgresql.dialect())) for statement in statements]
+    assert all(sql.endswith("FOR UPDATE SKIP LOCKED") for sql in locking)
+
+
+def test_submit_and_collect_save_stories(session_scope, user_and_hero, service, llm_settings):
+    job_ids = _queue(session_scope, user_and_hero, 3)
+
+    run(service.submit())
+    jobs = _jobs(session_scope)
+    assert {status for status, *_ in jobs.values()} == {"submitted"}
+    assert len({batch_id for _, batch_id, *_ in jobs.values()}) == 1
+
+    run(service.collect())
+    jobs = _jobs(session_scope)
+    assert [jobs[job_id][0] for job_id in job_ids] == ["completed"] * 3
+    assert service.counters["completed"] == 3
+    with session_scope() as db:
+        assert db.query(Story).count() == 3
+        assert {job.story_id for job in db.query(DeferredStoryJob)} == {story.id for story in db.query(Story)}
+
+
+def test_submit_splits_jobs_into_batches(session_scope, user_and_hero, service, monkeypatch):
+    monkeypatch.setattr(deferred_generation.settings.deferred_generation, "BATCH_SIZE", 2)
+    _queue(session_scope, user_and_hero, 5)
+
+    run(service.submit())
+
+    assert service.counters["batches_submitted"] == 3
+    assert len({batch_id for _, batch_id, *_ in _jobs(session_scope).values()}) == 3
+
+
+def test_failed_submission_requeues_jobs(session_scope, user_and_hero, service):
+    _queue(session_scope, user_and_hero, 2)
+
+    async def unavailable(requests):
+        raise ConnectionError("batch API unavailable")
+
+    service.provider.submit = unavailable
+    with pytest.raises(ConnectionError):
+        run(service.submit())
+
+    assert {(status, batch_id) for status, batch_id, *_ in _jobs(session_scope).values()} == {("queued", None)}
+
+
+def test_complete_batch_fails_jobs_without_usable_result(session_scope, user_and_hero):
+    job_ids = _queue(session_scope, user_and_hero, 3)
+    with session_scope() as db:
+        deferred_story_job_crud.claim_queued(db, 10)
+        deferred_story_job_crud.mark_submitted(db, job_ids, "batch-1")
+
+    results = [
+        BatchResult(str(job_ids[0]), content="Once upon a time."),
+        BatchResult(str(job_ids[1]), error="content_filter"),
+        # No result at all for the third job
+    ]
+    with session_scope() as db:
+        counts = deferred_story_job_crud.complete_batch(db, "batch-1", results)
+
+    assert counts == {"completed": 1, "failed": 2}
+    jobs = _jobs(session_scope)
+    assert jobs[job_ids[0]][0] == "completed" and jobs[job_ids[0]][2] is not None
+    assert jobs[job_ids[1]] == ("failed", "batch-1", None, "content_filter")
+    assert jobs[job_ids[2]] == ("failed", "batch-1", None, "No result in batch")
+
+    # A second collection of the same batch (another instance) settles nothing twice
+    with session_scope() as db:
+        assert deferred_story_job_crud.complete_batch(db, "batch-1", results) == {"completed": 0, "failed": 0}
+
+
+def test_jobs_follow_their_user_and_story(session_scope, user_and_hero, service):
+    job_ids = _queue(session_scope, user_and_hero, 2)
+    run(service.submit())
+    run(service.collect())
+
+    with session_scope() as db:
+        db.delete(db.get(Story, _jobs(session_scope)[job_ids[0]][2]))
+        db.commit()
+    jobs = _jobs(session_scope)
+    assert jobs[job_ids[0]][0] == "completed" and jobs[job_ids[0]][2] is None
+    assert jobs[job_ids[1]][2] is not None
+
+    with session_scope() as db:
+        db.delete(db.get(User, user_and_hero[0]))
+        db.commit()
+    assert _jobs(session_scope) == {}
+
+
+def test_complete_batch_fails_only_the_job_that_cannot_be_saved(session_scope, user_and_hero):
+    job_ids = _queue(session_scope, user_and_hero, 2)
+    user_id, _ = user_and_hero
+    with session_scope() as db:
+        stale_hero = Hero(user_id=user_id, name="Owl", gender="male", age=8)
+        db.add(stale_hero)
+        db.commit()
+        stale_request = make_story_request(HeroOut.model_validate(stale_hero))
+    with session_scope() as db:
+        job_ids.append(deferred_story_job_crud.create(db, stale_request, user_id).id)
+        deferred_story_job_crud.claim_queued(db, 10)
+        deferred_story_job_crud.mark_submitted(db, job_ids, "batch-1")
+    # The hero of the last job is deleted while the batch runs: its story_heroes row violates the FK
+    with session_scope() as db:
+        db.delete(db.get(Hero, stale_request.heroes[0].id))
+        db.commit()
+
+    results = [BatchResult(str(job_id), content="Once upon a time.") for job_id in job_ids]
+    with session_scope() as db:
+        counts = deferred_story_job_crud.complete_batch(db, "batch-1", results)
+
+    assert counts == {"completed": 2, "failed": 1}
+    jobs = _jobs(session_scope)
+    assert [jobs[job_id][0] for job_id in job_ids] == ["completed", "completed", "failed"]
+    assert jobs[job_ids[2]] == ("failed", "batch-1", None, "Could not save story")
+    with session_scope() as db:
+        assert {story.id for story in db.query(Story)} == {jobs[job_id][2] for job_id in job_ids[:2]}
+        assert db.query(UserOnboardingProgress).filter_by(user_id=user_id).count() == 1
@@ -0,0 +1,150 @@
+import random
+
+import pytest
+
+from app.core.configs import settings
+from app.schemas.story import Language, StoryLength
+from app.services.generation_budget import (
+    STORY_LENGTH_WORDS,
+    TOKENS_PER_WORD,
+    GenerationBudgetPolicy,
+    SentenceBoundaryStop,
+)
+from app.services.llm_resilience import ResilientLLM
+from tests.conftest import TrackingProvider, make_story_request, run
+
+
+TEXT = (
+    "Once upon a time, a little fox found a lantern. “Who lost you?” she asked the dark forest! "
+    "Nobody answered… So she carried it home, humming softly."
+)
+
+
+def _feed(stop, deltas):
+    return [stop(delta) for delta in deltas]
+
+
+def _split(text, rng):
+    """`text` cut into deltas of 1-4 characters, splitting words and sentences anywhere"""
+    deltas, start = [], 0
+    while start < len(text):
+        end = start + rng.randint(1, 4)
+        deltas.append(text[start:end])
+        start = end
+    return deltas
+
+
+def test_words_split_across_deltas_are_counted_once():
+    rng = random.Random(7)
+    for _ in range(200):
+        stop = SentenceBoundaryStop(target_words=1000)
+        _feed(stop, _split(TEXT, rng))
+        assert stop.words == len(TEXT.split())
+
+
+def test_stops_at_the_first_sentence_end_once_the_target_is_reached():
+    stop = SentenceBoundaryStop(target_words=4)
+
+    assert _feed(stop, ["Hi", " there.", " Once", " up", "on a", " ti", "me", "."]) == [
+        False, False, False, False, False, False, False, True
+    ]
+    assert stop.words == 6
+
+
+def test_exact_target_word_ending_a_sentence_stops():
+    stop = SentenceBoundaryStop(target_words=3)
+
+    assert _feed(stop, ["One", " two", " three."]) == [False, False, True]
+
+
+def test_sentence_end_before_the_target_does_not_stop():
+    stop = SentenceBoundaryStop(target_words=5)
+
+    assert _feed(stop, ["The", " end.", " Or", " is", " it?"]) == [False, False, False, False, True]
+
+
+@pytest.mark.parametrize("ending", [".”", "!»", "?\"", "…)", ". \n"])
+def test_closing_quotes_and_trailing_whitespace_after_a_sentence_end(ending):
+    stop = SentenceBoundaryStop(target_words=1)
+
+    assert stop("Yes" + ending) is True
+
+
+def test_whitespace_deltas_separate_words():
+    stop = SentenceBoundaryStop(target_words=10)
+
+    _feed(stop, ["a", "", " ", "b", "\n", "c"])
+
+    assert stop.words == 3
+
+
+def _budget_settings(monkeypatch, **values):
+    for name, value in values.items():
+        monkeypatch.setattr(settings.story_generation, name, value)
+
+
+@pytest.mark.parametrize("language, length, expected", [
+    (Language.ENGLISH, StoryLength.VERY_SHORT, 351),
+    (Language.ENGLISH, StoryLength.LONG, 878),
+    (Language.SPANISH, StoryLength.MEDIUM, 832),
+    (Language.GERMAN, StoryLength.SHORT, 663),
+    (Language.RUSSIAN, StoryLength.VERY_LONG, 1950),
+])
+def test_max_tokens_per_language_and_length(monkeypatch, language, length, expected):
+    _budget_settings(monkeypatch, BUDGET_ENABLED=True, BUDGET_HEADROOM=1.3, BUDGET_MAX_TOKENS=2048)
+
+    assert GenerationBudgetPolicy().max_tokens(make_story_request(language=language, story_length=length)) == expected
+
+
+def test_max_tokens_covers_the_upper_word_bound_of_every_request(monkeypatch):
+    _budget_settings(monkeypatch, BUDGET_ENABLED=True, BUDGET_HEADROOM=1.0, BUDGET_MAX_TOKENS=10_000)
+    policy = GenerationBudgetPolicy()
+
+    for language in Language:
+        for length in StoryLength:
+            _, max_words = STORY_LENGTH_WORDS[length.value]
+            budget = policy.max_tokens(make_story_request(language=language, story_length=length))
+            assert budget >= max_words * TOKENS_PER_WORD[language.value]
+
+
+def test_max_tokens_cap_and_flat_fallback(monkeypatch):
+    story_data = make_story_request(language=Language.RUSSIAN, story_length=StoryLength.VERY_LONG)
+    _budget_settings(monkeypatch, BUDGET_ENABLED=True, BUDGET_HEADROOM=1.3, BUDGET_MAX_TOKENS=1500)
+    assert GenerationBudgetPolicy().max_tokens(story_data) == 1500
+
+    _budget_settings(monkeypatch, BUDGET_ENABLED=False)
+    assert GenerationBudgetPolicy().max_tokens(story_data) == settings.openai.MAX_TOKENS
+
+
+def test_stop_condition_targets_the_upper_word_bound(monkeypatch):
+    story_data = make_story_request(story_length=StoryLength.SHORT)
+    _budget_settings(monkeypatch, EARLY_STOP_ENABLED=True)
+    policy = GenerationBudgetPolicy()
+
+    stop, other = policy.stop_condition(story_data), policy.stop_condition(story_data)
+    assert stop.target_words == STORY_LENGTH_WORDS[StoryLength.SHORT.value][1]
+    assert stop is not other
+
+    _budget_settings(monkeypatch, EARLY_STOP_ENABLED=False)
+    assert policy.stop_condition(story_data) is None
+
+
+def test_stream_is_closed_at_the_sentence_end_after_the_target(llm_settings, scheduler, messages):
+    provider = TrackingProvider()
+    llm = ResilientLLM(provider, scheduler)
+
+    async def scenario():
+        stop = SentenceBoundaryStop(target_words=30)
+        return [
+            chunk async for chunk in llm.stream(
+                messages, max_tokens=200, temperature=0.7, estimated_tokens=300, stop_when=stop
+            )
+        ]
+
+    chunks = run(scenario())
+
+    # The fake provider writes sentences of 12 words: word 30 is inside the third one
+    assert len(chunks) == 36
+    assert chunks[-1].endswith(".")
+    assert provider.open == 0
+    assert llm.counters["stopped_early"] == 1
@@ -0,0 +1,141 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.services import generation_quota
+from app.services.generation_quota import (
+    GenerationQuotaService,
+    InMemoryQuotaStore,
+    QuotaExceededError,
+    QuotaLimits,
+)
+from app.services.llm_providers import GenerationStats
+from app.services.llm_resilience import ResilientLLM
+from tests.conftest import TrackingProvider, run
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(generation_quota, "time", clock)
+    return clock
+
+
+def _service(max_concurrent=0, requests_per_minute=0, daily_tokens=0):
+    limits = QuotaLimits(max_concurrent, requests_per_minute, daily_tokens, lease_timeout=600)
+    return GenerationQuotaService(InMemoryQuotaStore(), limits)
+
+
+def _stats(prompt_tokens, completion_tokens):
+    stats = GenerationStats()
+    stats.set_usage(prompt_tokens, completion_tokens, 0)
+    return stats
+
+
+def test_concurrent_generations_are_limited(clock):
+    quota = _service(max_concurrent=2)
+    user_id = uuid.uuid4()
+
+    async def scenario():
+        leases = [await quota.acquire(user_id), await quota.acquire(user_id)]
+        with pytest.raises(QuotaExceededError) as rejected:
+            await quota.acquire(user_id)
+        await quota.release(user_id, leases[0])
+        await quota.acquire(user_id)
+        return rejected.value
+
+    assert run(scenario()).reason == "concurrency"
+    assert quota.counters["concurrency"] == 1
+
+
+def test_requests_per_minute_are_limited(clock):
+    quota = _service(requests_per_minute=2)
+    user_id = uuid.uuid4()
+
+    async def scenario():
+        for _ in range(2):
+            await quota.release(user_id, await quota.acquire(user_id))
+        clock.now += 20
+        with pytest.raises(QuotaExceededError) as rejected:
+            await quota.acquire(user_id)
+        clock.now += 41
+        await quota.acquire(user_id)
+        return rejected.value
+
+    rejected = run(scenario())
+    assert rejected.reason == "rate"
+    assert rejected.retry_after == 40
+
+
+def test_daily_tokens_count_reported_usage(clock):
+    quota = _service(daily_tokens=1000)
+    user_id = uuid.uuid4()
+
+    async def scenario():
+        await quota.release(user_id, await quota.acquire(user_id), _stats(300, 500))
+        await quota.release(user_id, await quota.acquire(user_id), _stats(100, 150))
+        with pytest.raises(QuotaExceededError) as rejected:
+            await quota.acquire(user_id)
+        clock.now += 24 * 3600 + 1
+        await quota.acquire(user_id)
+        return rejected.value
+
+    assert run(scenario()).reason == "daily_tokens"
+
+
+def test_idle_users_are_forgotten(clock):
+    quota = _service(daily_tokens=1000)
+    store = quota.store
+
+    async def scenario():
+        for _ in range(50):
+            user_id = uuid.uuid4()
+            await quota.release(user_id, await quota.acquire(user_id))
+        heavy_user = uuid.uuid4()
+        await quota.release(heavy_user, await quota.acquire(heavy_user), _stats(100, 100))
+        assert store.user_count() == 51
+
+        clock.now += 61
+        await quota.acquire(heavy_user)
+
+    run(scenario())
+    # Only the user with tokens still in the 24 hour window is kept
+    assert store.user_count() == 1
+
+
+def test_cancelled_stream_is_charged_for_what_was_streamed(llm_settings, scheduler, messages):
+    quota = _service(daily_tokens=1_000_000)
+    llm = ResilientLLM(TrackingProvider(inter_token_ms=20), scheduler)
+    user_id = uuid.uuid4()
+    stats = GenerationStats()
+
+    async def consume():
+        lease_id = await quota.acquire(user_id)
+        try:
+            async for _ in llm.stream(messages, max_tokens=500, temperature=0.7, estimated_tokens=600, stats=stats):
+                pass
+        finally:
+            await quota.release(user_id, lease_id, stats)
+
+    async def scenario():
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.15)
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+
+    run(scenario())
+
+    assert stats.prompt_tokens == 100
+    assert 0 < stats.completion_tokens < 500
+    charged = sum(tokens for _, tokens in quota.store._tokens[user_id])
+    assert charged == stats.prompt_tokens + stats.completion_tokens
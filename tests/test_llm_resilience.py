@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.llm_providers import LLMError
+from app.services.llm_resilience import CircuitBreaker, CircuitOpenError, ResilientLLM
+from app.services.llm_scheduler import LLMQueueTimeoutError
+from tests.conftest import TrackingProvider, run
+
+
+async def _drain(llm, messages, max_tokens=5):
+    return [chunk async for chunk in llm.stream(messages, max_tokens=max_tokens, temperature=0.7, estimated_tokens=100)]
+
+
+def _pending_tasks():
+    return [task for task in asyncio.all_tasks() if task is not asyncio.current_task() and not task.done()]
+
+
+def test_stream_yields_text_and_closes_upstream(llm_settings, scheduler, messages):
+    provider = TrackingProvider()
+    llm = ResilientLLM(provider, scheduler)
+
+    chunks = run(_drain(llm, messages))
+
+    assert len(chunks) == 5
+    assert provider.open == 0
+    assert llm.counters["succeeded_first_try"] == 1
+
+
+def test_cancel_during_hedge_wait_closes_upstream(llm_settings, scheduler, messages):
+    llm_settings.HEDGE_ENABLED = True
+    llm_settings.HEDGE_INITIAL_DELAY_MS = 5000
+    provider = TrackingProvider(ttft_ms=5000)
+    llm = ResilientLLM(provider, scheduler)
+
+    async def scenario():
+        consumer = asyncio.create_task(_drain(llm, messages))
+        await asyncio.sleep(0.2)
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+        await asyncio.sleep(0)
+        return _pending_tasks()
+
+    assert run(scenario()) == []
+    assert provider.started == 1
+    assert provider.open == 0
+    assert llm.counters["cancelled_streams"] == 1
+    assert llm.breaker._probe_in_flight is False
+
+
+def test_hedge_admission_timeout_closes_primary(llm_settings, scheduler, messages):
+    llm_settings.HEDGE_ENABLED = True
+    llm_settings.HEDGE_INITIAL_DELAY_MS = 50
+    llm_settings.HEDGE_MIN_DELAY_MS = 0
+    provider = TrackingProvider(ttft_ms=2000)
+    llm = ResilientLLM(provider, scheduler)
+    admitted = scheduler.acquire
+
+    async def acquire_once(estimated_tokens):
+        if scheduler._admitted:
+            raise LLMQueueTimeoutError("queue full")
+        return await admitted(estimated_tokens)
+
+    scheduler.acquire = acquire_once
+
+    async def scenario():
+        with pytest.raises(LLMQueueTimeoutError):
+            await _drain(llm, messages)
+        return _pending_tasks()
+
+    assert run(scenario()) == []
+    assert provider.open == 0
+    assert llm.counters["hedges_launched"] == 1
+
+
+def test_late_first_chunk_is_hedged_and_loser_closed(llm_settings, scheduler, messages):
+    llm_settings.HEDGE_ENABLED = True
+    llm_settings.HEDGE_INITIAL_DELAY_MS = 50
+    llm_settings.HEDGE_MIN_DELAY_MS = 0
+    provider = TrackingProvider(ttft_ms=300)
+    llm = ResilientLLM(provider, scheduler)
+
+    chunks = run(_drain(llm, messages))
+
+    assert len(chunks) == 5
+    assert provider.started == 2
+    assert provider.open == 0
+    assert llm.counters["hedges_launched"] == 1
+
+
+def test_queue_timeouts_do_not_open_the_circuit(llm_settings, scheduler, messages):
+    llm_settings.CIRCUIT_FAILURE_THRESHOLD = 2
+    llm = ResilientLLM(TrackingProvider(), scheduler)
+
+    async def queue_full(estimated_tokens):
+        raise LLMQueueTimeoutError("queue full")
+
+    scheduler.acquire = queue_full
+
+    for _ in range(3):
+        with pytest.raises(LLMQueueTimeoutError):
+            run(_drain(llm, messages))
+
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_provider_errors_open_the_circuit(llm_settings, scheduler, messages):
+    llm_settings.CIRCUIT_FAILURE_THRESHOLD = 2
+    llm_settings.RETRY_MAX_ATTEMPTS = 0
+    provider = TrackingProvider(failure_rate=1.0)
+    llm = ResilientLLM(provider, scheduler)
+
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            run(_drain(llm, messages))
+
+    assert llm.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        run(_drain(llm, messages))
+    assert provider.started == 2
+    assert llm.counters["circuit_rejected"] == 1
+
+
+def test_half_open_probe_success_closes_the_circuit(llm_settings, scheduler, messages):
+    llm_settings.CIRCUIT_FAILURE_THRESHOLD = 1
+    llm_settings.CIRCUIT_OPEN_SECONDS = 0.05
+    llm = ResilientLLM(TrackingProvider(), scheduler)
+    llm.breaker.record_failure()
+    assert llm.breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    chunks = run(_drain(llm, messages))
+
+    assert len(chunks) == 5
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_only_the_probe_releases_the_probe_slot(llm_settings, scheduler, messages):
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=0)
+    assert breaker.before_call() is False
+    breaker.record_failure()
+
+    assert breaker.before_call() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    llm = ResilientLLM(TrackingProvider(ttft_ms=200), scheduler)
+    llm.breaker = breaker
+
+    async def scenario():
+        # A cancelled call that was admitted before the circuit opened must leave the probe alone
+        llm.breaker.state = CircuitBreaker.CLOSED
+        consumer = asyncio.create_task(_drain(llm, messages))
+        await asyncio.sleep(0.05)
+        llm.breaker.state = CircuitBreaker.HALF_OPEN
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+
+    run(scenario())
+    assert breaker._probe_in_flight is True
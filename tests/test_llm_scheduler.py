@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import llm_scheduler
+from app.services.llm_scheduler import LLMQueueTimeoutError, TokenBudgetScheduler
+from tests.conftest import run
+
+
+class FakeClock:
+    """time.monotonic and asyncio.sleep of the scheduler: sleeping moves the clock forward"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_scheduler, "time", clock)
+    monkeypatch.setattr(llm_scheduler, "asyncio", SimpleNamespace(Lock=asyncio.Lock, sleep=clock.sleep))
+    return clock
+
+
+def _scheduler(rpm_limit=1000, tpm_limit=1_000_000, max_wait_seconds=120):
+    return TokenBudgetScheduler(rpm_limit, tpm_limit, max_wait_seconds=max_wait_seconds, chars_per_token=4)
+
+
+def test_requests_over_the_rpm_limit_wait_for_the_oldest_to_leave(clock):
+    scheduler = _scheduler(rpm_limit=2)
+
+    async def scenario():
+        await scheduler.acquire(10)
+        clock.now += 15
+        await scheduler.acquire(10)
+        return await scheduler.acquire(10)
+
+    third = run(scenario())
+
+    assert clock.sleeps == [45]
+    assert third.waited == 45
+    assert scheduler.stats()["requests_last_minute"] == 2
+
+
+def test_tokens_over_the_tpm_limit_wait_until_enough_leave_the_window(clock):
+    scheduler = _scheduler(tpm_limit=1000)
+
+    async def scenario():
+        await scheduler.acquire(600)
+        clock.now += 10
+        await scheduler.acquire(300)
+        clock.now += 10
+        # 300 of the 900 booked tokens have to leave: the 600 booked at t=0 do at t=60
+        return await scheduler.acquire(400)
+
+    admitted = run(scenario())
+
+    assert clock.sleeps == [40]
+    assert admitted.waited == 40
+    assert scheduler.stats()["tokens_last_minute"] == 700
+
+
+def test_settling_refunds_unused_tokens(clock):
+    scheduler = _scheduler(tpm_limit=1000)
+
+    async def scenario():
+        reservation = await scheduler.acquire(900)
+        # The completion stopped well short of max_tokens
+        scheduler.settle(reservation, 150)
+        return await scheduler.acquire(800)
+
+    admitted = run(scenario())
+
+    assert clock.sleeps == []
+    assert admitted.waited == 0
+    assert scheduler.stats()["tokens_last_minute"] == 950
+
+
+def test_request_larger_than_the_tpm_window(clock):
+    scheduler = _scheduler(tpm_limit=1000)
+
+    async def scenario():
+        # Let through on an empty window
+        first = await scheduler.acquire(5000)
+        clock.now += 60
+        await scheduler.acquire(100)
+        clock.now += 30
+        # Otherwise admitted as soon as the window is empty, not a whole window later
+        return first, await scheduler.acquire(5000)
+
+    first, second = run(scenario())
+
+    assert first.waited == 0
+    assert clock.sleeps == [30]
+    assert second.waited == 30
+
+
+def test_wait_beyond_the_limit_times_out(clock):
+    scheduler = _scheduler(rpm_limit=1, max_wait_seconds=30)
+
+    async def scenario():
+        await scheduler.acquire(10)
+        await scheduler.acquire(10)
+
+    with pytest.raises(LLMQueueTimeoutError):
+        run(scenario())
+
+    assert clock.sleeps == []
+    stats = scheduler.stats()
+    assert stats["timed_out_total"] == 1 and stats["queue_depth"] == 0
+
+
+def test_pause_after_a_provider_429_delays_admissions(clock):
+    scheduler = _scheduler()
+    scheduler.pause(5)
+
+    admitted = run(scheduler.acquire(10))
+
+    assert clock.sleeps == [5]
+    assert admitted.waited == 5
+    assert scheduler.stats()["rate_limited_total"] == 1
@@ -0,0 +1,120 @@
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.core.consts import OnboardingStep
+from app.crud import user_onboarding
+from app.crud.hero import hero_crud
+from app.crud.series import series_crud
+from app.db.models.hero import Hero
+from app.db.models.series import Series
+from app.db.models.user import User
+from app.db.models.user_onboarding import UserOnboardingProgress
+from app.schemas.hero import HeroCreate
+
+
+MIGRATION = Path(__file__).parents[1] / "alembic" / "versions" / "e4b8d1f6a935_unique_onboarding_step_per_user.py"
+
+
+def _steps(session_scope, user_id):
+    with session_scope() as db:
+        return sorted(step.step_name for step in db.query(UserOnboardingProgress).filter_by(user_id=user_id))
+
+
+def _hero_data(name="Fox"):
+    return HeroCreate(name=name, gender="female", age=7)
+
+
+def test_recording_a_step_twice_stores_one_row(session_scope, user_and_hero):
+    user_id, _ = user_and_hero
+    step = OnboardingStep.FIRST_STORY_CREATED
+
+    with session_scope() as db:
+        assert user_onboarding.record_onboarding_step(db, user_id, step) is True
+        assert user_onboarding.record_onboarding_step(db, user_id, step) is False
+        db.commit()
+    with session_scope() as db:
+        assert user_onboarding.record_onboarding_step(db, user_id, step) is False
+        db.commit()
+
+    assert _steps(session_scope, user_id) == [step.value]
+
+
+def test_first_hero_and_series_record_their_step_once(session_scope, user_and_hero):
+    user_id, _ = user_and_hero
+
+    with session_scope() as db:
+        heroes = [hero_crud.create(db, _hero_data(name), user_id) for name in ("Owl", "Bear")]
+        series = [series_crud.create(db, title, None, user_id) for title in ("Forest", "Sea")]
+
+    assert [hero.name for hero in heroes] == ["Owl", "Bear"]
+    assert [item.title for item in series] == ["Forest", "Sea"]
+    assert _steps(session_scope, user_id) == sorted(
+        [OnboardingStep.FIRST_HERO_CREATED.value, OnboardingStep.FIRST_SERIES_CREATED.value]
+    )
+
+
+@pytest.mark.parametrize("create, model", [
+    (lambda db, user_id: hero_crud.create(db, _hero_data("Owl"), user_id), Hero),
+    (lambda db, user_id: series_crud.create(db, "Forest", None, user_id), Series),
+])
+def test_failed_save_leaves_nothing_behind(session_scope, user_and_hero, monkeypatch, create, model):
+    user_id, _ = user_and_hero
+    with session_scope() as db:
+        existing = db.query(model).count()
+
+    def failing_step(db, user_id, step_name):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(user_onboarding, "record_onboarding_step", failing_step)
+    with session_scope() as db:
+        with pytest.raises(RuntimeError):
+            create(db, user_id)
+
+    with session_scope() as db:
+        assert db.query(model).count() == existing
+    assert _steps(session_scope, user_id) == []
+
+
+def test_migration_keeps_the_earliest_row_of_each_step(pg_session_scope):
+    Operations = pytest.importorskip("alembic.operations").Operations
+    MigrationContext = pytest.importorskip("alembic.migration").MigrationContext
+    spec = importlib.util.spec_from_file_location("unique_onboarding_step", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    started = datetime(2026, 1, 1)
+
+    with pg_session_scope() as db:
+        migration_ops = Operations(MigrationContext.configure(db.connection()))
+        with Operations.context(migration_ops.migration_context):
+            migration.downgrade()
+        users = [User(apple_id=f"apple-{n}") for n in range(2)]
+        db.add_all(users)
+        db.flush()
+        # Duplicates left by the old check-then-insert path
+        for user in users:
+            for minutes in (5, 0, 5):
+                db.add(UserOnboardingProgress(
+                    user_id=user.id, step_name="first_story_created", completed_at=started + timedelta(minutes=minutes)
+                ))
+        db.add(UserOnboardingProgress(user_id=users[0].id, step_name="account_created", completed_at=started))
+        db.flush()
+        user_ids = [user.id for user in users]
+
+        with Operations.context(migration_ops.migration_context):
+            migration.upgrade()
+        db.commit()
+
+    with pg_session_scope() as db:
+        rows = [(row.user_id, row.step_name, row.completed_at) for row in db.query(UserOnboardingProgress)]
+        assert sorted(rows) == sorted([
+            (user_ids[0], "first_story_created", started),
+            (user_ids[1], "first_story_created", started),
+            (user_ids[0], "account_created", started),
+        ])
+        with pytest.raises(IntegrityError):
+            db.add(UserOnboardingProgress(user_id=user_ids[0], step_name="account_created", completed_at=started))
+            db.flush()
@@ -0,0 +1,157 @@
+import asyncio
+import uuid
+
+import pytest
+from starlette.requests import Request
+
+from app.core.configs import settings
+from app.services.sse import DisconnectWatcher, SSEFrameCoalescer, SSEFrameEncoder
+from app.services.story_singleflight import StorySingleFlight
+from tests.conftest import make_story_request, run
+
+
+encoder = SSEFrameEncoder()
+
+
+def _coalescer(max_bytes=1000, max_delay=10.0):
+    return SSEFrameCoalescer(encoder, max_bytes=max_bytes, max_delay=max_delay)
+
+
+async def _events(*items):
+    """(event id, message) pairs; a number sleeps that long, an exception is raised"""
+    seq = 0
+    for item in items:
+        if isinstance(item, (int, float)):
+            await asyncio.sleep(item)
+        elif isinstance(item, Exception):
+            raise item
+        else:
+            message = {"type": "content", "data": item} if isinstance(item, str) else item
+            yield f"flight:{seq}", message
+            seq += 1
+
+
+async def _frames(coalescer, events, collected=None):
+    collected = [] if collected is None else collected
+    async for frame in coalescer.frames(events):
+        collected.append(frame)
+    return collected
+
+
+def test_size_threshold_flushes_a_frame():
+    frames = run(_frames(_coalescer(max_bytes=10), _events("abcd", "efgh", "ijkl", "mn")))
+
+    assert frames == [encoder.content("abcdefghijkl", "flight:2"), encoder.content("mn", "flight:3")]
+
+
+def test_time_threshold_flushes_a_frame():
+    frames = run(_frames(_coalescer(max_delay=0.02), _events("a", "b", 0.2, "c")))
+
+    assert frames == [encoder.content("ab", "flight:1"), encoder.content("c", "flight:2")]
+
+
+def test_other_messages_flush_pending_text_first():
+    completed = {"type": "completed", "story_id": "story"}
+
+    frames = run(_frames(_coalescer(), _events("Once", " upon", completed, " a time")))
+
+    assert frames == [
+        encoder.content("Once upon", "flight:1"),
+        encoder.message(completed, "flight:2"),
+        encoder.content(" a time", "flight:3"),
+    ]
+
+
+def test_coalesced_frame_carries_the_last_event_id():
+    frames = run(_frames(_coalescer(), _events(*"abcde")))
+
+    assert frames == [encoder.content("abcde", "flight:4")]
+    assert frames[0].startswith(b"id: flight:4\n")
+
+
+def test_partial_buffer_is_flushed_before_an_upstream_error():
+    frames = []
+
+    with pytest.raises(RuntimeError):
+        run(_frames(_coalescer(), _events("Once", " upon", RuntimeError("upstream failed")), frames))
+
+    assert frames == [encoder.content("Once upon", "flight:1")]
+
+
+class Client:
+    """ASGI receive channel of a streaming request; `disconnect()` closes the socket"""
+
+    def __init__(self):
+        self._closed = asyncio.Event()
+        self.request = Request({"type": "http"}, self._receive)
+
+    async def _receive(self):
+        await self._closed.wait()
+        return {"type": "http.disconnect"}
+
+    def disconnect(self):
+        self._closed.set()
+
+
+def test_disconnect_cancels_a_stalled_read():
+    read_cancelled = asyncio.Event()
+
+    async def stalled_frames():
+        yield b"first"
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            read_cancelled.set()
+            raise
+        yield b"never sent"
+
+    async def scenario():
+        client = Client()
+        frames = []
+        async with DisconnectWatcher(client.request) as watcher:
+            async for frame in watcher.guard(stalled_frames()):
+                frames.append(frame)
+                client.disconnect()
+        return frames, watcher
+
+    frames, watcher = run(asyncio.wait_for(scenario(), timeout=5))
+
+    assert frames == [b"first"]
+    assert watcher.disconnected.is_set() and watcher.disconnected_at is not None
+    assert read_cancelled.is_set()
+
+
+def test_disconnect_cancels_the_generation_once_the_grace_expires(monkeypatch):
+    monkeypatch.setattr(settings.story_streaming, "SINGLE_FLIGHT_ORPHAN_GRACE_SECONDS", 0.1)
+    single_flight = StorySingleFlight()
+    upstream_closed = asyncio.Event()
+
+    async def producer():
+        try:
+            yield {"type": "started"}
+            while True:
+                await asyncio.sleep(0.01)
+                yield {"type": "content", "data": "word "}
+        finally:
+            upstream_closed.set()
+
+    async def scenario():
+        client = Client()
+        events = single_flight.subscribe(make_story_request(), uuid.uuid4(), lambda generation_id: producer())
+        async with DisconnectWatcher(client.request) as watcher:
+            async for _ in watcher.guard(_coalescer(max_bytes=1).frames(events)):
+                client.disconnect()
+        flight = next(iter(single_flight._by_id.values()))
+        assert flight.subscribers == 0
+
+        # Still running during the grace, so a retry could attach
+        await asyncio.sleep(0.05)
+        assert not flight.task.done() and not upstream_closed.is_set()
+
+        await asyncio.wait([flight.task], timeout=1)
+        return flight
+
+    flight = run(asyncio.wait_for(scenario(), timeout=5))
+
+    assert flight.status == "cancelled"
+    assert upstream_closed.is_set()
@@ -0,0 +1,20 @@
+from app.services.story_fingerprint import canonical_story_request, hash_payload
+from tests.conftest import make_hero, make_story_request
+
+
+def test_heroes_with_and_without_optional_fields_sort():
+    # Same name, gender and age: ordering falls through to the optional fields
+    heroes = [make_hero(appearance=None, power="flight"), make_hero(appearance="red fur", power=None)]
+
+    payload = canonical_story_request(make_story_request(*heroes), hero_ids=False)
+
+    assert [hero[3] for hero in payload["heroes"]] == ["", "red fur"]
+
+
+def test_request_key_ignores_case_whitespace_and_hero_order():
+    fox, owl = make_hero(name="Fox"), make_hero(name="Owl", appearance="")
+    first = make_story_request(fox, owl, story_name="The  Lantern")
+    second = make_story_request(owl.model_copy(update={"appearance": None}), fox, story_name="the lantern ")
+
+    assert hash_payload(canonical_story_request(first)) == hash_payload(canonical_story_request(second))
+    assert canonical_story_request(first) != canonical_story_request(make_story_request(fox, story_name="The Lantern"))
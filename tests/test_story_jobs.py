@@ -0,0 +1,121 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.core.configs import settings
+from app.crud.story import story_crud
+from app.db.models.story import Story
+from app.services.llm_resilience import resilient_llm
+from app.services.story_singleflight import StorySingleFlight
+from tests.conftest import TrackingProvider, make_story_request, run
+
+
+class PausingProvider(TrackingProvider):
+    """Fake provider that stops after a few chunks until `resume` is set"""
+
+    def __init__(self, chunks_before_pause: int = 3):
+        super().__init__()
+        self.chunks_before_pause = chunks_before_pause
+        self.resume = asyncio.Event()
+
+    async def stream(self, messages, max_tokens, temperature, stats=None):
+        chunks = 0
+        async for chunk in super().stream(messages, max_tokens, temperature, stats):
+            if chunks == self.chunks_before_pause:
+                await self.resume.wait()
+            chunks += 1
+            yield chunk
+
+
+def _producer(session_scope, story_data, user_id):
+    def producer(generation_id):
+        return story_crud.generate_story_with_heroes_stream(session_scope, story_data, user_id, story_id=generation_id)
+
+    return producer
+
+
+async def _generate(single_flight, session_scope, story_data, user_id):
+    producer = _producer(session_scope, story_data, user_id)
+    return [message async for _, message in single_flight.subscribe(story_data, user_id, producer)]
+
+
+async def _leave_after_a_few_events(single_flight, session_scope, story_data, user_id, provider):
+    """Subscribe, close the stream after a few chunks, wait out the orphan grace, then let the provider go on"""
+    producer = _producer(session_scope, story_data, user_id)
+    events = single_flight.subscribe(story_data, user_id, producer)
+    seen = []
+    async for event_id, message in events:
+        seen.append((event_id, message))
+        if message["type"] == "content":
+            break
+    await events.aclose()
+
+    flight_id = uuid.UUID(seen[0][1]["job_id"] if story_data.detached else seen[0][0].rsplit(":", 1)[0])
+    flight = single_flight._by_id[flight_id]
+    assert flight.subscribers == 0
+    await asyncio.sleep(settings.story_streaming.SINGLE_FLIGHT_ORPHAN_GRACE_SECONDS * 4)
+    provider.resume.set()
+    await asyncio.wait([flight.task], timeout=5)
+    return flight
+
+
+@pytest.fixture
+def paused_provider(monkeypatch):
+    provider = PausingProvider()
+    monkeypatch.setattr(resilient_llm, "provider", provider)
+    monkeypatch.setattr(settings.story_streaming, "SINGLE_FLIGHT_ORPHAN_GRACE_SECONDS", 0.05)
+    return provider
+
+
+def test_detached_story_is_saved_under_its_job_id(session_scope, user_and_hero, llm_settings):
+    user_id, hero = user_and_hero
+    single_flight = StorySingleFlight()
+
+    messages = run(_generate(single_flight, session_scope, make_story_request(hero, detached=True), user_id))
+
+    job_id = messages[0]["job_id"]
+    assert messages[-1]["type"] == "completed"
+    assert messages[-1]["story_id"] == job_id
+
+
+def test_finished_job_is_found_in_the_database(session_scope, user_and_hero, llm_settings):
+    user_id, hero = user_and_hero
+    # Generated by another instance, or evicted from this one
+    messages = run(_generate(StorySingleFlight(), session_scope, make_story_request(hero, detached=True), user_id))
+    job_id = uuid.UUID(messages[0]["job_id"])
+
+    job = story_crud.get_saved_job(session_scope, job_id, user_id)
+
+    assert job.status == "completed"
+    assert job.story_id == job_id
+    assert job.content == "".join(message["data"] for message in messages if message["type"] == "content")
+    assert story_crud.get_saved_job(session_scope, job_id, uuid.uuid4()) is None
+    assert story_crud.get_saved_job(session_scope, uuid.uuid4(), user_id) is None
+
+
+def test_detached_generation_outlives_its_listener(session_scope, user_and_hero, llm_settings, paused_provider):
+    user_id, hero = user_and_hero
+    story_data = make_story_request(hero, detached=True)
+
+    flight = run(_leave_after_a_few_events(StorySingleFlight(), session_scope, story_data, user_id, paused_provider))
+
+    assert flight.status == "completed"
+    assert paused_provider.open == 0
+    with session_scope() as db:
+        story = db.get(Story, flight.id)
+        assert story is not None and story.content == flight.snapshot()["content"]
+
+
+def test_attached_generation_is_cancelled_without_listeners(
+    session_scope, user_and_hero, llm_settings, paused_provider
+):
+    user_id, hero = user_and_hero
+    story_data = make_story_request(hero)
+
+    flight = run(_leave_after_a_few_events(StorySingleFlight(), session_scope, story_data, user_id, paused_provider))
+
+    assert flight.status == "cancelled"
+    assert paused_provider.open == 0
+    with session_scope() as db:
+        assert db.query(Story).count() == 0
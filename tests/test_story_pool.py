@@ -0,0 +1,167 @@
+import uuid
+
+import pytest
+
+from app.core.configs import settings
+from app.crud import story as story_module
+from app.crud.story import story_crud
+from app.db.models.hero import Hero
+from app.db.models.story import Story
+from app.schemas.hero import HeroOut
+from app.services.llm_resilience import ResilientLLM, resilient_llm
+from app.services.prompt_templates import PromptTemplateEngine
+from app.services.story_generation import StoryGenerationService
+from app.services.story_pool import HERO_PLACEHOLDER, StoryPool
+from tests.conftest import TrackingProvider, make_hero, make_story_request, run
+
+
+class PlaceholderProvider(TrackingProvider):
+    """Fake provider whose stories keep the hero placeholder, like a model following the pool prompt"""
+
+    def __init__(self, keep_placeholder: bool = True):
+        super().__init__()
+        self.keep_placeholder = keep_placeholder
+        self.completions = 0
+
+    async def complete(self, messages, max_tokens, temperature, stats=None):
+        self.completions += 1
+        content = await super().complete(messages, max_tokens, temperature, stats)
+        return f"{HERO_PLACEHOLDER} woke up. {content}" if self.keep_placeholder else content
+
+
+HERO = make_hero(name="Mira", gender="girl", age=7)
+
+
+@pytest.fixture
+def pool_settings(monkeypatch):
+    """One pool combination, matching HERO"""
+    config = settings.story_pool
+    for name, value in {
+        "ENABLED": True,
+        "TARGET_SIZE": 2,
+        "LANGUAGES": ["en"],
+        "STYLES": ["Adventure"],
+        "LENGTHS": [3],
+        "HERO_GENDERS": ["girl"],
+        "HERO_AGE_BUCKETS": [PromptTemplateEngine.age_bucket(HERO.age)],
+    }.items():
+        monkeypatch.setattr(config, name, value)
+    return config
+
+
+def _pool(scheduler, provider):
+    return StoryPool(StoryGenerationService(llm=ResilientLLM(provider, scheduler)))
+
+
+def test_fill_tops_every_combination_up_to_the_target(pool_settings, scheduler, llm_settings):
+    provider = PlaceholderProvider()
+    pool = _pool(scheduler, provider)
+
+    run(pool._fill())
+    run(pool._fill())
+
+    assert provider.completions == 2
+    assert pool.stats()["available"] == 2
+    assert pool.counters["generated"] == 2
+
+
+def test_stories_without_the_placeholder_are_discarded(pool_settings, scheduler, llm_settings):
+    provider = PlaceholderProvider(keep_placeholder=False)
+    pool = _pool(scheduler, provider)
+
+    run(pool._fill())
+
+    # Gives up after a few in a row instead of spinning on the provider
+    assert provider.completions == StoryPool.MAX_FAILURES_IN_A_ROW
+    assert pool.counters["discarded"] == StoryPool.MAX_FAILURES_IN_A_ROW
+    assert pool.stats()["available"] == 0
+
+
+def test_each_pooled_story_is_served_once(pool_settings, scheduler, llm_settings):
+    pool = _pool(scheduler, PlaceholderProvider())
+    run(pool._fill())
+    story_data = make_story_request(HERO, story_length=3)
+
+    served = [pool.take(story_data) for _ in range(3)]
+
+    assert served[2] is None
+    assert all(story.content.startswith("Mira woke up.") for story in served[:2])
+    assert all(HERO_PLACEHOLDER not in story.content for story in served[:2])
+    assert (pool.counters["served"], pool.counters["empty"]) == (2, 1)
+    # Taking from the pool asks the filler to top it up
+    assert pool._refill_needed.is_set()
+
+
+def test_requests_outside_the_pool_are_not_matched(pool_settings, scheduler, llm_settings):
+    pool = _pool(scheduler, PlaceholderProvider())
+    run(pool._fill())
+
+    assert not pool.matches(make_story_request(HERO, story_length=5))
+    assert not pool.matches(make_story_request(HERO, HERO, story_length=3))
+    assert pool.take(make_story_request(make_hero(gender="boy", age=7), story_length=3)) is None
+    assert pool.stats()["available"] == 2
+
+
+@pytest.fixture
+def user_and_girl(session_scope, user_and_hero):
+    """Stored user with a hero matching the pool combination"""
+    user_id, _ = user_and_hero
+    with session_scope() as db:
+        hero = Hero(user_id=user_id, name=HERO.name, gender=HERO.gender, age=HERO.age)
+        db.add(hero)
+        db.commit()
+        return user_id, HeroOut.model_validate(hero)
+
+
+@pytest.fixture
+def live_provider(monkeypatch):
+    provider = TrackingProvider()
+    monkeypatch.setattr(resilient_llm, "provider", provider)
+    return provider
+
+
+def _generate(session_scope, user_id, story_data):
+    async def generate():
+        return [
+            message async for message in
+            story_crud.generate_story_with_heroes_stream(session_scope, story_data, user_id)
+        ]
+
+    messages = run(generate())
+    assert messages[-1]["type"] == "completed"
+    with session_scope() as db:
+        return db.get(Story, uuid.UUID(messages[-1]["story_id"])).content
+
+
+def test_first_story_comes_from_the_pool_then_live(
+    session_scope, user_and_girl, pool_settings, scheduler, llm_settings, live_provider, monkeypatch
+):
+    user_id, hero = user_and_girl
+    pool = _pool(scheduler, PlaceholderProvider())
+    run(pool._fill())
+    monkeypatch.setattr(story_module, "story_pool", pool)
+    story_data = make_story_request(hero, story_length=3)
+
+    first = _generate(session_scope, user_id, story_data)
+    assert first.startswith("Mira woke up.")
+    assert live_provider.started == 0
+
+    # Only the first story: the second one is generated live although the pool has another
+    second = _generate(session_scope, user_id, story_data)
+    assert not second.startswith("Mira woke up.")
+    assert live_provider.started == 1
+    assert pool.stats()["available"] == 1
+
+
+def test_empty_pool_falls_back_to_live_generation(
+    session_scope, user_and_girl, pool_settings, scheduler, llm_settings, live_provider, monkeypatch
+):
+    user_id, hero = user_and_girl
+    pool = _pool(scheduler, PlaceholderProvider())
+    monkeypatch.setattr(story_module, "story_pool", pool)
+
+    content = _generate(session_scope, user_id, make_story_request(hero, story_length=3))
+
+    assert content
+    assert live_provider.started == 1
+    assert pool.counters["empty"] == 1
@@ -0,0 +1,147 @@
+import asyncio
+import uuid
+
+from app.services.story_singleflight import StorySingleFlight
+from tests.conftest import make_story_request, run
+
+
+class Producer:
+    """Story generation stand-in that publishes one chunk each time it is let through"""
+
+    def __init__(self, chunks: int):
+        self.chunks = chunks
+        self.started = 0
+        self.generation_ids = []
+        self.step = asyncio.Semaphore(0)
+
+    def __call__(self, generation_id):
+        self.started += 1
+        self.generation_ids.append(generation_id)
+        return self._generate()
+
+    async def _generate(self):
+        yield {"type": "started"}
+        for n in range(self.chunks):
+            await self.step.acquire()
+            yield {"type": "content", "data": f"chunk {n}. "}
+        yield {"type": "completed", "story_id": "story"}
+
+
+async def _collect(events, limit=None):
+    collected = []
+    async for event in events:
+        collected.append(event)
+        if len(collected) == limit:
+            break
+    await events.aclose()
+    return collected
+
+
+def _release(producer, count):
+    for _ in range(count):
+        producer.step.release()
+
+
+def test_identical_requests_share_one_generation():
+    single_flight = StorySingleFlight()
+    producer = Producer(chunks=3)
+    user_id = uuid.uuid4()
+    story_data = make_story_request()
+
+    async def scenario():
+        first = asyncio.create_task(_collect(single_flight.subscribe(story_data, user_id, producer)))
+        await asyncio.sleep(0.01)
+        # A client retry with the same request, differing only in case and whitespace
+        retry = story_data.model_copy(update={"story_name": "  the LANTERN "})
+        second = asyncio.create_task(_collect(single_flight.subscribe(retry, user_id, producer)))
+        await asyncio.sleep(0.01)
+        assert single_flight.active_count() == 1
+        _release(producer, 3)
+        return await first, await second
+
+    first, second = run(scenario())
+
+    assert producer.started == 1
+    assert first == second
+    assert [message["type"] for _, message in first] == ["started", "content", "content", "content", "completed"]
+
+
+def test_other_users_and_requests_are_not_coalesced():
+    single_flight = StorySingleFlight()
+    producer = Producer(chunks=1)
+    story_data = make_story_request()
+
+    async def scenario():
+        other_idea = story_data.model_copy(update={"story_idea": "Another idea"})
+        requests = [story_data, story_data, other_idea]
+        tasks = [
+            asyncio.create_task(_collect(single_flight.subscribe(request, uuid.uuid4(), producer)))
+            for request in requests
+        ]
+        await asyncio.sleep(0.01)
+        _release(producer, 3)
+        await asyncio.gather(*tasks)
+
+    run(scenario())
+    assert producer.started == 3
+
+
+def test_reconnect_resumes_after_last_event_id():
+    single_flight = StorySingleFlight()
+    producer = Producer(chunks=3)
+    user_id = uuid.uuid4()
+    story_data = make_story_request()
+
+    async def scenario():
+        _release(producer, 1)
+        # The connection drops after the first chunk
+        seen = await _collect(single_flight.subscribe(story_data, user_id, producer), limit=2)
+        last_event_id = seen[-1][0]
+        resumed = asyncio.create_task(
+            _collect(single_flight.subscribe(story_data, user_id, producer, last_event_id=last_event_id))
+        )
+        await asyncio.sleep(0.01)
+        _release(producer, 2)
+        return seen, await resumed
+
+    seen, resumed = run(scenario())
+
+    assert producer.started == 1
+    assert [message["data"] for _, message in seen[1:]] == ["chunk 0. "]
+    assert [message.get("data") for _, message in resumed] == ["chunk 1. ", "chunk 2. ", None]
+    # Event ids continue where the first connection stopped
+    assert [event_id.rsplit(":", 1)[1] for event_id, _ in seen + resumed] == ["0", "1", "2", "3", "4"]
+
+
+def test_finished_generation_is_replayed_from_last_event_id():
+    single_flight = StorySingleFlight()
+    producer = Producer(chunks=2)
+    user_id = uuid.uuid4()
+    story_data = make_story_request()
+
+    async def scenario():
+        _release(producer, 2)
+        events = await _collect(single_flight.subscribe(story_data, user_id, producer))
+        resumed = await _collect(single_flight.subscribe(story_data, user_id, producer, last_event_id=events[1][0]))
+        return events, resumed
+
+    events, resumed = run(scenario())
+
+    assert producer.started == 1
+    assert resumed == events[2:]
+
+
+def test_last_event_id_of_another_user_starts_over():
+    single_flight = StorySingleFlight()
+    producer = Producer(chunks=1)
+    story_data = make_story_request()
+
+    async def scenario():
+        _release(producer, 2)
+        events = await _collect(single_flight.subscribe(story_data, uuid.uuid4(), producer))
+        return await _collect(single_flight.subscribe(story_data, uuid.uuid4(), producer, last_event_id=events[0][0]))
+
+    events = run(scenario())
+
+    assert producer.started == 2
+    assert events[0][1]["type"] == "started"
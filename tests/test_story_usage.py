@@ -0,0 +1,111 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app.crud.story import story_crud
+from app.db.models.story import Story
+from app.db.models.user import User
+from app.services.llm_providers import GenerationStats
+from tests.conftest import make_story_request, run
+
+
+def _stats(prompt_tokens, completion_tokens, cached_tokens=0, ttft_ms=100, generation_ms=1000):
+    stats = GenerationStats()
+    stats.model = "fake"
+    stats.set_usage(prompt_tokens, completion_tokens, cached_tokens)
+    stats.ttft_ms = ttft_ms
+    stats.generation_ms = generation_ms
+    return stats
+
+
+def _usage(story):
+    columns = ("model", "prompt_tokens", "completion_tokens", "cached_tokens", "ttft_ms", "generation_ms")
+    return tuple(getattr(story, column) for column in columns)
+
+
+def test_saved_story_keeps_its_usage(session_scope, user_and_hero):
+    user_id, hero = user_and_hero
+    story_data = make_story_request(hero)
+
+    with_usage = story_crud.save_generated_story(session_scope, story_data, "Once.", user_id, _stats(420, 380, 256))
+    without_usage = story_crud.save_generated_story(session_scope, story_data, "Once.", user_id)
+
+    with session_scope() as db:
+        assert _usage(db.get(Story, with_usage)) == ("fake", 420, 380, 256, 100, 1000)
+        assert _usage(db.get(Story, without_usage)) == (None,) * 6
+
+
+def test_streamed_story_records_its_usage(session_scope, user_and_hero, llm_settings):
+    user_id, hero = user_and_hero
+
+    async def generate():
+        return [message async for message in story_crud.generate_story_with_heroes_stream(
+            session_scope, make_story_request(hero), user_id
+        )]
+
+    messages = run(generate())
+
+    with session_scope() as db:
+        story = db.get(Story, uuid.UUID(messages[-1]["story_id"]))
+        assert story.model == "fake"
+        assert story.prompt_tokens > 0 and story.completion_tokens > 0
+        assert story.ttft_ms is not None and story.generation_ms is not None
+
+
+def test_usage_for_admin_groups_by_day_language_and_length(pg_session_scope):
+    today = datetime.now(timezone.utc).replace(tzinfo=None)
+    yesterday = today - timedelta(days=1)
+    with pg_session_scope() as db:
+        user = User(apple_id="apple-1")
+        db.add(user)
+        db.flush()
+
+        def story(created_at, language="en", story_length=3, stats=None, **fields):
+            db.add(Story(
+                user_id=user.id, title="The Lantern", content="Once.", story_style="Adventure", story_idea="A fox",
+                language=language, story_length=story_length, created_at=created_at,
+                **story_crud.usage_columns(stats), **fields
+            ))
+
+        story(today, stats=_stats(400, 300, 0, ttft_ms=100, generation_ms=1000))
+        story(today, stats=_stats(600, 500, 256, ttft_ms=200, generation_ms=3000), is_deleted=True)
+        # Saved before usage accounting
+        story(today)
+        story(today, language="ru", story_length=5, stats=_stats(900, 1200))
+        story(yesterday, stats=_stats(100, 100))
+        # Outside the window
+        story(today - timedelta(days=10), stats=_stats(100, 100))
+        db.commit()
+
+    with pg_session_scope() as db:
+        result = story_crud.get_usage_for_admin(db, days=7)
+
+    assert result["success"] is True
+    usage = result["data"]["usage"]
+    assert [(row["day"], row["language"], row["story_length"]) for row in usage] == [
+        (today.date().isoformat(), "en", 3),
+        (today.date().isoformat(), "ru", 5),
+        (yesterday.date().isoformat(), "en", 3),
+    ]
+    assert usage[0] == {
+        "day": today.date().isoformat(),
+        "language": "en",
+        "story_length": 3,
+        "stories": 3,
+        "stories_with_usage": 2,
+        "prompt_tokens": 1000,
+        "completion_tokens": 800,
+        "cached_tokens": 256,
+        "avg_completion_tokens": 400.0,
+        "avg_ttft_ms": 150.0,
+        "avg_generation_ms": 2000.0,
+    }
+    assert (usage[1]["stories"], usage[1]["completion_tokens"]) == (1, 1200)
+
+
+def test_usage_for_admin_reports_query_errors(session_scope):
+    # SQLite has no date_trunc: the failure is reported, not raised
+    with session_scope() as db:
+        result = story_crud.get_usage_for_admin(db, days=7)
+
+    assert result["success"] is False
+    assert result["status_code"] == 500
@@ -0,0 +1,60 @@
+import uuid
+
+import pytest
+
+from app.crud.story import story_crud
+from app.services.llm_providers import GenerationStats
+from app.services.story_variants import PendingVariants, StoryVariantStore
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = StoryVariantStore(max_entries=10, ttl_seconds=60)
+    monkeypatch.setattr("app.crud.story.story_variant_store", store)
+    return store
+
+
+def _pending(user_id):
+    return PendingVariants(user_id, story_data=None, contents=["First.", "", "Third."], stats=GenerationStats())
+
+
+def test_take_hands_out_a_selection_once(store):
+    user_id = uuid.uuid4()
+    selection_id = store.put(_pending(user_id))
+
+    assert store.take(selection_id, uuid.uuid4(), 0) is None
+    assert store.take(selection_id, user_id, 1) is None  # empty variant
+    assert store.take(selection_id, user_id, 3) is None
+    assert store.take(selection_id, user_id, 2) is not None
+    assert store.take(selection_id, user_id, 2) is None
+
+
+def test_choose_saves_the_variant_once(store, monkeypatch):
+    user_id = uuid.uuid4()
+    selection_id = store.put(_pending(user_id))
+    saved = []
+
+    def save(session_scope, story_data, content, user_id, stats):
+        saved.append(content)
+        return uuid.uuid4()
+
+    monkeypatch.setattr(story_crud, "save_generated_story", save)
+
+    assert story_crud.choose_story_variant(None, selection_id, 2, user_id) is not None
+    assert story_crud.choose_story_variant(None, selection_id, 0, user_id) is None
+    assert saved == ["Third."]
+
+
+def test_failed_save_puts_the_selection_back(store, monkeypatch):
+    user_id = uuid.uuid4()
+    selection_id = store.put(_pending(user_id))
+
+    def unavailable(*args):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(story_crud, "save_generated_story", unavailable)
+    with pytest.raises(ConnectionError):
+        story_crud.choose_story_variant(None, selection_id, 0, user_id)
+
+    assert store.take(selection_id, user_id, 0) is not None
+    assert store.counters["restored"] == 1
@@ -0,0 +1,55 @@
+from app.core.consts import OnboardingStep
+from app.crud.user import user_crud
+from app.db.models.user import User
+from app.db.models.user_onboarding import UserOnboardingProgress
+
+
+def _stored(session_scope, user_id):
+    with session_scope() as db:
+        user = db.get(User, user_id)
+        steps = [step.step_name for step in db.query(UserOnboardingProgress).filter_by(user_id=user_id)]
+        return (user.apple_id, user.email, user.is_active, user.created_at), steps
+
+
+def test_upsert_apple_user_returns_the_same_user_on_repeat_sign_in(pg_session_scope):
+    with pg_session_scope() as db:
+        created = user_crud.upsert_apple_user(db, "apple-1", email="fox@example.com")
+    first_state = _stored(pg_session_scope, created.id)
+
+    # Apple only sends the email on the first sign-in
+    with pg_session_scope() as db:
+        again = user_crud.upsert_apple_user(db, "apple-1")
+
+    assert again.id == created.id
+    assert (again.apple_id, again.email, again.is_active) == ("apple-1", "fox@example.com", True)
+    assert _stored(pg_session_scope, created.id) == first_state
+    assert first_state[1] == [OnboardingStep.ACCOUNT_CREATED.value]
+
+
+def test_upsert_apple_user_refreshes_a_new_email_only(pg_session_scope):
+    with pg_session_scope() as db:
+        created = user_crud.upsert_apple_user(db, "apple-1", email="fox@example.com")
+    (_, _, _, created_at), _ = _stored(pg_session_scope, created.id)
+
+    with pg_session_scope() as db:
+        updated = user_crud.upsert_apple_user(db, "apple-1", email="owl@example.com")
+
+    assert updated.id == created.id
+    assert _stored(pg_session_scope, created.id) == (
+        ("apple-1", "owl@example.com", True, created_at), [OnboardingStep.ACCOUNT_CREATED.value]
+    )
+
+
+def test_upsert_apple_user_ignores_deactivated_accounts(pg_session_scope):
+    with pg_session_scope() as db:
+        created = user_crud.upsert_apple_user(db, "apple-1")
+    with pg_session_scope() as db:
+        user_crud.deactivate(db, created.id)
+
+    with pg_session_scope() as db:
+        assert user_crud.upsert_apple_user(db, "apple-1", email="fox@example.com") is None
+
+    (_, email, is_active, _), _ = _stored(pg_session_scope, created.id)
+    assert (email, is_active) == (None, False)
+    with pg_session_scope() as db:
+        assert db.query(User).count() == 1
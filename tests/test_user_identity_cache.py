@@ -0,0 +1,67 @@
+import pytest
+from cachetools import TTLCache
+from fastapi import HTTPException
+
+from app.crud.user import user_crud
+from app.services import authentication
+from app.services.authentication import get_current_user
+from app.services.user_identity_cache import user_identity_cache
+from tests.conftest import run
+
+
+@pytest.fixture
+def identity_cache(monkeypatch, session_scope):
+    """The shared identity cache, enabled and empty, in front of the test database"""
+    monkeypatch.setattr(authentication, "db_session_scope", session_scope)
+    monkeypatch.setattr(user_identity_cache, "enabled", True)
+    monkeypatch.setattr(user_identity_cache, "_users", TTLCache(maxsize=100, ttl=300))
+    monkeypatch.setattr(user_identity_cache, "counters", {"hits": 0, "misses": 0, "invalidations": 0})
+    return user_identity_cache
+
+
+def _resolve_twice(user_id):
+    """get_current_user for two requests: a DB lookup, then a cache hit"""
+    first = run(get_current_user(user_id))
+    second = run(get_current_user(user_id))
+    assert second is first
+    return first
+
+
+def _assert_rejected(user_id):
+    with pytest.raises(HTTPException) as rejected:
+        run(get_current_user(user_id))
+    assert rejected.value.status_code == 401
+
+
+def test_deleted_user_is_rejected_right_away(session_scope, user_and_hero, identity_cache):
+    user_id, _ = user_and_hero
+    _resolve_twice(user_id)
+    assert identity_cache.counters == {"hits": 1, "misses": 1, "invalidations": 0}
+
+    with session_scope() as db:
+        assert user_crud.delete_user_permanently(db, user_id) is True
+
+    _assert_rejected(user_id)
+    assert identity_cache.counters["invalidations"] == 1
+
+
+def test_deactivated_user_is_rejected_right_away(session_scope, user_and_hero, identity_cache):
+    user_id, _ = user_and_hero
+    _resolve_twice(user_id)
+
+    with session_scope() as db:
+        assert user_crud.deactivate(db, user_id) is True
+
+    _assert_rejected(user_id)
+    assert identity_cache.stats()["size"] == 0
+
+
+def test_updated_user_is_loaded_again(session_scope, user_and_hero, identity_cache):
+    user_id, _ = user_and_hero
+    assert _resolve_twice(user_id).email is None
+
+    with session_scope() as db:
+        user_crud.update_user_email(db, user_id, "fox@example.com")
+
+    assert run(get_current_user(user_id)).email == "fox@example.com"
+    assert identity_cache.counters == {"hits": 1, "misses": 2, "invalidations": 1}